@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+UNLOADED = 'unloaded'
+LOADING = 'loading'
+READY = 'ready'
+UNLOADING = 'unloading'
+
+
+def directory_bytes(path):
+    """Total size of the files under `path`, a stand-in for the memory a model takes once loaded."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class TritonRepository:
+    """Model repository API of a Triton server over HTTP, safe to call from several threads."""
+
+    def __init__(self, model_endpoint, timeout=600):
+        self.model_endpoint = model_endpoint
+        self.timeout = timeout
+
+    def index(self):
+        return self._post('/v2/repository/index')
+
+    def load(self, name):
+        self._post(f'/v2/repository/models/{name}/load')
+
+    def unload(self, name):
+        self._post(f'/v2/repository/models/{name}/unload')
+
+    def _post(self, path):
+        request = urllib.request.Request(f'http://{self.model_endpoint}{path}', data=b'', method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"{path} failed with status {e.code}: {e.read().decode('utf-8', errors='ignore')}")
+        except OSError as e:
+            raise RuntimeError(f"{path} failed: {e}")
+        return json.loads(body) if body else None
+
+
+class ModelEntry:
+    def __init__(self, name, size_bytes):
+        self.name = name
+        self.size_bytes = size_bytes
+        self.state = UNLOADED
+        self.in_flight = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.unloads = 0
+        self.load_seconds = []
+
+
+class ModelManager:
+    """Loads Triton models on demand and unloads them when idle or evicted.
+
+    Triton must run with `--model-control-mode=explicit`. A request for a
+    model that is not loaded loads it first; concurrent requests for the
+    same model wait for that single load. Loaded models are kept under
+    `memory_budget_bytes`: to make room, the least recently used models
+    without requests in flight are unloaded, and a load waits while every
+    candidate is busy. Models idle for `idle_timeout` seconds are unloaded
+    in the background.
+
+    Parameters
+    ----------
+    repository : TritonRepository
+      Model repository API of the Triton server
+    memory_budget_bytes : int
+      Maximum total size of the loaded models
+    idle_timeout : float
+      Seconds without requests after which a model is unloaded, never when 0
+    model_sizes : dict
+      Size in bytes of every model
+    default_size_bytes : int
+      Size of models missing from `model_sizes`
+    """
+
+    def __init__(self, repository, memory_budget_bytes, idle_timeout, model_sizes=None, default_size_bytes=0):
+        self.repository = repository
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_timeout = idle_timeout
+        self.model_sizes = model_sizes or {}
+        self.default_size_bytes = default_size_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.evictions = 0
+        self.condition = threading.Condition()
+        self.reaper = None
+        self.stopped = threading.Event()
+
+        # models Triton already loaded at startup count against the budget
+        for model in self.repository.index():
+            if model.get('state') == 'READY':
+                entry = self._entry(model['name'])
+                entry.state = READY
+                entry.last_used = time.monotonic()
+                self.used_bytes += entry.size_bytes
+
+    def start(self):
+        if self.idle_timeout > 0:
+            self.reaper = threading.Thread(target=self._reap, daemon=True)
+            self.reaper.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.reaper is not None:
+            self.reaper.join()
+
+    @contextmanager
+    def acquire(self, name):
+        """Keep model `name` loaded while the block runs, loading it first if needed."""
+        self._load(name)
+        try:
+            yield
+        finally:
+            with self.condition:
+                entry = self.entries[name]
+                entry.in_flight -= 1
+                entry.last_used = time.monotonic()
+                self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            models = {}
+            for entry in self.entries.values():
+                models[entry.name] = {
+                    'state': entry.state,
+                    'size_bytes': entry.size_bytes,
+                    'in_flight': entry.in_flight,
+                    'loads': entry.loads,
+                    'unloads': entry.unloads,
+                    'load_seconds_last': entry.load_seconds[-1] if entry.load_seconds else None,
+                    'load_seconds_mean': sum(entry.load_seconds) / len(entry.load_seconds) if entry.load_seconds else None,
+                }
+            return {
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'used_bytes': self.used_bytes,
+                'evictions': self.evictions,
+                'models': models,
+            }
+
+    def _entry(self, name):
+        if name not in self.entries:
+            self.entries[name] = ModelEntry(name, self.model_sizes.get(name, self.default_size_bytes))
+        return self.entries[name]
+
+    def _load(self, name):
+        with self.condition:
+            entry = self._entry(name)
+            while True:
+                if entry.state == READY:
+                    entry.in_flight += 1
+                    entry.last_used = time.monotonic()
+                    self.entries.move_to_end(name)
+                    return
+                if entry.state == UNLOADED:
+                    victims = self._make_room(entry)
+                    if victims is not None:
+                        break
+                self.condition.wait()
+            entry.state = LOADING
+            self.used_bytes += entry.size_bytes
+            for victim in victims:
+                victim.state = UNLOADING
+            self.evictions += len(victims)
+
+        for victim in victims:
+            logger.info(f"evict model {victim.name} to make room for {name}")
+            self._unload(victim)
+
+        start_time = time.perf_counter()
+        try:
+            self.repository.load(name)
+        except Exception:
+            with self.condition:
+                entry.state = UNLOADED
+                self.used_bytes -= entry.size_bytes
+                self.condition.notify_all()
+            raise
+        load_seconds = time.perf_counter() - start_time
+        logger.info(f"loaded model {name} in {load_seconds:.2f}s")
+
+        with self.condition:
+            entry.state = READY
+            entry.loads += 1
+            entry.load_seconds.append(load_seconds)
+            entry.in_flight += 1
+            entry.last_used = time.monotonic()
+            self.entries.move_to_end(name)
+            self.condition.notify_all()
+
+    def _make_room(self, entry):
+        # Least recently used idle models to unload so that `entry` fits,
+        # None when it has to wait for busy models to become idle.
+        if entry.size_bytes > self.memory_budget_bytes:
+            raise ValueError(f"model {entry.name} of {entry.size_bytes} bytes exceeds the memory budget")
+        victims, free_bytes = [], self.memory_budget_bytes - self.used_bytes
+        for candidate in self.entries.values():
+            if free_bytes >= entry.size_bytes:
+                break
+            if candidate.state == READY and candidate.in_flight == 0:
+                victims.append(candidate)
+                free_bytes += candidate.size_bytes
+        return victims if free_bytes >= entry.size_bytes else None
+
+    def _unload(self, entry):
+        try:
+            self.repository.unload(entry.name)
+        except Exception as e:
+            logger.warning(f"failed to unload model {entry.name}: {e}")
+        with self.condition:
+            entry.state = UNLOADED
+            entry.unloads += 1
+            self.used_bytes -= entry.size_bytes
+            self.condition.notify_all()
+
+    def _reap(self):
+        interval = min(max(self.idle_timeout / 4, 1.0), 30.0)
+        while not self.stopped.wait(interval):
+            now = time.monotonic()
+            with self.condition:
+                idle = [
+                    entry for entry in self.entries.values()
+                    if entry.state == READY and entry.in_flight == 0 and now - entry.last_used >= self.idle_timeout
+                ]
+                for entry in idle:
+                    entry.state = UNLOADING
+            for entry in idle:
+                logger.info(f"unload model {entry.name} after {now - entry.last_used:.0f}s idle")
+                self._unload(entry)
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import logging
+import re
+import urllib.error
+import urllib.request
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from model_manager import ModelManager, TritonRepository, directory_bytes
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# only inference requests load their model and count as its use, so that
+# readiness probes and config or metadata reads leave idle models unloaded
+INFER_PATH = re.compile(r'^/v2/models/([^/]+)(/versions/[^/]+)?/(infer|generate|generate_stream)$')
+LOAD_PATH = re.compile(r'^/v2/lifecycle/models/([^/]+)/load$')
+FORWARDED_HEADERS = ['Content-Type', 'Content-Encoding', 'Accept-Encoding', 'Inference-Header-Content-Length']
+
+
+def create_handler(manager, model_endpoint, timeout):
+    class Handler(BaseHTTPRequestHandler):
+        # Forwards the HTTP/REST requests of Triton, loading the model of an
+        # inference request first and keeping it loaded until the response
+        # is back. Other requests are passed through as they are.
+
+        def do_GET(self):
+            if self.path == '/v2/lifecycle/stats':
+                self._reply(200, {'Content-Type': 'application/json'}, json.dumps(manager.stats()).encode('utf-8'))
+            else:
+                self._forward()
+
+        def do_POST(self):
+            match = LOAD_PATH.match(self.path)
+            if match is not None:
+                self._load(match.group(1))
+            else:
+                self._forward(INFER_PATH.match(self.path))
+
+        def _load(self, name):
+            # loads a model ahead of its requests, e.g. for clients reading its config first
+            try:
+                with manager.acquire(name):
+                    response = 200, {}, b''
+            except (ValueError, RuntimeError, OSError) as e:
+                response = self._error(e)
+            self._reply(*response)
+
+        def _forward(self, match=None):
+            body = None
+            if 'Content-Length' in self.headers:
+                body = self.rfile.read(int(self.headers['Content-Length']))
+            try:
+                if match is None:
+                    response = self._send(body)
+                else:
+                    with manager.acquire(match.group(1)):
+                        response = self._send(body)
+            except (ValueError, RuntimeError, OSError) as e:
+                # the model does not fit, or Triton is down or timed out
+                response = self._error(e)
+            self._reply(*response)
+
+        def _error(self, e):
+            return 503, {'Content-Type': 'application/json'}, json.dumps({'error': str(e)}).encode('utf-8')
+
+        def _send(self, body):
+            headers = {k: self.headers[k] for k in FORWARDED_HEADERS if k in self.headers}
+            request = urllib.request.Request(f'http://{model_endpoint}{self.path}', data=body, headers=headers,
+                                             method=self.command)
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    return response.status, response.headers, response.read()
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers, e.read()
+
+        def _reply(self, status, headers, body):
+            self.send_response(status)
+            for k in FORWARDED_HEADERS:
+                if k in headers:
+                    self.send_header(k, headers[k])
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_endpoint', type=str, default='localhost:8000', help='http endpoint of triton')
+    parser.add_argument('--model_repository', type=str, default=None, help='model repository to size models from')
+    parser.add_argument('--model_sizes_file', type=str, default=None, help='json file of model name to size in bytes')
+    parser.add_argument('--memory_budget_bytes', type=int, required=True, help='maximum total size of the loaded models')
+    parser.add_argument('--idle_timeout', type=float, default=900, help='idle seconds before a model is unloaded')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--timeout', type=float, default=600, help='timeout of forwarded requests')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    # Models are sized by the files of their directory unless sizes are
+    # given, since their weights take about as much memory once loaded.
+    model_sizes = {}
+    if args.model_repository:
+        for name in os.listdir(args.model_repository):
+            path = os.path.join(args.model_repository, name)
+            if os.path.isdir(path):
+                model_sizes[name] = directory_bytes(path)
+    if args.model_sizes_file:
+        with open(args.model_sizes_file, "r", encoding="utf-8") as in_file:
+            model_sizes.update(json.load(in_file))
+    logger.info(f"model sizes: {model_sizes}")
+
+    repository = TritonRepository(args.model_endpoint, args.timeout)
+    manager = ModelManager(repository, args.memory_budget_bytes, args.idle_timeout, model_sizes)
+    manager.start()
+    server = ThreadingHTTPServer(('', args.port), create_handler(manager, args.model_endpoint, args.timeout))
+    logger.info(f"serve on port {args.port}, forwarding to {args.model_endpoint}")
+    try:
+        server.serve_forever()
+    finally:
+        manager.stop()
+
+
+if __name__ == "__main__":
+    main()
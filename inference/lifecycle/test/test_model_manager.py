@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+from model_manager import LOADING, READY, UNLOADED, ModelManager
+
+SIZES = {'a': 4, 'b': 4, 'c': 4, 'large': 8}
+
+
+class Repository:
+    """Model repository API of a Triton server, recording the loads and unloads it is asked for."""
+
+    def __init__(self, ready=(), failing=()):
+        self.ready = list(ready)
+        self.failing = set(failing)
+        self.calls = []
+        self.loading = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def index(self):
+        return [{'name': name, 'state': 'READY'} for name in self.ready]
+
+    def load(self, name):
+        self.calls.append(('load', name))
+        self.loading.set()
+        self.release.wait()
+        if name in self.failing:
+            raise RuntimeError(f"failed to load {name}")
+
+    def unload(self, name):
+        self.calls.append(('unload', name))
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("input, expected", [
+    # the least recently used model is evicted
+    (['a', 'b', 'c'], [('load', 'a'), ('load', 'b'), ('unload', 'a'), ('load', 'c')]),
+    (['a', 'b', 'a', 'c'], [('load', 'a'), ('load', 'b'), ('unload', 'b'), ('load', 'c')]),
+    # as many as needed to fit
+    (['a', 'b', 'large'], [('load', 'a'), ('load', 'b'), ('unload', 'a'), ('unload', 'b'), ('load', 'large')]),
+    (['a', 'a', 'a'], [('load', 'a')]),
+])
+def test_eviction_order(input, expected):
+    repository = Repository()
+    manager = ModelManager(repository, 8, 0, SIZES)
+    for name in input:
+        with manager.acquire(name):
+            pass
+    assert repository.calls == expected
+    assert manager.used_bytes <= 8
+    assert manager.evictions == sum(call == 'unload' for call, _ in expected)
+
+
+def test_models_loaded_at_startup():
+    repository = Repository(ready=['a', 'b'])
+    manager = ModelManager(repository, 8, 0, SIZES)
+    assert manager.used_bytes == 8
+    with manager.acquire('c'):
+        pass
+    assert repository.calls == [('unload', 'a'), ('load', 'c')]
+
+
+def test_model_over_budget():
+    manager = ModelManager(Repository(), 8, 0, {'huge': 16})
+    with pytest.raises(ValueError, match='exceeds the memory budget'):
+        with manager.acquire('huge'):
+            pass
+    assert manager.used_bytes == 0
+
+
+def test_wait_for_busy_victim():
+    repository = Repository()
+    manager = ModelManager(repository, 4, 0, SIZES)
+    loaded = threading.Event()
+
+    def use_b():
+        with manager.acquire('b'):
+            loaded.set()
+
+    with manager.acquire('a'):
+        thread = threading.Thread(target=use_b)
+        thread.start()
+        # `a` has a request in flight, so `b` waits rather than evicting it
+        assert not loaded.wait(0.2)
+        assert repository.calls == [('load', 'a')]
+    thread.join(5.0)
+    assert loaded.is_set()
+    assert repository.calls == [('load', 'a'), ('unload', 'a'), ('load', 'b')]
+
+
+def test_concurrent_requests_share_one_load():
+    repository = Repository()
+    repository.release.clear()
+    manager = ModelManager(repository, 8, 0, SIZES)
+    # the requests stay in flight until the end of the test
+    acquired = [manager.acquire('a') for _ in range(4)]
+    threads = [threading.Thread(target=context.__enter__) for context in acquired]
+    for thread in threads:
+        thread.start()
+    assert repository.loading.wait(5.0)
+    assert manager.entries['a'].state == LOADING
+    repository.release.set()
+    for thread in threads:
+        thread.join(5.0)
+    assert repository.calls == [('load', 'a')]
+    assert manager.entries['a'].in_flight == 4
+    for context in acquired:
+        context.__exit__(None, None, None)
+    assert manager.entries['a'].in_flight == 0
+
+
+def test_failed_load_rollback():
+    repository = Repository(failing=['a'])
+    manager = ModelManager(repository, 4, 0, SIZES)
+    with pytest.raises(RuntimeError, match='failed to load a'):
+        with manager.acquire('a'):
+            pass
+    entry = manager.entries['a']
+    assert (entry.state, entry.in_flight, entry.loads, manager.used_bytes) == (UNLOADED, 0, 0, 0)
+
+    # the budget it took is free for other models
+    with manager.acquire('b'):
+        assert manager.entries['b'].state == READY
+    assert manager.used_bytes == 4
+
+
+def test_reaper_unloads_idle_models():
+    repository = Repository()
+    manager = ModelManager(repository, 8, 0.05, SIZES)
+    with manager.acquire('a'):
+        pass
+    with manager.acquire('b'):
+        manager.start()
+        try:
+            wait_for(lambda: manager.entries['a'].state == UNLOADED)
+            # a model with a request in flight is never idle
+            assert manager.entries['b'].state == READY
+        finally:
+            manager.stop()
+    assert repository.calls == [('load', 'a'), ('load', 'b'), ('unload', 'a')]
+    assert manager.used_bytes == 4
+    assert manager.entries['a'].unloads == 1
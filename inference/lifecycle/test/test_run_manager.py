@@ -0,0 +1,99 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from model_manager import ModelManager, TritonRepository
+from run_manager import create_handler
+from .test_model_manager import Repository
+
+
+class Triton(BaseHTTPRequestHandler):
+    """Answers every request with its method and path."""
+
+    def do_GET(self):
+        self._reply()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply()
+
+    def _reply(self):
+        body = json.dumps({'method': self.command, 'path': self.path}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(('localhost', 0), handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def triton():
+    server = serve(Triton)
+    yield f'localhost:{server.server_address[1]}'
+    server.shutdown()
+
+
+def request(server, method, path):
+    url = f'http://localhost:{server.server_address[1]}{path}'
+    data = b'{}' if method == 'POST' else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, method=method), timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ('GET', '/v2/models/a/ready', []),
+    ('GET', '/v2/models/a/config', []),
+    ('GET', '/v2/models/a/versions/1', []),
+    ('POST', '/v2/models/a/infer', [('load', 'a')]),
+    ('POST', '/v2/models/a/versions/1/infer', [('load', 'a')]),
+    ('POST', '/v2/models/a/generate', [('load', 'a')]),
+    ('POST', '/v2/lifecycle/models/a/load', [('load', 'a')]),
+])
+def test_forward(triton, method, path, expected):
+    repository = Repository()
+    manager = ModelManager(repository, 8, 0, {'a': 4})
+    proxy = serve(create_handler(manager, triton, timeout=5))
+    try:
+        status, body = request(proxy, method, path)
+    finally:
+        proxy.shutdown()
+    assert status == 200
+    if 'lifecycle' not in path:
+        assert json.loads(body) == {'method': method, 'path': path}
+    assert repository.calls == expected
+    assert manager.entries.get('a') is None or manager.entries['a'].in_flight == 0
+
+
+@pytest.mark.parametrize("path", ['/v2/models/a/infer', '/v2/lifecycle/models/a/load', '/v2/models/a/ready'])
+def test_triton_down(path):
+    # nothing listens on the port of a server that was shut down
+    stopped = serve(Triton)
+    model_endpoint = f'localhost:{stopped.server_address[1]}'
+    stopped.shutdown()
+    stopped.server_close()
+
+    manager = ModelManager(Repository(), 8, 0, {'a': 4})
+    manager.repository = TritonRepository(model_endpoint, timeout=5)
+    proxy = serve(create_handler(manager, model_endpoint, timeout=5))
+    try:
+        status, body = request(proxy, 'POST' if 'ready' not in path else 'GET', path)
+    finally:
+        proxy.shutdown()
+    assert status == 503
+    assert 'error' in json.loads(body)
+    assert manager.used_bytes == 0
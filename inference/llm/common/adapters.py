@@ -0,0 +1,27 @@
+import os
+
+
+def read_max_adapters(model_config):
+    """Read the `max_adapters` parameter of `config.pbtxt`, 0 to serve the base model only."""
+    parameter = model_config.get('parameters', {}).get('max_adapters', {})
+    return int(parameter.get('string_value', '0') or '0')
+
+
+def adapter_dir(args):
+    """Directory of the LoRA adapters in the model repository, one sub-directory per adapter."""
+    return os.path.join(args['model_repository'], args['model_version'], 'adapters')
+
+
+def resolve_adapter(directory, argument):
+    """Name and path of the adapter an argument set asks for with `adapter`, None for the base model.
+
+    Only adapters deployed under `directory` can be served, so names that
+    are not a plain directory name there are rejected.
+    """
+    name = argument.get('adapter')
+    if not name:
+        return None, None
+    path = os.path.join(directory, name)
+    if os.path.basename(name) != name or name in ('.', '..') or not os.path.isdir(path):
+        raise ValueError(f"unknown adapter {name}")
+    return name, path
@@ -0,0 +1,93 @@
+import math
+import time
+
+from collections import OrderedDict, deque
+
+
+def bucket_of(value, boundaries):
+    """Smallest boundary not below `value`, or the next power of two past the last boundary."""
+    for boundary in boundaries:
+        if value <= boundary:
+            return boundary
+    return 2 ** math.ceil(math.log2(max(value, 1)))
+
+
+class LengthBucketScheduler:
+    """Forms batches of pending sequences with similar lengths.
+
+    Pending sequences are bucketed by their prompt length and `max_tokens`,
+    so a batch only pads sequences of the same bucket to a common shape.
+    Batches are bounded by `max_batch_size` and by `token_budget`, the
+    padded number of tokens of the batch. The bucket with the cheapest head
+    sequence is served first, unless the oldest pending sequence has waited
+    for more than `max_wait` seconds, in which case its bucket goes next.
+
+    Parameters
+    ----------
+    max_batch_size : int
+      Maximum number of sequences in a batch
+    token_budget : int
+      Maximum of `batch size * (longest prompt + largest max_tokens)`
+    max_wait : float
+      Seconds a sequence may wait before its bucket is served first
+    prompt_boundaries : list
+      Upper bounds of the prompt length buckets
+    max_tokens_boundaries : list
+      Upper bounds of the `max_tokens` buckets
+    """
+
+    def __init__(self, max_batch_size=8, token_budget=16384, max_wait=1.0,
+                 prompt_boundaries=(64, 128, 256, 512, 1024, 2048, 4096),
+                 max_tokens_boundaries=(32, 128, 512, 2048)):
+        self.max_batch_size = max_batch_size
+        self.token_budget = token_budget
+        self.max_wait = max_wait
+        self.prompt_boundaries = prompt_boundaries
+        self.max_tokens_boundaries = max_tokens_boundaries
+        self.buckets = OrderedDict()
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def add(self, item, prompt_length, max_tokens, group=None, now=None):
+        """Queue `item`; only items of the same `group` are ever batched together."""
+        key = (
+            group,
+            bucket_of(prompt_length, self.prompt_boundaries),
+            bucket_of(max_tokens, self.max_tokens_boundaries),
+        )
+        entry = (now if now is not None else time.monotonic(), prompt_length, max_tokens, item)
+        self.buckets.setdefault(key, deque()).append(entry)
+
+    def next_batch(self, now=None):
+        """Pop the next batch of items, an empty list when nothing is pending."""
+        if not self.buckets:
+            return []
+        now = now if now is not None else time.monotonic()
+        key = min(self.buckets, key=lambda k: self.buckets[k][0][0])
+        if now - self.buckets[key][0][0] <= self.max_wait:
+            key = min(self.buckets, key=lambda k: self._cost(self.buckets[k][0]))
+
+        bucket = self.buckets[key]
+        batch, prompt_length, max_tokens = [], 0, 0
+        while bucket and len(batch) < self.max_batch_size:
+            _, length, tokens, item = bucket[0]
+            padded = (len(batch) + 1) * (max(prompt_length, length) + max(max_tokens, tokens))
+            if batch and padded > self.token_budget:
+                break
+            bucket.popleft()
+            batch.append(item)
+            prompt_length, max_tokens = max(prompt_length, length), max(max_tokens, tokens)
+        if not bucket:
+            del self.buckets[key]
+        return batch
+
+    def drain(self):
+        """Yield batches until nothing is pending."""
+        while self.buckets:
+            yield self.next_batch()
+
+    @staticmethod
+    def _cost(entry):
+        _, prompt_length, max_tokens, _ = entry
+        return prompt_length + max_tokens
@@ -0,0 +1,215 @@
+import os
+import json
+import threading
+
+from collections import OrderedDict
+from jinja2.exceptions import TemplateError
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+# Phi-3 style template, used when the model does not ship a chat template.
+DEFAULT_TEMPLATE = (
+    "{% for message in messages %}"
+    "{{ '<|' + message['role'] + '|>\n' + message['content'] + '<|end|>\n' }}"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}{{ '<|assistant|>' }}{% endif %}"
+)
+
+ROLES = ('system', 'user', 'assistant')
+SENTINELS = ('[[SILIO_CONTENT_0]]', '[[SILIO_CONTENT_1]]', '[[SILIO_CONTENT_2]]')
+# Conversations whose ids must come out the same either way for the markers
+# to be used, e.g. SentencePiece tokenizers prefix separately encoded text.
+PROBES = (
+    [{'role': 'user', 'content': 'Hello, world!'}],
+    [
+        {'role': 'system', 'content': 'You are a helpful assistant.'},
+        {'role': 'user', 'content': 'What is 1 + 1?'},
+        {'role': 'assistant', 'content': '1 + 1 = 2.'},
+        {'role': 'user', 'content': ' And 2 + 2?\nThanks'},
+    ],
+)
+
+
+def load_template(model_dir):
+    """Read the chat template from `tokenizer_config.json` under `model_dir`, if any."""
+    config_file = os.path.join(model_dir, 'tokenizer_config.json')
+    if not os.path.exists(config_file):
+        return None
+    with open(config_file, 'r', encoding='utf-8') as in_file:
+        return json.load(in_file).get('chat_template')
+
+
+def _raise_exception(message):
+    raise TemplateError(message)
+
+
+class ChatTemplate:
+    """Chat template compiled once and applied to messages as token arrays.
+
+    At construction the template is rendered on probe messages to split it
+    into a header, per-role prefix/suffix markers and a generation prompt,
+    and those markers are tokenized once. Prompt ids are then assembled by
+    joining the marker ids with cached ids of each message content, so a
+    long history is not re-rendered and re-tokenized on every request.
+    Templates that cannot be split this way, and tokenizers whose ids of
+    the joined pieces differ from those of the whole prompt on probe
+    conversations, have every prompt rendered and tokenized in full. The
+    text that ends an assistant message is kept as `end_of_turn`, None when
+    the template cannot be split.
+
+    Parameters
+    ----------
+    template : str
+      Jinja chat template, `DEFAULT_TEMPLATE` when None
+    encode : callable
+      Maps a string to a list of token ids without adding special tokens
+    bos_ids : list
+      Token ids put in front of every prompt
+    eos_token : str
+      Text of the EOS token, for templates referring to `eos_token`
+    cache_size : int
+      Maximum number of message contents whose token ids are cached, shared
+      by the threads that encode prompts
+    """
+
+    def __init__(self, template, encode, bos_ids=None, eos_token='', cache_size=4096):
+        env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+        env.globals['raise_exception'] = _raise_exception
+        self.template = env.from_string(template or DEFAULT_TEMPLATE)
+        self.encode_text = encode
+        self.bos_ids = list(bos_ids or [])
+        self.eos_token = eos_token or ''
+        self.cache_size = cache_size
+        self.content_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.incremental = False
+        self.end_of_turn = None
+        try:
+            self._compile_markers()
+        except (TemplateError, ValueError):
+            return
+        # e.g. `<|end|>` of Phi-3 or `<|eot_id|>` of Llama 3
+        self.end_of_turn = self.markers['assistant'][1].strip() or None
+        self.header_ids = self.encode_text(self.header)
+        self.marker_ids = {
+            role: (self.encode_text(prefix), self.encode_text(suffix))
+            for role, (prefix, suffix) in self.markers.items()
+        }
+        self.generation_ids = self.encode_text(self.generation)
+        probes = [p for p in PROBES if all(m['role'] in self.marker_ids for m in p)]
+        self.incremental = all(self._join_ids(p) == self._full_ids(p) for p in probes)
+        self.content_cache.clear()
+
+    @classmethod
+    def from_hf_tokenizer(cls, tokenizer, template=None, **kwargs):
+        """Create a template from a Hugging Face tokenizer and its `chat_template`."""
+        bos_ids = [t for t in tokenizer.encode('', add_special_tokens=True) if t != tokenizer.eos_token_id]
+        return cls(
+            template or getattr(tokenizer, 'chat_template', None),
+            lambda text: tokenizer.encode(text, add_special_tokens=False),
+            bos_ids=bos_ids,
+            eos_token=tokenizer.eos_token,
+            **kwargs,
+        )
+
+    def format(self, messages):
+        """Render `messages` into the prompt text."""
+        return self._render(messages, add_generation_prompt=True)
+
+    def encode(self, messages):
+        """Build the prompt token ids for `messages`."""
+        if not self.incremental or any(m['role'] not in self.marker_ids for m in messages):
+            return self._full_ids(messages)
+        return self._join_ids(messages)
+
+    def _full_ids(self, messages):
+        return self.bos_ids + self.encode_text(self.format(messages))
+
+    def _join_ids(self, messages):
+        ids = self.bos_ids + self.header_ids
+        for message in messages:
+            prefix_ids, suffix_ids = self.marker_ids[message['role']]
+            ids += prefix_ids + self._encode_content(message['content']) + suffix_ids
+        ids += self.generation_ids
+        return ids
+
+    def _encode_content(self, content):
+        # Backends may encode prompts on several threads, so the cache is
+        # only touched under the lock, while tokenizing happens outside it.
+        with self.lock:
+            ids = self.content_cache.get(content)
+            if ids is not None:
+                self.content_cache.move_to_end(content)
+                return ids
+        ids = self.encode_text(content)
+        with self.lock:
+            self.content_cache[content] = ids
+            self.content_cache.move_to_end(content)
+            while len(self.content_cache) > self.cache_size:
+                self.content_cache.popitem(last=False)
+        return ids
+
+    def _render(self, messages, add_generation_prompt=False):
+        return self.template.render(
+            messages=messages,
+            add_generation_prompt=add_generation_prompt,
+            bos_token='',
+            eos_token=self.eos_token,
+        )
+
+    def _compile_markers(self):
+        # A single message renders as `header + prefix + content + suffix`.
+        singles = {}
+        for role in ROLES:
+            try:
+                text = self._render([{'role': role, 'content': SENTINELS[0]}])
+            except TemplateError:
+                continue
+            before, after = self._split(text, SENTINELS[0])
+            singles[role] = (before, after)
+        if 'user' not in singles or 'assistant' not in singles:
+            raise ValueError("template does not render user and assistant messages")
+
+        # Two messages render as `header + prefix_0 + content_0 + suffix_0 + prefix_1 + ...`,
+        # which separates the header from the prefix of the second role.
+        self.markers = {}
+        for role, (before, suffix) in singles.items():
+            other = 'assistant' if role == 'user' else 'user'
+            text = self._render([
+                {'role': other, 'content': SENTINELS[0]},
+                {'role': role, 'content': SENTINELS[1]},
+            ])
+            _, text = self._split(text, SENTINELS[0])
+            between, _ = self._split(text, SENTINELS[1])
+            other_suffix = singles[other][1]
+            if not between.startswith(other_suffix):
+                raise ValueError(f"cannot split markers of role {role}")
+            prefix = between[len(other_suffix):]
+            if not before.endswith(prefix):
+                raise ValueError(f"cannot split header of role {role}")
+            header = before[:len(before) - len(prefix)]
+            if self.markers and header != self.header:
+                raise ValueError(f"header of role {role} differs from other roles")
+            self.markers[role] = (prefix, suffix)
+            self.header = header
+
+        messages = [
+            {'role': role, 'content': sentinel}
+            for role, sentinel in zip(('user', 'assistant', 'user'), SENTINELS)
+        ]
+        text = self._render(messages)
+        self.generation = self._render(messages, add_generation_prompt=True)[len(text):]
+
+        # Make sure joining the markers reproduces the template.
+        expected = self.header + ''.join(
+            self.markers[m['role']][0] + m['content'] + self.markers[m['role']][1] for m in messages
+        )
+        if text != expected:
+            raise ValueError("template is not a concatenation of messages")
+
+    @staticmethod
+    def _split(text, sentinel):
+        parts = text.split(sentinel)
+        if len(parts) != 2:
+            raise ValueError("template does not render message content verbatim")
+        return parts[0], parts[1]
@@ -0,0 +1,113 @@
+KEEP_SYSTEM = 'keep_system'
+DROP_OLDEST = 'drop_oldest'
+REJECT = 'reject'
+POLICIES = (KEEP_SYSTEM, DROP_OLDEST, REJECT)
+
+
+class ContextOverflow(ValueError):
+    """The prompt does not leave room for `max_tokens` in the context window."""
+
+
+def read_context_budget(model_config, context_length, encode, metrics=None):
+    """Create the context budget configured by the parameters of `config.pbtxt`.
+
+    `context_policy` is one of `keep_system` (the default), `drop_oldest`
+    or `reject`, and an optional positive `context_length` lowers the
+    context length of the model, e.g. to bound the cost of prefill.
+    """
+    parameters = model_config.get('parameters', {})
+
+    def read(key, default):
+        return parameters.get(key, {}).get('string_value', default) or default
+
+    limit = int(read('context_length', '0'))
+    if limit > 0:
+        context_length = min(context_length, limit) if context_length else limit
+    return ContextBudget(context_length, encode, read('context_policy', KEEP_SYSTEM), metrics)
+
+
+class ContextBudget:
+    """Fits chat messages into the context window of a model before prefill.
+
+    A prompt fits when its tokens plus `max_tokens` are within the context
+    length. A prompt that does not fit is trimmed by whole turns, oldest
+    first, where a turn starts at a user message: `keep_system` never drops
+    system messages, `drop_oldest` drops them like any other turn, and
+    `reject` does not trim at all. The last message is never dropped, and
+    a prompt that still does not fit raises `ContextOverflow` before any
+    work is done for it. Prompts tokenized by the caller cannot be trimmed,
+    so they are only checked.
+
+    Parameters
+    ----------
+    context_length : int
+      Maximum number of prompt and generated tokens, no limit when 0 or None
+    encode : callable
+      Maps a list of messages to prompt token ids
+    policy : str
+      One of `keep_system`, `drop_oldest` or `reject`
+    metrics : GenerationMetrics
+      Records trimmed and rejected prompts, if given
+    """
+
+    def __init__(self, context_length, encode, policy=KEEP_SYSTEM, metrics=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unsupported context policy: {policy}")
+        self.context_length = context_length or 0
+        self.encode = encode
+        self.policy = policy
+        self.metrics = metrics
+
+    def fit(self, messages, max_tokens, prompt_ids=None):
+        """Return the messages that fit with `max_tokens` and their prompt ids.
+
+        `prompt_ids` are the ids of a prompt tokenized by the caller, whose
+        messages are None.
+        """
+        if messages is not None:
+            prompt_ids = self.encode(messages)
+        if not self.context_length or len(prompt_ids) + max_tokens <= self.context_length:
+            return messages, prompt_ids
+
+        budget = self.context_length - max_tokens
+        turns = self._turns(messages) if messages is not None and self.policy != REJECT and budget > 0 else []
+        # Dropping more turns never makes a prompt longer, so search for the
+        # fewest turns to drop.
+        fitted, low, high = None, 1, len(turns)
+        while low <= high:
+            mid = (low + high) // 2
+            dropped = {i for turn in turns[:mid] for i in turn}
+            candidate = [m for i, m in enumerate(messages) if i not in dropped]
+            candidate_ids = self.encode(candidate)
+            if len(candidate_ids) <= budget:
+                fitted, high = (candidate, candidate_ids), mid - 1
+            else:
+                low = mid + 1
+
+        if fitted is None:
+            self._record({'context_rejected': 1})
+            raise ContextOverflow(
+                f"prompt of {len(prompt_ids)} tokens and max_tokens of {max_tokens} exceed "
+                f"the context length of {self.context_length}"
+            )
+        self._record({
+            'context_trimmed': 1,
+            'context_trimmed_messages': len(messages) - len(fitted[0]),
+            'context_trimmed_tokens': len(prompt_ids) - len(fitted[1]),
+        })
+        return fitted
+
+    def _turns(self, messages):
+        # Indices of the droppable messages grouped into turns, oldest first.
+        turns = []
+        for i, message in enumerate(messages[:-1]):
+            if message['role'] == 'system' and self.policy == KEEP_SYSTEM:
+                continue
+            if not turns or message['role'] in ('user', 'system'):
+                turns.append([])
+            turns[-1].append(i)
+        return turns
+
+    def _record(self, stats):
+        if self.metrics is not None:
+            self.metrics.record_context(stats)
@@ -0,0 +1,65 @@
+import time
+
+CANCELLED = 'cancelled'
+DEADLINE = 'deadline'
+INTERRUPTED = (CANCELLED, DEADLINE)
+
+
+class Deadline:
+    """Tells a generation loop to stop early.
+
+    A generation stops once its request is cancelled by the client or once
+    the optional `deadline_ms` of its argument set has passed since the
+    request arrived. `finish_reason` is cheap to call between decode
+    steps: asking Triton about cancellation is throttled to
+    `check_interval` seconds.
+
+    Parameters
+    ----------
+    argument : dict
+      Generation arguments, with an optional `deadline_ms`
+    is_cancelled : callable
+      Returns whether the request was cancelled
+    start_time : float
+      `time.perf_counter` of the arrival of the request, now when None
+    check_interval : float
+      Minimum seconds between two cancellation checks
+    """
+
+    def __init__(self, argument, is_cancelled=None, start_time=None, check_interval=0.05):
+        start_time = start_time if start_time is not None else time.perf_counter()
+        deadline_ms = argument.get('deadline_ms')
+        self.expires_at = start_time + deadline_ms / 1000 if deadline_ms else None
+        self.is_cancelled = is_cancelled
+        self.check_interval = check_interval
+        self.checked_at = None
+        self.reason = None
+
+    @classmethod
+    def for_request(cls, request, argument, sender=None, start_time=None):
+        """Deadline of `argument` of a Triton request, using its response sender when decoupled."""
+        is_cancelled = sender.is_cancelled if sender is not None else request.is_cancelled
+        return cls(argument, is_cancelled, start_time)
+
+    def cancel(self):
+        """Stop generation at its next check, as if the request was cancelled."""
+        self.reason = CANCELLED
+
+    def remaining(self):
+        """Seconds until the deadline, None without one."""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.perf_counter(), 0.0)
+
+    def finish_reason(self):
+        """`cancelled` or `deadline` once generation must stop, otherwise None."""
+        if self.reason is not None:
+            return self.reason
+        now = time.perf_counter()
+        if self.expires_at is not None and now >= self.expires_at:
+            self.reason = DEADLINE
+        elif self.is_cancelled is not None and (self.checked_at is None or now - self.checked_at >= self.check_interval):
+            self.checked_at = now
+            if self.is_cancelled():
+                self.reason = CANCELLED
+        return self.reason
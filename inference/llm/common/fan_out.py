@@ -0,0 +1,31 @@
+import json
+
+from collections import OrderedDict
+
+
+def read_fan_out(model_config):
+    """Read the `fan_out` parameter of `config.pbtxt`, enabled by default."""
+    parameter = model_config.get('parameters', {}).get('fan_out', {})
+    return parameter.get('string_value', 'true').lower() == 'true'
+
+
+def group_arguments(arguments, fan_out=True):
+    """Group identical argument sets of a request.
+
+    Returns a list of `(argument, indices)` pairs in the order the argument
+    sets first appear, where `indices` are the result slots sharing the same
+    argument set. Without `fan_out` every argument set is its own group.
+    """
+    if not fan_out:
+        return [(argument, [j]) for j, argument in enumerate(arguments)]
+
+    groups = OrderedDict()
+    for j, argument in enumerate(arguments):
+        key = json.dumps(argument, sort_keys=True)
+        groups.setdefault(key, (argument, []))[1].append(j)
+    return list(groups.values())
+
+
+def is_greedy(argument):
+    """Whether the argument set decodes deterministically."""
+    return argument['temperature'] == 0.0 or argument['top_k'] == 1
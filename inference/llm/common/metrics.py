@@ -0,0 +1,124 @@
+import time
+import triton_python_backend_utils as pd_utils
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+THROUGHPUT_BUCKETS = [1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0]
+
+HISTOGRAMS = {
+    'queue_time': ('silio_llm_queue_seconds', 'Time a sequence waited inside the model before prefill', LATENCY_BUCKETS),
+    'prefill_time': ('silio_llm_prefill_seconds', 'Time from the start of prefill to the first token', LATENCY_BUCKETS),
+    'ttft': ('silio_llm_time_to_first_token_seconds', 'Time from execute to the first token', LATENCY_BUCKETS),
+    'decode_tokens_per_second': ('silio_llm_decode_tokens_per_second', 'Decode throughput of a sequence', THROUGHPUT_BUCKETS),
+}
+COUNTERS = {
+    'prompt_tokens': ('silio_llm_prompt_tokens_total', 'Number of prompt tokens'),
+    'completion_tokens': ('silio_llm_completion_tokens_total', 'Number of completion tokens'),
+}
+CONTEXT_COUNTERS = {
+    'context_trimmed': ('silio_llm_context_trimmed_total', 'Number of prompts trimmed to fit the context window'),
+    'context_trimmed_messages': ('silio_llm_context_trimmed_messages_total', 'Number of messages trimmed from prompts'),
+    'context_trimmed_tokens': ('silio_llm_context_trimmed_tokens_total', 'Number of tokens trimmed from prompts'),
+    'context_rejected': ('silio_llm_context_rejected_total', 'Number of prompts rejected for the context window'),
+}
+
+
+def read_return_metrics(model_config):
+    """Read the `return_metrics` parameter of `config.pbtxt`, disabled by default."""
+    parameter = model_config.get('parameters', {}).get('return_metrics', {})
+    return parameter.get('string_value', 'false').lower() == 'true'
+
+
+class SequenceTimer:
+    """Timestamps of one generated sequence.
+
+    `arrival` is when `execute` received the request, since the Python
+    backend cannot see when Triton queued it; the time spent in the Triton
+    queue is reported by Triton as `nv_inference_queue_duration_us`.
+    """
+
+    def __init__(self, arrival=None):
+        self.arrival = arrival if arrival is not None else time.perf_counter()
+        self.start = None
+        self.first_token = None
+        self.end = None
+
+    def mark_start(self):
+        if self.start is None:
+            self.start = time.perf_counter()
+
+    def mark_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def mark_end(self):
+        self.end = time.perf_counter()
+
+    def stats(self, prompt_tokens, completion_tokens):
+        end = self.end if self.end is not None else time.perf_counter()
+        start = self.start if self.start is not None else self.arrival
+        first_token = self.first_token if self.first_token is not None else end
+        return create_stats(start - self.arrival, first_token - start, end - first_token,
+                            prompt_tokens, completion_tokens)
+
+
+def create_stats(queue_time, prefill_time, decode_time, prompt_tokens, completion_tokens):
+    """Per-sequence latency figures; the first token is counted as part of prefill."""
+    return {
+        'queue_time': queue_time,
+        'prefill_time': prefill_time,
+        'ttft': queue_time + prefill_time,
+        'decode_tokens_per_second': (completion_tokens - 1) / decode_time if completion_tokens > 1 and decode_time > 0 else 0.0,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+    }
+
+
+class GenerationMetrics:
+    """Triton custom metrics of generated sequences.
+
+    Latency figures are exported as histograms. Triton releases without
+    histogram support get a `_sum` and a `_count` counter per figure instead.
+
+    Parameters
+    ----------
+    args : dict
+      Arguments of `initialize`, used to label the metrics by model
+    """
+
+    def __init__(self, args):
+        self.labels = {'model': args['model_name'], 'version': args['model_version']}
+        histogram = getattr(pd_utils.MetricFamily, 'HISTOGRAM', None)
+        self.histograms, self.summaries, self.counters = {}, {}, {}
+        for key, (name, description, buckets) in HISTOGRAMS.items():
+            if histogram is not None:
+                family = pd_utils.MetricFamily(name=name, description=description, kind=histogram)
+                self.histograms[key] = family.Metric(labels=self.labels, buckets=buckets)
+            else:
+                self.summaries[key] = (
+                    self._counter(f'{name}_sum', f'{description}, sum'),
+                    self._counter(f'{name}_count', f'{description}, count'),
+                )
+        for key, (name, description) in COUNTERS.items():
+            self.counters[key] = self._counter(name, description)
+        self.context_counters = {
+            key: self._counter(name, description) for key, (name, description) in CONTEXT_COUNTERS.items()
+        }
+        self.sequences = self._counter('silio_llm_sequences_total', 'Number of generated sequences')
+
+    def record(self, stats):
+        for key, metric in self.histograms.items():
+            metric.observe(stats[key])
+        for key, (total, count) in self.summaries.items():
+            total.increment(stats[key])
+            count.increment(1)
+        for key, metric in self.counters.items():
+            metric.increment(stats[key])
+        self.sequences.increment(1)
+
+    def record_context(self, stats):
+        for key, value in stats.items():
+            self.context_counters[key].increment(value)
+
+    def _counter(self, name, description):
+        family = pd_utils.MetricFamily(name=name, description=description, kind=pd_utils.MetricFamily.COUNTER)
+        return family.Metric(labels=self.labels)
@@ -0,0 +1,68 @@
+import json
+import numpy as np
+import triton_python_backend_utils as pd_utils
+
+SCALARS = {
+    'max_tokens': int,
+    'temperature': float,
+    'top_p': float,
+    'top_k': int,
+    'repetition_penalty': float,
+}
+PAD_ID = -1
+
+
+def read_inputs(request):
+    """Messages, prompt ids and argument sets of a request, from either input signature.
+
+    A request has either the JSON `messages`, or the INT32 `input_ids` of a
+    prompt the caller tokenized with the tokenizer of the model, including
+    its chat template. Argument sets come from the JSON `arguments`, or
+    from the typed scalar tensors `max_tokens`, `temperature`, `top_p`,
+    `top_k` and `repetition_penalty` as a single argument set; typed scalars
+    sent along with `arguments` override those fields of every argument set.
+    Messages are None for a tokenized prompt, prompt ids are None otherwise.
+    """
+    input_ids = pd_utils.get_input_tensor_by_name(request, 'input_ids')
+    if input_ids is not None:
+        messages, prompt_ids = None, input_ids.as_numpy().reshape(-1).tolist()
+    else:
+        messages = pd_utils.get_input_tensor_by_name(request, 'messages')
+        if messages is None:
+            raise ValueError("request has neither messages nor input_ids")
+        messages = [json.loads(msg.decode('utf-8')) for msg in messages.as_numpy().reshape(-1).tolist()]
+        prompt_ids = None
+
+    arguments = pd_utils.get_input_tensor_by_name(request, 'arguments')
+    if arguments is not None:
+        arguments = [json.loads(arg.decode('utf-8')) for arg in arguments.as_numpy().reshape(-1).tolist()]
+    else:
+        arguments = [{}]
+    scalars = {}
+    for key, cast in SCALARS.items():
+        tensor = pd_utils.get_input_tensor_by_name(request, key)
+        if tensor is not None:
+            scalars[key] = cast(tensor.as_numpy().reshape(-1)[0])
+    if scalars:
+        arguments = [{**argument, **scalars} for argument in arguments]
+    for argument in arguments:
+        missing = [key for key in SCALARS if key not in argument]
+        if missing:
+            raise ValueError(f"argument set misses {', '.join(missing)}")
+    return messages, prompt_ids, arguments
+
+
+def wants_output_ids(request):
+    """Whether the request asked for the `output_ids` output."""
+    return 'output_ids' in request.requested_output_names()
+
+
+def output_ids_tensor(rows, batching=False):
+    """`output_ids` tensor of the generated token ids of every argument set, right-padded with -1."""
+    width = max((len(ids) for ids in rows), default=0)
+    output_ids = np.full((len(rows), width), PAD_ID, dtype=np.int32)
+    for i, ids in enumerate(rows):
+        output_ids[i, :len(ids)] = ids
+    if batching:
+        output_ids = output_ids.reshape(1, len(rows), width)
+    return pd_utils.Tensor('output_ids', output_ids)
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from collections import OrderedDict
+from fan_out import is_greedy
+from deadline import INTERRUPTED
+
+
+def read_response_cache(model_config):
+    """Create the response cache configured by the parameters of `config.pbtxt`.
+
+    The cache is disabled unless `response_cache_bytes` is positive. An
+    optional `response_cache_ttl` in seconds expires entries, and an optional
+    `response_cache_dir` keeps entries on disk across restarts.
+    """
+    parameters = model_config.get('parameters', {})
+
+    def read(key, default):
+        return parameters.get(key, {}).get('string_value', default)
+
+    capacity_bytes = int(read('response_cache_bytes', '0'))
+    if capacity_bytes <= 0:
+        return None
+    ttl = float(read('response_cache_ttl', '0'))
+    return ResponseCache(
+        capacity_bytes,
+        ttl=ttl if ttl > 0 else None,
+        cache_dir=read('response_cache_dir', '') or None,
+        namespace=model_config.get('name', ''),
+    )
+
+
+class ResponseCache:
+    """LRU cache of generated results of deterministic requests.
+
+    Results are keyed by a hash of the exact messages and the sampling
+    arguments, and only argument sets that decode greedily are cached, since
+    any other setting is expected to return a different result every time.
+    The in-memory tier is bounded by the total size of the cached results.
+    With `cache_dir`, every result is also written to disk and looked up
+    there on a memory miss, so the cache survives restarts. Lookups and
+    updates may come from several threads at once.
+
+    Parameters
+    ----------
+    capacity_bytes : int
+      Maximum total size of the results kept in memory
+    ttl : float
+      Seconds after which a result expires, never when None
+    cache_dir : str
+      Directory of the on-disk tier, disabled when None
+    namespace : str
+      Prefix of every key, so models can share a cache directory
+    """
+
+    def __init__(self, capacity_bytes, ttl=None, cache_dir=None, namespace=''):
+        self.capacity_bytes = capacity_bytes
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, messages, argument, prompt_ids=None):
+        """Key of `messages` generated with `argument`, None if the result is not deterministic.
+
+        A prompt tokenized by the caller has no messages and is keyed by its `prompt_ids`.
+        """
+        if not is_greedy(argument):
+            return None
+        if messages is not None:
+            # messages differing only in whitespace are tokenized differently
+            prompt = list(messages)
+        else:
+            prompt = list(prompt_ids)
+        argument = {k: v for k, v in argument.items() if k != 'deadline_ms'}
+        payload = json.dumps([self.namespace, prompt, argument], sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """Cached result of `key` as a dict, or None."""
+        if key is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[0])
+
+            value = self._read_disk(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory(key, *value)
+            return json.loads(value[0])
+
+    def put(self, key, result):
+        """Cache `result`, a JSON serializable dict, under `key`, unless it was cut short."""
+        if key is None or result.get('finish_reason') in INTERRUPTED:
+            return
+        value = json.dumps(result, ensure_ascii=False)
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self.lock:
+            self._put_memory(key, value, expires_at)
+            self._write_disk(key, value, expires_at)
+
+    def stats(self):
+        with self.lock:
+            return self._stats()
+
+    def _stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'size_bytes': self.size_bytes,
+        }
+
+    def _put_memory(self, key, value, expires_at):
+        if key in self.entries:
+            self._remove(key)
+        size = len(value.encode('utf-8'))
+        if size > self.capacity_bytes:
+            return
+        self.entries[key] = (value, expires_at, size)
+        self.size_bytes += size
+        while self.size_bytes > self.capacity_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.size_bytes -= size
+
+    def _expired(self, expires_at):
+        return expires_at is not None and expires_at <= time.time()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as in_file:
+                entry = json.load(in_file)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry['expires_at']):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry['value'], entry['expires_at']
+
+    def _write_disk(self, key, value, expires_at):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as out_file:
+                json.dump({'value': value, 'expires_at': expires_at}, out_file)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            pass
@@ -0,0 +1,47 @@
+import json
+import time
+import triton_python_backend_utils as pd_utils
+
+
+def read_warmup(model_config):
+    """Read the `warmup` parameter of `config.pbtxt`, a JSON list of samples, none by default.
+
+    Every sample has the `messages` and the `arguments` of a request.
+    """
+    parameter = model_config.get('parameters', {}).get('warmup', {})
+    return json.loads(parameter.get('string_value', '') or '[]')
+
+
+def run_warmup(samples, generate):
+    """Call `generate(messages, argument)` for every argument set of every sample and log the time it took.
+
+    `initialize` runs the warmup before the model is ready, so the first
+    requests after a deploy do not pay for lazy initialization. Warmup
+    results are neither cached nor counted in the metrics.
+    """
+    start_time = time.perf_counter()
+    for sample in samples:
+        for argument in sample['arguments']:
+            generate(sample['messages'], argument)
+    elapsed = time.perf_counter() - start_time
+    pd_utils.Logger.log_info(f"warmup of {len(samples)} samples took {elapsed:.2f}s")
+    return elapsed
+
+
+def read_warmup_texts(model_config):
+    """Read the `warmup_texts` parameter of `config.pbtxt`, a JSON list of texts, none by default."""
+    parameter = model_config.get('parameters', {}).get('warmup_texts', {})
+    return json.loads(parameter.get('string_value', '') or '[]')
+
+
+def run_warmup_texts(texts, process):
+    """Call `process(texts)` once with every warmup text and log the time it took.
+
+    The text models of `text` and `seqcls` process a batch of texts per
+    request, so their warmup is a single batch of the `warmup_texts`.
+    """
+    start_time = time.perf_counter()
+    process(texts)
+    elapsed = time.perf_counter() - start_time
+    pd_utils.Logger.log_info(f"warmup of {len(texts)} texts took {elapsed:.2f}s")
+    return elapsed
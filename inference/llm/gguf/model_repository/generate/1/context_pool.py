@@ -0,0 +1,102 @@
+import os
+import time
+import queue
+
+from contextlib import contextmanager
+from llama_cpp import Llama
+
+
+def threads_per_context(pool_size, n_threads=0):
+    """Threads of every context, the cores split evenly across the pool unless `n_threads` is positive."""
+    if n_threads and n_threads > 0:
+        return n_threads
+    return max((os.cpu_count() or 1) // pool_size, 1)
+
+
+def prefault(model_path, chunk_bytes=16 * 1024 * 1024):
+    """Read `model_path` once, so that its pages are in the page cache before it is mapped."""
+    with open(model_path, 'rb', buffering=0) as in_file:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(in_file.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        buffer = bytearray(chunk_bytes)
+        while in_file.readinto(buffer):
+            pass
+
+
+class ContextPool:
+    """Pool of llama.cpp contexts over one GGUF model file.
+
+    Every context is a `Llama` of its own, with its own KV cache and
+    `n_threads` threads. With `use_mmap`, the model file is memory-mapped,
+    so the weights live once in the page cache and are shared by every
+    context, every model instance and every restart on the host, instead
+    of being copied into each of them. `use_mlock` keeps the mapped pages
+    from being swapped out, and `prefault_pages` reads the file before it
+    is mapped, so the first requests do not stall on page faults. Every
+    context evaluates one token before it is used, and `timing` holds the
+    seconds spent in each step of the startup. A context serves one
+    completion at a time: `acquire` blocks until one is free. Every context
+    allocates its own KV cache of 2 x n_layer x n_ctx x n_embd_kv values
+    and its own compute buffers, so the memory of the pool grows with its
+    size even though the weights are shared. The contexts
+    share one llama.cpp cache, so a prompt whose prefix was saved by one
+    context is restored into whichever context serves it.
+
+    Parameters
+    ----------
+    model_path : str
+      Path of the GGUF model file
+    pool_size : int
+      Number of contexts
+    n_threads : int
+      Threads per context
+    cache : llama_cpp.BaseLlamaCache
+      llama.cpp cache shared by every context, no cache when None
+    use_mmap : bool
+      Whether to memory-map the model file
+    use_mlock : bool
+      Whether to lock the model in memory
+    prefault_pages : bool
+      Whether to read the model file into the page cache before loading it
+    kwargs : dict
+      Other arguments of every `Llama`
+    """
+
+    def __init__(self, model_path, pool_size, n_threads, cache=None,
+                 use_mmap=True, use_mlock=False, prefault_pages=False, **kwargs):
+        self.contexts = []
+        self.free = queue.Queue()
+        self.timing = {'prefault': 0.0, 'model_load': 0.0, 'contexts': 0.0, 'first_eval': 0.0}
+
+        start_time = time.perf_counter()
+        if prefault_pages:
+            prefault(model_path)
+            self.timing['prefault'] = time.perf_counter() - start_time
+
+        for k in range(pool_size):
+            step_time = time.perf_counter()
+            context = Llama(model_path=model_path, n_threads=n_threads, use_mmap=use_mmap, use_mlock=use_mlock, **kwargs)
+            # later contexts map pages the first one has already faulted in
+            self.timing['model_load' if k == 0 else 'contexts'] += time.perf_counter() - step_time
+            if cache is not None:
+                context.set_cache(cache)
+            self.contexts.append(context)
+            self.free.put(context)
+
+        step_time = time.perf_counter()
+        for context in self.contexts:
+            context.eval([context.token_bos()])
+            context.reset()
+        self.timing['first_eval'] = time.perf_counter() - step_time
+        self.timing['total'] = time.perf_counter() - start_time
+
+    def __len__(self):
+        return len(self.contexts)
+
+    @contextmanager
+    def acquire(self):
+        context = self.free.get()
+        try:
+            yield context
+        finally:
+            self.free.put(context)
@@ -1,9 +1,20 @@
 import os
 import json
+import time
 import numpy as np
 import triton_python_backend_utils as pd_utils
 
-from llama_cpp import Llama
+from concurrent.futures import ThreadPoolExecutor
+from chat_template import ChatTemplate
+from context_pool import ContextPool, threads_per_context
+from fan_out import group_arguments, is_greedy, read_fan_out
+from prefix_cache import PrefixStateCache
+from response_cache import read_response_cache
+from metrics import GenerationMetrics, SequenceTimer, read_return_metrics
+from deadline import INTERRUPTED, Deadline
+from warmup import read_warmup, run_warmup
+from context_budget import read_context_budget
+from request_inputs import read_inputs
 
 
 class TritonPythonModel:
@@ -28,17 +39,55 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
+        self.decoupled = pd_utils.using_decoupled_model_transaction_policy(self.model_config)
+        self.batching = self.model_config['max_batch_size'] > 0
+        self.fan_out = read_fan_out(self.model_config)
+        self.response_cache = read_response_cache(self.model_config)
+        self.metrics = GenerationMetrics(args)
+        self.return_metrics = read_return_metrics(self.model_config)
+
         config_file = os.path.join(args['model_repository'], args['model_version'], 'model_config.json')
         with open(config_file, 'r', encoding='utf-8') as in_file:
             self.config = json.load(in_file)
 
+        # The prefix cache is shared by the contexts of the pool, so the
+        # follow-up turn of a chat finds the state of its earlier turns
+        # whichever context serves it.
+        pool_size = self.config.get("pool_size", 1)
+        self.prefix_cache = None
+        if self.config.get("cache_capacity_bytes", 0) > 0:
+            self.prefix_cache = PrefixStateCache(
+                capacity_bytes=self.config["cache_capacity_bytes"],
+                block_size=self.config.get("cache_block_size", 64),
+            )
+
         model_path = os.path.join(args['model_repository'], args['model_version'], 'model/model.gguf')
-        self.model = Llama(
-            model_path=model_path,
+        self.pool = ContextPool(
+            model_path,
+            pool_size,
+            threads_per_context(pool_size, self.config["n_threads"]),
+            cache=self.prefix_cache,
+            use_mmap=self.config.get("use_mmap", True),
+            use_mlock=self.config.get("use_mlock", False),
+            prefault_pages=self.config.get("prefault", False),
             n_ctx=self.config["n_ctx"],
-            n_threads=self.config["n_threads"],
             n_gpu_layers=self.config["n_gpu_layers"],
         )
+        pd_utils.Logger.log_info(f"startup timing: {json.dumps(self.pool.timing)}")
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        # tokenization only reads the vocabulary, so any context will do
+        self.model = self.pool.contexts[0]
+
+        self.chat_template = ChatTemplate(
+            self.model.metadata.get("tokenizer.chat_template"),
+            lambda text: self.model.tokenize(text.encode("utf-8"), add_bos=False, special=True),
+            bos_ids=[self.model.token_bos()],
+            eos_token=self.model.detokenize([self.model.token_eos()]).decode("utf-8", errors="ignore"),
+        )
+        self.context_budget = read_context_budget(self.model_config, self.model.n_ctx(), self.chat_template.encode,
+                                                  self.metrics)
+        run_warmup(read_warmup(self.model_config), self._warmup)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -60,47 +109,213 @@ class TritonPythonModel:
           be the same as `requests`
         """
 
-        responses = []
+        # Every request is served by one context of the pool, so concurrent
+        # requests decode in parallel while the completions of one request
+        # still reuse the prompt kept in the KV cache of its context. Without
+        # decoupling, the responses of a batch are returned together once
+        # its longest request finishes, and Triton sends the next batch only
+        # after that, so short requests wait on the longest one.
+        arrival_time = time.perf_counter()
+        if self.decoupled:
+            # the workers send the responses, so nothing is left to wait for
+            for request in requests:
+                self.executor.submit(self._execute_decoupled, request, arrival_time)
+            return None
+
         # Every Python backend must iterate over everyone of the requests
         # and create a pb_utils.InferenceResponse for each of them.
-        for request in requests:
-            messages = pd_utils.get_input_tensor_by_name(request, 'messages').as_numpy().tolist()
-            prompt = self._format_messages(messages)
-            arguments = pd_utils.get_input_tensor_by_name(request, 'arguments').as_numpy().tolist()
-            output_results = []
-            for arg in arguments:
-                argument = json.loads(arg.decode('utf-8'))
-                output = self.model(
-                    prompt,
-                    max_tokens=argument['max_tokens'],
-                    temperature=argument['temperature'],
-                    top_p=argument['top_p'],
-                    top_k=argument['top_k'],
-                    repeat_penalty=argument['repetition_penalty'],
-                    stop=["<|end|>"],
-                    echo=False,
-                )
-                result = {
-                    'role': 'assistant',
-                    'content': output["choices"][0]["text"],
-                    'prompt': prompt,
-                    'argument': argument
-                }
-                output_results.append(json.dumps(result))
-            output_tensors = [
-                pd_utils.Tensor('results', np.array(output_results, dtype=object)),
-            ]
-            response = pd_utils.InferenceResponse(output_tensors=output_tensors)
-            responses.append(response)
+        futures = [self.executor.submit(self._execute_request, request, arrival_time) for request in requests]
+        responses = [future.result() for future in futures]
 
+        self._log_cache_stats()
         return responses
 
-    def _format_messages(self, messages):
-        texts = []
-        for msg in messages:
-            message = json.loads(msg.decode('utf-8'))
-            role, content = message['role'], message['content']
-            texts.append(f'<|{role}|>\n{content}<|end|>')
-        texts.append('<|assistant|>')
-        prompt = '\n'.join(texts)
-        return prompt
+    def finalize(self):
+        """`finalize` is called only once when the model is being unloaded.
+        Implementing `finalize` function is optional. This function allows
+        the model to perform any necessary clean ups before exit.
+        """
+
+        self.executor.shutdown(wait=True)
+
+    def _execute_request(self, request, arrival_time):
+        try:
+            with self.pool.acquire() as model:
+                output_results = self._generate_results(model, request, arrival_time)
+        except Exception as e:
+            return pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(e)))
+        output_results = np.array(output_results, dtype=object)
+        if self.batching:
+            output_results = output_results.reshape(1, -1)
+        output_tensors = [
+            pd_utils.Tensor('results', output_results),
+        ]
+        return pd_utils.InferenceResponse(output_tensors=output_tensors)
+
+    def _generate_results(self, model, request, arrival_time):
+        messages, prompt_ids, arguments = read_inputs(request)
+        fitted, prompt_ids = self.context_budget.fit(messages, max(a['max_tokens'] for a in arguments), prompt_ids)
+        prompt = self.chat_template.format(fitted) if fitted is not None else None
+        output_results = [None] * len(arguments)
+        for argument, targets in self._fan_out_arguments(arguments):
+            cache_key = self._cache_key(messages, argument, prompt_ids)
+            for indices in targets:
+                cached = self.response_cache.get(cache_key) if cache_key else None
+                stats = None
+                if cached is None:
+                    timer = SequenceTimer(arrival_time)
+                    deadline = Deadline.for_request(request, argument, start_time=arrival_time)
+                    content, finish_reason = '', None
+                    for text, finish_reason in self._stream_completion(model, prompt_ids, argument, timer, deadline):
+                        content += text
+                    cached = {'content': content, 'finish_reason': finish_reason}
+                    self._cache_put(cache_key, cached)
+                    stats = self._record_stats(timer, prompt_ids, content)
+                for j in indices:
+                    result = {
+                        'role': 'assistant',
+                        'content': cached['content'],
+                        'finish_reason': cached['finish_reason'],
+                        'prompt': prompt,
+                        'argument': argument
+                    }
+                    if stats is not None and self.return_metrics:
+                        result['metrics'] = stats
+                    output_results[j] = json.dumps(result)
+        return output_results
+
+    def _execute_decoupled(self, request, arrival_time):
+        sender = request.get_response_sender()
+        try:
+            with self.pool.acquire() as model:
+                self._stream_results(model, request, sender, arrival_time)
+            self._log_cache_stats()
+            sender.send(flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+        except Exception as e:
+            response = pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(e)))
+            sender.send(response, flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+
+    def _stream_results(self, model, request, sender, arrival_time):
+        messages, prompt_ids, arguments = read_inputs(request)
+        _, prompt_ids = self.context_budget.fit(messages, max(a['max_tokens'] for a in arguments), prompt_ids)
+        for argument, targets in self._fan_out_arguments(arguments):
+            cache_key = self._cache_key(messages, argument, prompt_ids)
+            for indices in targets:
+                cached = self.response_cache.get(cache_key) if cache_key else None
+                if cached is not None:
+                    for j in indices:
+                        self._send_delta(sender, j, cached['content'], cached['finish_reason'])
+                    continue
+                timer = SequenceTimer(arrival_time)
+                deadline = Deadline.for_request(request, argument, sender, arrival_time)
+                content, finish_reason = '', None
+                for text, finish_reason in self._stream_completion(model, prompt_ids, argument, timer, deadline):
+                    content += text
+                    if text:
+                        for j in indices:
+                            self._send_delta(sender, j, text)
+                self._cache_put(cache_key, {'content': content, 'finish_reason': finish_reason})
+                stats = self._record_stats(timer, prompt_ids, content)
+                for j in indices:
+                    self._send_delta(sender, j, '', finish_reason, stats)
+
+    def _warmup(self, messages, argument):
+        # every context allocates its own compute graph
+        prompt_ids = self.chat_template.encode(messages)
+        for model in self.pool.contexts:
+            for _ in self._stream_completion(model, prompt_ids, argument, SequenceTimer(), Deadline(argument)):
+                pass
+
+    def _fan_out_arguments(self, arguments):
+        # llama.cpp keeps the KV cache of the prompt between completions and
+        # only truncates what follows it, so every completion after the first
+        # skips the prefill. Identical greedy argument sets decode only once
+        # and share the result.
+        for argument, indices in group_arguments(arguments, self.fan_out):
+            if is_greedy(argument):
+                yield argument, [indices]
+            else:
+                yield argument, [[j] for j in indices]
+
+    def _stream_completion(self, model, prompt_ids, argument, timer, deadline):
+        # Completions are always streamed from llama.cpp, so that the time
+        # of the first token can be told apart from the rest of the decode,
+        # and so that a cancelled or expired request stops between tokens.
+        # llama.cpp saves the KV state to the prefix cache only after its
+        # final chunk, so a finished stream is drained rather than closed.
+        timer.mark_start()
+        finish_reason = deadline.finish_reason()
+        if finish_reason is None:
+            chunks = model(prompt_ids, stream=True, **self._create_completion_args(argument))
+            for chunk in chunks:
+                choice = chunk["choices"][0]
+                if choice["text"]:
+                    timer.mark_token()
+                finish_reason = choice["finish_reason"] or deadline.finish_reason()
+                yield choice["text"], finish_reason
+                if finish_reason is not None:
+                    break
+            if finish_reason in INTERRUPTED:
+                chunks.close()
+            else:
+                for _ in chunks:
+                    pass
+        else:
+            yield '', finish_reason
+        timer.mark_end()
+
+    def _record_stats(self, timer, prompt_ids, content):
+        stats = timer.stats(len(prompt_ids), len(self._tokenize(content)))
+        self.metrics.record(stats)
+        return stats
+
+    def _tokenize(self, content):
+        # llama.cpp streams text, so generated tokens are counted from it
+        return self.model.tokenize(content.encode("utf-8"), add_bos=False, special=True) if content else []
+
+    def _create_completion_args(self, argument):
+        completion_args = {
+            'max_tokens': argument['max_tokens'],
+            'temperature': argument['temperature'],
+            'top_p': argument['top_p'],
+            'top_k': argument['top_k'],
+            'repeat_penalty': argument['repetition_penalty'],
+            'echo': False,
+        }
+        # llama.cpp stops at end-of-generation tokens, and at the end-of-turn
+        # marker of the chat template for models whose EOS token is another
+        if self.chat_template.end_of_turn:
+            completion_args['stop'] = [self.chat_template.end_of_turn]
+        return completion_args
+
+    def _cache_key(self, messages, argument, prompt_ids=None):
+        if self.response_cache is None:
+            return None
+        return self.response_cache.key(messages, argument, prompt_ids)
+
+    def _cache_put(self, cache_key, result):
+        if cache_key is not None:
+            self.response_cache.put(cache_key, result)
+
+    def _log_cache_stats(self):
+        if self.prefix_cache is not None:
+            pd_utils.Logger.log_info(f"prefix cache stats: {json.dumps(self.prefix_cache.stats())}")
+        if self.response_cache is not None:
+            pd_utils.Logger.log_info(f"response cache stats: {json.dumps(self.response_cache.stats())}")
+
+    def _send_delta(self, sender, index, content, finish_reason=None, metrics=None):
+        result = {
+            'index': index,
+            'role': 'assistant',
+            'content': content,
+            'finish_reason': finish_reason,
+        }
+        if metrics is not None and self.return_metrics:
+            result['metrics'] = metrics
+        results = np.array([json.dumps(result)], dtype=object)
+        if self.batching:
+            results = results.reshape(1, -1)
+        output_tensors = [
+            pd_utils.Tensor('results', results),
+        ]
+        sender.send(pd_utils.InferenceResponse(output_tensors=output_tensors))
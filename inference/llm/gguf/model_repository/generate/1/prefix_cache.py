@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from llama_cpp.llama_cache import BaseLlamaCache
+
+
+class PrefixStateCache(BaseLlamaCache):
+    """LRU cache of llama.cpp KV states keyed by hashes of the token prefix.
+
+    Every saved state is indexed by the rolling hash of each full block of its
+    tokens, so a lookup finds the state sharing the longest block-aligned
+    prefix with the prompt. After the state is restored, llama.cpp only has
+    to prefill the tokens past the shared prefix. A state can be restored
+    into any context of the same model, so one cache is shared by every
+    context of a pool, and every access holds its lock.
+    """
+
+    def __init__(self, capacity_bytes, block_size=64):
+        super().__init__(capacity_bytes)
+        self.block_size = block_size
+        self.entries = OrderedDict()
+        self.prefixes = {}
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def cache_size(self):
+        return self.size_bytes
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'size_bytes': self.cache_size,
+            }
+
+    def __getitem__(self, key):
+        block_hashes = self._hash_blocks(key)
+        with self.lock:
+            entry_key = self._find_longest_prefix_key(block_hashes)
+            if entry_key is None:
+                self.misses += 1
+                raise KeyError("prefix not found in cache")
+            self.hits += 1
+            self.entries.move_to_end(entry_key)
+            state, _ = self.entries[entry_key]
+            return state
+
+    def __contains__(self, key):
+        block_hashes = self._hash_blocks(key)
+        with self.lock:
+            return self._find_longest_prefix_key(block_hashes) is not None
+
+    def __setitem__(self, key, value):
+        # hashing happens outside the lock, so other contexts only wait for
+        # the index to be updated
+        block_hashes = self._hash_blocks(key)
+        entry_key = self._hash_tokens(key)
+        with self.lock:
+            if entry_key in self.entries:
+                self._remove(entry_key)
+            self.entries[entry_key] = (value, block_hashes)
+            self.size_bytes += value.llama_state_size
+            for block_hash in block_hashes:
+                self.prefixes.setdefault(block_hash, OrderedDict())[entry_key] = None
+            while self.size_bytes > self.capacity_bytes and len(self.entries) > 0:
+                self._remove(next(iter(self.entries)))
+
+    def _find_longest_prefix_key(self, block_hashes):
+        entry_key = None
+        for block_hash in block_hashes:
+            if block_hash not in self.prefixes:
+                break
+            entry_key = next(reversed(self.prefixes[block_hash]))
+        return entry_key
+
+    def _remove(self, entry_key):
+        state, block_hashes = self.entries.pop(entry_key)
+        self.size_bytes -= state.llama_state_size
+        for block_hash in block_hashes:
+            self.prefixes[block_hash].pop(entry_key, None)
+            if not self.prefixes[block_hash]:
+                del self.prefixes[block_hash]
+
+    def _hash_blocks(self, tokens):
+        hasher = hashlib.blake2b(digest_size=16)
+        block_hashes = []
+        for i in range(self.block_size, len(tokens) + 1, self.block_size):
+            hasher.update(np.asarray(tokens[i - self.block_size:i], dtype=np.int32).tobytes())
+            block_hashes.append(hasher.hexdigest())
+        return block_hashes
+
+    def _hash_tokens(self, tokens):
+        return hashlib.blake2b(np.asarray(tokens, dtype=np.int32).tobytes(), digest_size=16).hexdigest()
@@ -22,7 +22,13 @@ export MODEL_RESOURCE_GROUP=$(cat ./config.json | jq -r '.model.resource_group')
 export MODEL_WORKSPACE_NAME=$(cat ./config.json | jq -r '.model.workspace_name')
 export MODEL_N_CTX=$(cat ./config.json | jq -r '.model.n_ctx')
 export MODEL_N_THREADS=$(cat ./config.json | jq -r '.model.n_threads')
+export MODEL_POOL_SIZE=$(cat ./config.json | jq -r '.model.pool_size // 1')
 export MODEL_N_GPU_LAYERS=$(cat ./config.json | jq -r '.model.n_gpu_layers')
+export MODEL_USE_MMAP=$(cat ./config.json | jq -r '.model.use_mmap != false')
+export MODEL_USE_MLOCK=$(cat ./config.json | jq -r '.model.use_mlock == true')
+export MODEL_PREFAULT=$(cat ./config.json | jq -r '.model.prefault == true')
+export MODEL_CACHE_CAPACITY_BYTES=$(cat ./config.json | jq -r '.model.cache_capacity_bytes // 0')
+export MODEL_CACHE_BLOCK_SIZE=$(cat ./config.json | jq -r '.model.cache_block_size // 64')
 
 export IMAGE_NAME=$(cat ./config.json | jq -r '.image.name')
 export IMAGE_TAG_PREFIX=$(cat ./config.json | jq -r '.image.tag_prefix')
@@ -38,7 +44,13 @@ echo "model resource group      = $MODEL_RESOURCE_GROUP"
 echo "model workspace name      = $MODEL_WORKSPACE_NAME"
 echo "model context length      = $MODEL_N_CTX"
 echo "model # threads           = $MODEL_N_THREADS"
+echo "model pool size           = $MODEL_POOL_SIZE"
 echo "model # gpu layers        = $MODEL_N_GPU_LAYERS"
+echo "model use mmap            = $MODEL_USE_MMAP"
+echo "model use mlock           = $MODEL_USE_MLOCK"
+echo "model prefault            = $MODEL_PREFAULT"
+echo "model cache capacity      = $MODEL_CACHE_CAPACITY_BYTES"
+echo "model cache block size    = $MODEL_CACHE_BLOCK_SIZE"
 
 echo "image name                = $IMAGE_NAME"
 echo "image tag prefix          = $IMAGE_TAG_PREFIX"
@@ -63,24 +75,40 @@ mkdir ./build
 cp -r ../Dockerfile ./build/Dockerfile
 cp -r ../model_repository ./build/model_repository
 cp -r ./model/$MODEL_ARTIFACT_PATH/* ./build/model_repository/generate/1/model/
+cp -r ../../common/* ./build/model_repository/generate/1/
 
-python update_template.py \
+python ../update_template.py \
 --input_file ./build/model_repository/generate/1/model_config.json.tmpl \
---outputp_file ./build/model_repository/generate/1/model_config.json \
+--output_file ./build/model_repository/generate/1/model_config.json \
 --n_ctx $MODEL_N_CTX \
 --n_threads $MODEL_N_THREADS \
---n_gpu_layers $MODEL_N_GPU_LAYERS
-rm ./build/model_repository/predict-onnx/config.pbtxt.tmpl
+--pool_size $MODEL_POOL_SIZE \
+--n_gpu_layers $MODEL_N_GPU_LAYERS \
+--use_mmap $MODEL_USE_MMAP \
+--use_mlock $MODEL_USE_MLOCK \
+--prefault $MODEL_PREFAULT \
+--cache_capacity_bytes $MODEL_CACHE_CAPACITY_BYTES \
+--cache_block_size $MODEL_CACHE_BLOCK_SIZE
+rm ./build/model_repository/generate/1/model_config.json.tmpl
 
 cd ./build
 docker build -t custom_image:latest .
 cd ..
 
-docker run --rm -d --shm-size 1g \
+docker run --rm -d --shm-size 1g --ulimit memlock=-1:-1 \
   -p8000:8000 -p8001:8001 -p8002:8002 \
   custom_image:latest \
   tritonserver --model-repository=/model_repository
-sleep 20
+# models run their warmup while loading, so the server is only ready after it
+SECONDS=0
+until curl -sf -o /dev/null localhost:8000/v2/health/ready; do
+  if [ $SECONDS -ge 900 ]; then
+    echo "server not ready after $SECONDS seconds"
+    exit 1
+  fi
+  sleep 5
+done
+echo "server ready after $SECONDS seconds"
 curl -v localhost:8000/v2/health/ready
 
 az account set --subscription $MODEL_SUBSCRIPTION_ID
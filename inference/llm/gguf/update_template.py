@@ -13,8 +13,15 @@ def main():
     parser.add_argument("--input_file", type=str, help="input file")
     parser.add_argument("--output_file", type=str, help="output file")
     parser.add_argument("--n_ctx", type=int, help="context length", required=False)
-    parser.add_argument("--n_threads", type=str, help="number of threads", required=False)
+    parser.add_argument("--n_threads", type=str, help="number of threads per context, 0 splits the cores", required=False)
+    parser.add_argument("--pool_size", type=int, help="number of llama.cpp contexts", required=False)
     parser.add_argument("--n_gpu_layers", type=int, help="number of gpu layers", required=False)
+    parser.add_argument("--use_mmap", type=str, help="whether to memory-map the model, true or false", required=False)
+    parser.add_argument("--use_mlock", type=str, help="whether to lock the model in memory, true or false", required=False)
+    parser.add_argument("--prefault", type=str, help="whether to read the model before loading it, true or false",
+                        required=False)
+    parser.add_argument("--cache_capacity_bytes", type=int, help="prefix cache capacity in bytes", required=False)
+    parser.add_argument("--cache_block_size", type=int, help="prefix cache block size in tokens", required=False)
     args = parser.parse_args()
 
     logger.setLevel(logging.INFO)
@@ -27,8 +34,20 @@ def main():
         replaces["n_ctx"] = args.n_ctx
     if args.n_threads:
         replaces["n_threads"] = args.n_threads
-    if args.n_gpu_layers:
+    if args.pool_size:
+        replaces["pool_size"] = args.pool_size
+    if args.n_gpu_layers is not None:
         replaces["n_gpu_layers"] = args.n_gpu_layers
+    if args.use_mmap:
+        replaces["use_mmap"] = args.use_mmap
+    if args.use_mlock:
+        replaces["use_mlock"] = args.use_mlock
+    if args.prefault:
+        replaces["prefault"] = args.prefault
+    if args.cache_capacity_bytes is not None:
+        replaces["cache_capacity_bytes"] = args.cache_capacity_bytes
+    if args.cache_block_size:
+        replaces["cache_block_size"] = args.cache_block_size
 
     t = Template(tmpl)
     res = t.substitute(replaces)
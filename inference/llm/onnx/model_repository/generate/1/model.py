@@ -1,9 +1,20 @@
 import os
 import json
+import time
 import numpy as np
 import onnxruntime_genai as og
 import triton_python_backend_utils as pd_utils
 
+from chat_template import ChatTemplate, load_template
+from fan_out import group_arguments, is_greedy, read_fan_out
+from scheduler import BatchScheduler, Sequence
+from response_cache import read_response_cache
+from metrics import GenerationMetrics, create_stats, read_return_metrics
+from deadline import Deadline
+from warmup import read_warmup, run_warmup
+from context_budget import read_context_budget
+from request_inputs import output_ids_tensor, read_inputs, wants_output_ids
+
 
 class TritonPythonModel:
     """Your Python model must use the same class name. Every Python model
@@ -27,9 +38,40 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
+        self.batching = self.model_config['max_batch_size'] > 0
+        self.decoupled = pd_utils.using_decoupled_model_transaction_policy(self.model_config)
+        self.fan_out = read_fan_out(self.model_config)
+        self.response_cache = read_response_cache(self.model_config)
+        self.metrics = GenerationMetrics(args)
+        self.return_metrics = read_return_metrics(self.model_config)
+
         model_path = os.path.join(args['model_repository'], args['model_version'], 'model')
         self.model = og.Model(model_path)
         self.tokenizer = og.Tokenizer(self.model)
+        # onnxruntime-genai always adds the special tokens of the model, so
+        # strip them from every segment and put them in front once.
+        bos_ids = self.tokenizer.encode('').tolist()
+        self.chat_template = ChatTemplate(
+            load_template(model_path),
+            lambda text: self.tokenizer.encode(text).tolist()[len(bos_ids):],
+            bos_ids=bos_ids,
+        )
+
+        with open(os.path.join(model_path, 'genai_config.json'), 'r', encoding='utf-8') as in_file:
+            genai_config = json.load(in_file)
+        self.context_budget = read_context_budget(self.model_config, genai_config['model'].get('context_length'),
+                                                  self.chat_template.encode, self.metrics)
+        parameters = self.model_config.get('parameters', {})
+        self.scheduler = BatchScheduler(
+            self.model,
+            self.tokenizer,
+            genai_config,
+            max_batch_size=int(parameters.get('decode_batch_size', {}).get('string_value', '8')),
+            token_budget=int(parameters.get('decode_token_budget', {}).get('string_value', '16384')),
+            max_wait=int(parameters.get('bucket_max_wait_ms', {}).get('string_value', '1000')) / 1000,
+        )
+        run_warmup(read_warmup(self.model_config), self._warmup)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -51,46 +93,159 @@ class TritonPythonModel:
           be the same as `requests`
         """
 
-        responses = []
-        # Every Python backend must iterate over everyone of the requests
-        # and create a pb_utils.InferenceResponse for each of them.
-        for request in requests:
-            messages = pd_utils.get_input_tensor_by_name(request, 'messages').as_numpy().tolist()
-            prompt = self._format_messages(messages)
-            input_tokens = self.tokenizer.encode(prompt)
-            arguments = pd_utils.get_input_tensor_by_name(request, 'arguments').as_numpy().tolist()
-            output_results = []
-            for arg in arguments:
-                argument = json.loads(arg.decode('utf-8'))
-                params = og.GeneratorParams(self.model)
-                params.set_search_options(
-                    max_length=argument['max_tokens'],
-                    temperature=argument['temperature'],
-                    top_p=argument['top_p'],
-                    top_k=argument['top_k'],
-                    repetition_penalty=argument['repetition_penalty'],
-                )
-                params.input_ids = input_tokens
-                output_tokens = self.model.generate(params)
+        arrival_time = time.perf_counter()
+        senders = [request.get_response_sender() for request in requests] if self.decoupled else None
+        sequences, cached_targets, output_results = self._collect_requests(requests, senders, arrival_time)
+        if self.decoupled:
+            self._execute_decoupled(senders, sequences, cached_targets, arrival_time)
+            return None
+
+        # ids of the generated tokens, for the requests that ask for them
+        output_ids = [[[] for _ in results] if isinstance(results, list) else None for results in output_results]
+        for targets, cached in cached_targets:
+            for i, j in targets:
+                result = {
+                    'role': 'assistant',
+                    'content': cached['content'],
+                    'finish_reason': cached['finish_reason'],
+                }
+                output_results[i][j] = json.dumps(result)
+                output_ids[i][j] = cached.get('output_ids', [])
+
+        self.scheduler.run(sequences)
+        for sequence in sequences:
+            content = self.tokenizer.decode(np.array(sequence.output_ids, dtype=np.int32))
+            self._cache_put(sequence, content)
+            stats = self._record_stats(sequence, arrival_time)
+            for i, j in sequence.targets:
                 result = {
                     'role': 'assistant',
-                    'content': self.tokenizer.decode(output_tokens)
+                    'content': content,
+                    'finish_reason': sequence.finish_reason,
                 }
-                output_results.append(json.dumps(result))
+                if self.return_metrics:
+                    result['metrics'] = stats
+                output_results[i][j] = json.dumps(result)
+                output_ids[i][j] = list(sequence.output_ids)
+
+        responses = []
+        # Every Python backend must iterate over everyone of the requests
+        # and create a pb_utils.InferenceResponse for each of them.
+        for request, results, ids in zip(requests, output_results, output_ids):
+            if isinstance(results, ValueError):
+                responses.append(pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(results))))
+                continue
+            results = np.array(results, dtype=object)
+            if self.batching:
+                results = results.reshape(1, -1)
             output_tensors = [
-                pd_utils.Tensor('results', np.array(output_results, dtype=object)),
+                pd_utils.Tensor('results', results),
             ]
+            if wants_output_ids(request):
+                output_tensors.append(output_ids_tensor(ids, self.batching))
             response = pd_utils.InferenceResponse(output_tensors=output_tensors)
             responses.append(response)
 
+        self._log_cache_stats()
         return responses
 
-    def _format_messages(self, messages):
-        texts = []
-        for msg in messages:
-            message = json.loads(msg.decode('utf-8'))
-            role, content = message['role'], message['content']
-            texts.append(f'<|{role}|>\n{content}<|end|>')
-        texts.append('<|assistant|>')
-        prompt = '\n'.join(texts)
-        return prompt
+    def _collect_requests(self, requests, senders, arrival_time):
+        # Turn every argument set of every request into sequences for the
+        # scheduler, which decodes them together in padded batches. Identical
+        # greedy argument sets of a request share one sequence, sampled ones
+        # get a sequence per result slot, unless found in the response cache.
+        # Requests with invalid inputs or whose prompt does not fit the
+        # context window get their error instead of results, and are done
+        # with once it is sent.
+        sequences, cached_targets, output_results = [], [], []
+        for i, request in enumerate(requests):
+            sender = senders[i] if senders is not None else None
+            output_results.append(None)
+            try:
+                messages, prompt_ids, arguments = read_inputs(request)
+                output_results[i] = [None] * len(arguments)
+                _, prompt_ids = self.context_budget.fit(messages, max(a['max_tokens'] for a in arguments), prompt_ids)
+            except ValueError as e:
+                output_results[i] = e
+                if sender is not None:
+                    response = pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(e)))
+                    sender.send(response, flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+                    senders[i] = None
+                continue
+            for argument, indices in group_arguments(arguments, self.fan_out):
+                deadline = Deadline.for_request(request, argument, sender, arrival_time)
+                if is_greedy(argument):
+                    sequence = Sequence(prompt_ids, argument, [(i, j) for j in indices], deadline=deadline)
+                    if self.response_cache is not None:
+                        sequence.cache_key = self.response_cache.key(messages, argument, prompt_ids)
+                        cached = self.response_cache.get(sequence.cache_key)
+                        if cached is not None:
+                            cached_targets.append((sequence.targets, cached))
+                            continue
+                    sequences.append(sequence)
+                else:
+                    sequences.extend(Sequence(prompt_ids, argument, [(i, j)], deadline=deadline) for j in indices)
+
+        return sequences, cached_targets, output_results
+
+    def _execute_decoupled(self, senders, sequences, cached_targets, arrival_time):
+        for targets, cached in cached_targets:
+            for i, j in targets:
+                self._send_delta(senders[i], j, cached['content'], cached['finish_reason'])
+
+        def on_delta(sequence, text, finish_reason):
+            stats = self._record_stats(sequence, arrival_time) if finish_reason else None
+            for i, j in sequence.targets:
+                self._send_delta(senders[i], j, text, finish_reason, stats)
+
+        self.scheduler.run(sequences, on_delta)
+        for sequence in sequences:
+            self._cache_put(sequence, self.tokenizer.decode(np.array(sequence.output_ids, dtype=np.int32)))
+        self._log_cache_stats()
+        for sender in senders:
+            if sender is not None:
+                sender.send(flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+
+    def _warmup(self, messages, argument):
+        self.scheduler.run([Sequence(self.chat_template.encode(messages), argument, [])])
+
+    def _record_stats(self, sequence, arrival_time):
+        stats = create_stats(
+            sequence.start_time - arrival_time,
+            sequence.first_token_time - sequence.start_time,
+            sequence.end_time - sequence.first_token_time,
+            len(sequence.prompt_ids),
+            len(sequence.output_ids),
+        )
+        self.metrics.record(stats)
+        return stats
+
+    def _cache_put(self, sequence, content):
+        if self.response_cache is None or sequence.cache_key is None:
+            return
+        self.response_cache.put(sequence.cache_key, {
+            'content': content,
+            'finish_reason': sequence.finish_reason,
+            'output_ids': list(sequence.output_ids),
+        })
+
+    def _log_cache_stats(self):
+        if self.response_cache is not None:
+            pd_utils.Logger.log_info(f"response cache stats: {json.dumps(self.response_cache.stats())}")
+
+    def _send_delta(self, sender, index, content, finish_reason=None, metrics=None):
+        result = {
+            'index': index,
+            'role': 'assistant',
+            'content': content,
+            'finish_reason': finish_reason,
+        }
+        if metrics is not None and self.return_metrics:
+            result['metrics'] = metrics
+        results = np.array([json.dumps(result)], dtype=object)
+        if self.batching:
+            results = results.reshape(1, -1)
+        output_tensors = [
+            pd_utils.Tensor('results', results),
+        ]
+        sender.send(pd_utils.InferenceResponse(output_tensors=output_tensors))
@@ -0,0 +1,184 @@
+import json
+import time
+import numpy as np
+import onnxruntime_genai as og
+
+from bucketing import LengthBucketScheduler
+from fan_out import is_greedy
+
+
+class Sequence:
+    """A single sequence to decode and the result slots it is returned to.
+
+    Parameters
+    ----------
+    prompt_ids : list
+      Token ids of the prompt
+    argument : dict
+      Generation arguments of the sequence
+    targets : list
+      `(request index, result index)` pairs sharing the sequence
+    cache_key : str
+      Response cache key of the result, if it is cached
+    deadline : Deadline
+      Stops the sequence early once its request is cancelled or expired
+    """
+
+    def __init__(self, prompt_ids, argument, targets, cache_key=None, deadline=None):
+        self.prompt_ids = prompt_ids
+        self.argument = argument
+        self.targets = targets
+        self.cache_key = cache_key
+        self.deadline = deadline
+        self.output_ids = []
+        self.finish_reason = None
+        # `time.perf_counter` of the start of prefill, first token and finish
+        self.start_time = None
+        self.first_token_time = None
+        self.end_time = None
+
+
+class BatchScheduler:
+    """Step-wise batched decoding over an onnxruntime-genai model.
+
+    Sequences sharing the same search options are left-padded to a common
+    length and decoded together by one `og.Generator`, one token per step.
+    A sequence retires as soon as it emits EOS or reaches its own
+    `max_tokens`, or when its request is cancelled or past its deadline,
+    and the batch stops once every sequence has retired, so only the newly
+    generated tokens are ever collected. Batches are formed
+    by a `LengthBucketScheduler`, so short prompts are not padded to the
+    length of long ones.
+
+    Parameters
+    ----------
+    model : og.Model
+      Model to decode with
+    tokenizer : og.Tokenizer
+      Tokenizer of the model, used for streaming
+    genai_config : dict
+      Content of `genai_config.json` of the model
+    max_batch_size : int
+      Maximum number of sequences decoded by one generator
+    token_budget : int
+      Maximum number of padded tokens of one generator
+    max_wait : float
+      Seconds a sequence may wait before its batch is decoded first
+    """
+
+    def __init__(self, model, tokenizer, genai_config, max_batch_size=8, token_budget=16384, max_wait=1.0):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.token_budget = token_budget
+        self.max_wait = max_wait
+        model_config = genai_config['model']
+        eos_token_id = model_config['eos_token_id']
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+        self.pad_token_id = model_config.get('pad_token_id', next(iter(self.eos_token_ids)))
+        self.context_length = model_config.get('context_length')
+
+    def run(self, sequences, on_delta=None):
+        """Decode `sequences` in place, calling `on_delta(sequence, text, finish_reason)` on progress."""
+        for batch in self._create_batches(sequences):
+            self._decode(batch, on_delta)
+
+    def _create_batches(self, sequences):
+        # Only sequences with the same search options can share a generator.
+        buckets = LengthBucketScheduler(self.max_batch_size, self.token_budget, self.max_wait)
+        for sequence in sequences:
+            buckets.add(
+                sequence,
+                len(sequence.prompt_ids),
+                sequence.argument['max_tokens'],
+                group=self._search_key(sequence.argument),
+            )
+        yield from buckets.drain()
+
+    def _decode(self, batch, on_delta):
+        # sequences that expired while waiting for their batch are not decoded
+        batch = self._retire_interrupted(batch, on_delta)
+        if not batch:
+            return
+        prompt_length = max(len(s.prompt_ids) for s in batch)
+        max_length = prompt_length + max(s.argument['max_tokens'] for s in batch)
+        if self.context_length:
+            max_length = min(max_length, self.context_length)
+        input_ids = np.full((len(batch), prompt_length), self.pad_token_id, dtype=np.int32)
+        for row, sequence in enumerate(batch):
+            input_ids[row, prompt_length - len(sequence.prompt_ids):] = sequence.prompt_ids
+
+        argument = batch[0].argument
+        params = og.GeneratorParams(self.model)
+        params.set_search_options(
+            do_sample=not is_greedy(argument),
+            max_length=max_length,
+            temperature=argument['temperature'],
+            top_p=argument['top_p'],
+            top_k=argument['top_k'],
+            repetition_penalty=argument['repetition_penalty'],
+        )
+        params.input_ids = input_ids
+
+        start_time = time.perf_counter()
+        for sequence in batch:
+            sequence.start_time = start_time
+        generator = og.Generator(self.model, params)
+        streams = [self.tokenizer.create_stream() for _ in batch] if on_delta else None
+        active = len(batch)
+        while active > 0 and not generator.is_done():
+            generator.compute_logits()
+            generator.generate_next_token()
+            next_tokens = generator.get_next_tokens()
+            token_time = time.perf_counter()
+            for row, sequence in enumerate(batch):
+                if sequence.finish_reason is not None:
+                    continue
+                if sequence.first_token_time is None:
+                    sequence.first_token_time = token_time
+                token = int(next_tokens[row])
+                text = ''
+                if token in self.eos_token_ids:
+                    sequence.finish_reason = 'stop'
+                else:
+                    sequence.output_ids.append(token)
+                    if streams is not None:
+                        text = streams[row].decode(token)
+                    if len(sequence.output_ids) >= sequence.argument['max_tokens']:
+                        sequence.finish_reason = 'length'
+                    elif sequence.deadline is not None:
+                        sequence.finish_reason = sequence.deadline.finish_reason()
+                if sequence.finish_reason is not None:
+                    sequence.end_time = token_time
+                    active -= 1
+                if on_delta and (text or sequence.finish_reason):
+                    on_delta(sequence, text, sequence.finish_reason)
+
+        # sequences cut off by the context length of the model
+        for sequence in batch:
+            if sequence.finish_reason is None:
+                sequence.finish_reason = 'length'
+                sequence.end_time = time.perf_counter()
+                if sequence.first_token_time is None:
+                    sequence.first_token_time = sequence.end_time
+                if on_delta:
+                    on_delta(sequence, '', sequence.finish_reason)
+
+    def _retire_interrupted(self, batch, on_delta):
+        remaining = []
+        for sequence in batch:
+            finish_reason = sequence.deadline.finish_reason() if sequence.deadline is not None else None
+            if finish_reason is None:
+                remaining.append(sequence)
+                continue
+            sequence.finish_reason = finish_reason
+            sequence.start_time = sequence.first_token_time = sequence.end_time = time.perf_counter()
+            if on_delta:
+                on_delta(sequence, '', finish_reason)
+        return remaining
+
+    @staticmethod
+    def _search_key(argument):
+        options = {k: v for k, v in argument.items() if k not in ('max_tokens', 'deadline_ms')}
+        options['do_sample'] = not is_greedy(argument)
+        return json.dumps(options, sort_keys=True)
@@ -0,0 +1,84 @@
+import time
+
+from collections import OrderedDict
+from adapters import resolve_adapter
+
+
+class AdapterCache:
+    """LRU set of LoRA adapters loaded into a single base model.
+
+    An adapter is loaded through the PEFT integration of transformers the
+    first time an argument set names it with `adapter`, and the least
+    recently used one is deleted when more than `capacity` would be loaded.
+    The base weights are shared by all of them, but only one adapter is
+    active at a time, so argument sets of different adapters run one after
+    the other instead of in one batch, unlike the `vllm` runtimes.
+
+    Parameters
+    ----------
+    model : PreTrainedModel
+      Base model the adapters are loaded into
+    directory : str
+      Directory with one sub-directory per adapter
+    capacity : int
+      Maximum number of loaded adapters, adapters are rejected when 0
+    """
+
+    def __init__(self, model, directory, capacity):
+        self.model = model
+        self.directory = directory
+        self.capacity = capacity
+        self.adapters = OrderedDict()
+        self.active = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def resolve(self, argument):
+        """Name and path of the adapter `argument` asks for, None for the base model, ValueError when it cannot be served."""
+        name, path = resolve_adapter(self.directory, argument)
+        if name is not None and self.capacity <= 0:
+            raise ValueError(f"adapter {name} requested, but max_adapters is 0")
+        return name, path
+
+    def activate(self, argument):
+        """Make the adapter of `argument` the active one, or the base model when it names none."""
+        name, path = self.resolve(argument)
+        if name is None:
+            if self.active is not None:
+                self.model.disable_adapters()
+                self.active = None
+            return None
+
+        if name in self.adapters:
+            self.hits += 1
+            self.adapters.move_to_end(name)
+        else:
+            self.misses += 1
+            while len(self.adapters) >= self.capacity:
+                evicted, _ = self.adapters.popitem(last=False)
+                self.model.delete_adapter(evicted)
+                self.evictions += 1
+                if evicted == self.active:
+                    self.active = None
+            start_time = time.perf_counter()
+            self.model.load_adapter(path, adapter_name=name)
+            self.load_seconds += time.perf_counter() - start_time
+            self.adapters[name] = path
+
+        if self.active != name:
+            self.model.set_adapter(name)
+            self.model.enable_adapters()
+            self.active = name
+        return name
+
+    def stats(self):
+        return {
+            'loaded': list(self.adapters),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            # every miss loads an adapter
+            'load_seconds_mean': self.load_seconds / self.misses if self.misses else None,
+        }
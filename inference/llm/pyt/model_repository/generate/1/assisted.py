@@ -0,0 +1,45 @@
+class AssistedStats:
+    """Counts forward passes of the main and draft models during assisted generation.
+
+    transformers does not report how many draft tokens were accepted, so
+    they are derived from forward hooks: every verification step of the
+    main model accepts the matching draft tokens plus one token of its own,
+    and every draft forward pass proposes one token.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+      Main model
+    draft_model : torch.nn.Module
+      Draft model proposing the candidate tokens
+    """
+
+    def __init__(self, model, draft_model):
+        self.target_steps = 0
+        self.draft_steps = 0
+        model.register_forward_hook(self._count_target)
+        draft_model.register_forward_hook(self._count_draft)
+
+    def reset(self):
+        self.target_steps = 0
+        self.draft_steps = 0
+
+    def stats(self, num_tokens):
+        """Stats of the generation since the last `reset` that produced `num_tokens` tokens."""
+        accepted = max(num_tokens - self.target_steps, 0)
+        return {
+            'num_tokens': num_tokens,
+            'target_steps': self.target_steps,
+            'draft_tokens': self.draft_steps,
+            'accepted_tokens': accepted,
+            'acceptance_rate': accepted / self.draft_steps if self.draft_steps else 0.0,
+            # plain greedy decoding runs the main model once per token, so this
+            # bounds the speedup, before the cost of the draft forward passes
+            'tokens_per_target_step': num_tokens / self.target_steps if self.target_steps else 0.0,
+        }
+
+    def _count_target(self, module, inputs, outputs):
+        self.target_steps += 1
+
+    def _count_draft(self, module, inputs, outputs):
+        self.draft_steps += 1
@@ -1,9 +1,30 @@
 import os
+import copy
 import json
+import time
+import queue
+import torch
 import numpy as np
 import triton_python_backend_utils as pd_utils
 
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+from threading import Thread
+from transformers import AutoTokenizer, StoppingCriteriaList, TextIteratorStreamer
+from chat_template import ChatTemplate
+from fan_out import group_arguments, is_greedy, read_fan_out
+from assisted import AssistedStats
+from response_cache import read_response_cache
+from metrics import GenerationMetrics, SequenceTimer, read_return_metrics
+from stopping import DeadlineCriteria, TokenTimer
+from deadline import Deadline
+from model_loader import load_model
+from warmup import read_warmup, run_warmup
+from adapters import adapter_dir, read_max_adapters
+from adapter_cache import AdapterCache
+from context_budget import read_context_budget
+from request_inputs import output_ids_tensor, read_inputs, wants_output_ids
+
+# seconds a streamed sequence waits for its next token, the first one included
+STREAM_TIMEOUT = 600.0
 
 
 class TritonPythonModel:
@@ -28,19 +49,53 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
+        self.decoupled = pd_utils.using_decoupled_model_transaction_policy(self.model_config)
+        self.fan_out = read_fan_out(self.model_config)
+        self.response_cache = read_response_cache(self.model_config)
+        self.metrics = GenerationMetrics(args)
+        self.return_metrics = read_return_metrics(self.model_config)
+
+        config_file = os.path.join(args['model_repository'], args['model_version'], 'model_config.json')
+        with open(config_file, 'r', encoding='utf-8') as in_file:
+            self.config = json.load(in_file)
+
         model_path = os.path.join(args['model_repository'], args['model_version'], 'model')
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            device_map="cuda",
-            torch_dtype="auto",
-            trust_remote_code=True,
+        start_time = time.perf_counter()
+        self.model, cached = load_model(model_path, self.config)
+        pd_utils.Logger.log_info(
+            f"loaded model with profile {json.dumps(self.config)} in {time.perf_counter() - start_time:.2f}s"
+            f"{' from quantization cache' if cached else ''}"
         )
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.pipeline = pipeline(
-            "text-generation",
-            model=self.model,
-            tokenizer=self.tokenizer,
-        )
+
+        # LoRA adapters are loaded into the base model on demand, and only
+        # into float weights, so not into a dynamically quantized model.
+        max_adapters = read_max_adapters(self.model_config)
+        if max_adapters > 0 and self.config.get('quantization', 'none') != 'none':
+            raise pd_utils.TritonModelException("adapters require a model without quantization")
+        self.adapters = AdapterCache(self.model, adapter_dir(args), max_adapters)
+        self.chat_template = ChatTemplate.from_hf_tokenizer(self.tokenizer)
+        self.context_budget = read_context_budget(self.model_config,
+                                                  getattr(self.model.config, 'max_position_embeddings', None),
+                                                  self.chat_template.encode, self.metrics)
+
+        # An optional draft model proposes `num_assistant_tokens` tokens that
+        # the main model verifies in a single forward pass.
+        self.draft_model = None
+        if self.config.get('draft_model_path'):
+            draft_model_path = os.path.join(args['model_repository'], args['model_version'], self.config['draft_model_path'])
+            start_time = time.perf_counter()
+            self.draft_model, cached = load_model(draft_model_path, self.config)
+            pd_utils.Logger.log_info(
+                f"loaded draft model in {time.perf_counter() - start_time:.2f}s"
+                f"{' from quantization cache' if cached else ''}"
+            )
+            self.draft_model.generation_config.num_assistant_tokens = self.config.get('num_assistant_tokens', 5)
+            self.draft_model.generation_config.num_assistant_tokens_schedule = 'constant'
+            self.assisted_stats = AssistedStats(self.model, self.draft_model)
+
+        run_warmup(read_warmup(self.model_config), self._warmup)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -62,35 +117,251 @@ class TritonPythonModel:
           be the same as `requests`
         """
 
+        arrival_time = time.perf_counter()
+        if self.decoupled:
+            for request in requests:
+                self._execute_decoupled(request, arrival_time)
+            self._log_cache_stats()
+            return None
+
         responses = []
         # Every Python backend must iterate over everyone of the requests
         # and create a pb_utils.InferenceResponse for each of them.
         for request in requests:
-            messages = pd_utils.get_input_tensor_by_name(request, 'messages').as_numpy().tolist()
-            messages = [json.loads(msg.decode('utf-8')) for msg in messages]
-            arguments = pd_utils.get_input_tensor_by_name(request, 'arguments').as_numpy().tolist()
-            output_results = []
-            for arg in arguments:
-                argument = json.loads(arg.decode('utf-8'))
-                generation_args = {
-                    'max_new_tokens': argument['max_tokens'],
-                    'temperature': argument['temperature'],
-                    'top_p': argument['top_p'],
-                    'top_k': argument['top_k'],
-                    'repetition_penalty': argument['repetition_penalty'],
-                    'return_full_text': False,
-                    'do_sample': False,
-                }
-                output = self.pipeline(messages, **generation_args)
-                result = {
-                    'role': 'assistant',
-                    'content': output[0]['generated_text'],
-                }
-                output_results.append(json.dumps(result))
+            try:
+                messages, prompt_ids, arguments = read_inputs(request)
+                input_ids = self._create_input_ids(messages, max(a['max_tokens'] for a in arguments), prompt_ids)
+                for argument in arguments:
+                    self.adapters.resolve(argument)
+            except ValueError as e:
+                responses.append(pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(e))))
+                continue
+            output_results = [None] * len(arguments)
+            result_ids = [[] for _ in arguments]
+            groups = []
+            for argument, indices in group_arguments(arguments, self.fan_out):
+                cached = self._cache_get(messages, argument, prompt_ids)
+                if cached is None:
+                    groups.append((argument, indices))
+                    continue
+                for j in indices:
+                    result = {
+                        'role': 'assistant',
+                        'content': cached['content'],
+                        'finish_reason': cached['finish_reason'],
+                    }
+                    output_results[j] = json.dumps(result)
+                    result_ids[j] = cached.get('output_ids', [])
+            past_key_values = self._prefill(input_ids, groups)
+            for argument, indices in groups:
+                self._activate_adapter(argument)
+                timer = SequenceTimer(arrival_time)
+                deadline = Deadline.for_request(request, argument, start_time=arrival_time)
+                generation_args = self._create_generation_args(argument, past_key_values, timer, deadline)
+                timer.mark_start()
+                output_ids = self.model.generate(input_ids, **generation_args)
+                timer.mark_end()
+                num_tokens = output_ids.shape[1] - input_ids.shape[1]
+                assisted = self._assisted_stats(generation_args, num_tokens)
+                stats = self._record_stats(timer, input_ids, num_tokens)
+                generated_ids = output_ids[0][input_ids.shape[1]:].tolist()
+                content = self.tokenizer.decode(generated_ids, skip_special_tokens=True)
+                finish_reason = self._finish_reason(argument, num_tokens, deadline)
+                self._cache_put(messages, argument, content, finish_reason, prompt_ids, generated_ids)
+                for j in indices:
+                    result = {
+                        'role': 'assistant',
+                        'content': content,
+                        'finish_reason': finish_reason,
+                    }
+                    if assisted is not None:
+                        result['assisted'] = assisted
+                    if self.return_metrics:
+                        result['metrics'] = stats
+                    output_results[j] = json.dumps(result)
+                    result_ids[j] = generated_ids
             output_tensors = [
                 pd_utils.Tensor('results', np.array(output_results, dtype=object)),
             ]
+            if wants_output_ids(request):
+                output_tensors.append(output_ids_tensor(result_ids))
             response = pd_utils.InferenceResponse(output_tensors=output_tensors)
             responses.append(response)
 
+        self._log_cache_stats()
         return responses
+
+    def _execute_decoupled(self, request, arrival_time):
+        # every failure ends the stream with an error, so the client is
+        # never left waiting for its final response
+        sender = request.get_response_sender()
+        try:
+            self._stream_results(request, sender, arrival_time)
+            sender.send(flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+        except Exception as e:
+            response = pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(e)))
+            sender.send(response, flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+
+    def _stream_results(self, request, sender, arrival_time):
+        messages, prompt_ids, arguments = read_inputs(request)
+        input_ids = self._create_input_ids(messages, max(a['max_tokens'] for a in arguments), prompt_ids)
+        for argument in arguments:
+            self.adapters.resolve(argument)
+        groups = []
+        for argument, indices in group_arguments(arguments, self.fan_out):
+            cached = self._cache_get(messages, argument, prompt_ids)
+            if cached is None:
+                groups.append((argument, indices))
+                continue
+            for j in indices:
+                self._send_delta(sender, j, cached['content'], cached['finish_reason'])
+        past_key_values = self._prefill(input_ids, groups)
+        for argument, indices in groups:
+            self._activate_adapter(argument)
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                            timeout=STREAM_TIMEOUT)
+            timer = SequenceTimer(arrival_time)
+            deadline = Deadline.for_request(request, argument, sender, arrival_time)
+            generation_args = self._create_generation_args(argument, past_key_values, timer, deadline)
+            generation_args['streamer'] = streamer
+            outputs = {}
+            thread = Thread(target=self._generate_into, args=(input_ids, generation_args, outputs))
+            timer.mark_start()
+            thread.start()
+            content = ''
+            try:
+                for text in streamer:
+                    content += text
+                    if text:
+                        for j in indices:
+                            self._send_delta(sender, j, text)
+            except Exception as e:
+                # the decode stops at its next step instead of running on
+                deadline.cancel()
+                thread.join()
+                if isinstance(e, queue.Empty):
+                    raise TimeoutError(f"no token generated in {STREAM_TIMEOUT}s") from e
+                raise
+            thread.join()
+            timer.mark_end()
+            if 'error' in outputs:
+                raise outputs['error']
+            num_tokens = outputs['ids'].shape[1] - input_ids.shape[1]
+            finish_reason = self._finish_reason(argument, num_tokens, deadline)
+            assisted = self._assisted_stats(generation_args, num_tokens)
+            stats = self._record_stats(timer, input_ids, num_tokens)
+            generated_ids = outputs['ids'][0][input_ids.shape[1]:].tolist()
+            self._cache_put(messages, argument, content, finish_reason, prompt_ids, generated_ids)
+            for j in indices:
+                self._send_delta(sender, j, '', finish_reason, assisted, stats)
+
+    def _generate_into(self, input_ids, generation_args, outputs):
+        # runs in its own thread, so a failure is kept for the streaming loop
+        # and ends the streamer, which would otherwise wait for more text
+        try:
+            outputs['ids'] = self.model.generate(input_ids, **generation_args)
+        except Exception as e:
+            outputs['error'] = e
+            generation_args['streamer'].end()
+
+    def _warmup(self, messages, argument):
+        input_ids = self._create_input_ids(messages, argument['max_tokens'])
+        self._activate_adapter(argument)
+        self.model.generate(input_ids, **self._create_generation_args(argument))
+
+    def _prefill(self, input_ids, groups):
+        # Decoding is greedy, so identical argument sets share one decode.
+        # When several distinct argument sets remain, run the prefill of the
+        # prompt once and give each decode its own copy of the KV cache.
+        # Assisted generation manages its own cache, so it starts from scratch.
+        # The cache depends on the adapter, so it is only shared when every
+        # argument set asks for the same one.
+        if not self.fan_out or len(groups) < 2 or self.draft_model is not None:
+            return None
+        if len({argument.get('adapter') for argument, _ in groups}) > 1:
+            return None
+        self._activate_adapter(groups[0][0])
+        with torch.no_grad():
+            outputs = self.model(input_ids[:, :-1], use_cache=True)
+        return outputs.past_key_values
+
+    def _activate_adapter(self, argument):
+        misses = self.adapters.misses
+        self.adapters.activate(argument)
+        if self.adapters.misses > misses:
+            pd_utils.Logger.log_info(f"adapter cache stats: {json.dumps(self.adapters.stats())}")
+
+    def _create_input_ids(self, messages, max_tokens, prompt_ids=None):
+        _, input_ids = self.context_budget.fit(messages, max_tokens, prompt_ids)
+        return torch.tensor([input_ids], dtype=torch.long, device=self.model.device)
+
+    def _create_generation_args(self, argument, past_key_values=None, timer=None, deadline=None):
+        generation_args = {
+            'max_new_tokens': argument['max_tokens'],
+            'temperature': argument['temperature'],
+            'top_p': argument['top_p'],
+            'top_k': argument['top_k'],
+            'repetition_penalty': argument['repetition_penalty'],
+            'do_sample': False,
+        }
+        if past_key_values is not None:
+            generation_args['past_key_values'] = copy.deepcopy(past_key_values)
+        stopping_criteria = StoppingCriteriaList()
+        if timer is not None:
+            stopping_criteria.append(TokenTimer(timer))
+        if deadline is not None:
+            stopping_criteria.append(DeadlineCriteria(deadline))
+        if stopping_criteria:
+            generation_args['stopping_criteria'] = stopping_criteria
+        if self.draft_model is not None and (is_greedy(argument) or not self.config.get('assisted_greedy_only', True)):
+            generation_args['assistant_model'] = self.draft_model
+            self.assisted_stats.reset()
+        return generation_args
+
+    def _finish_reason(self, argument, num_tokens, deadline):
+        if num_tokens >= argument['max_tokens']:
+            return 'length'
+        return deadline.finish_reason() or 'stop'
+
+    def _cache_get(self, messages, argument, prompt_ids=None):
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(self.response_cache.key(messages, argument, prompt_ids))
+
+    def _cache_put(self, messages, argument, content, finish_reason, prompt_ids=None, output_ids=None):
+        if self.response_cache is None:
+            return
+        result = {'content': content, 'finish_reason': finish_reason, 'output_ids': output_ids or []}
+        self.response_cache.put(self.response_cache.key(messages, argument, prompt_ids), result)
+
+    def _log_cache_stats(self):
+        if self.response_cache is not None:
+            pd_utils.Logger.log_info(f"response cache stats: {json.dumps(self.response_cache.stats())}")
+
+    def _record_stats(self, timer, input_ids, num_tokens):
+        stats = timer.stats(input_ids.shape[1], num_tokens)
+        self.metrics.record(stats)
+        return stats
+
+    def _assisted_stats(self, generation_args, num_tokens):
+        if 'assistant_model' not in generation_args:
+            return None
+        stats = self.assisted_stats.stats(num_tokens)
+        pd_utils.Logger.log_info(f"assisted generation stats: {json.dumps(stats)}")
+        return stats
+
+    def _send_delta(self, sender, index, content, finish_reason=None, assisted=None, metrics=None):
+        result = {
+            'index': index,
+            'role': 'assistant',
+            'content': content,
+            'finish_reason': finish_reason,
+        }
+        if assisted is not None:
+            result['assisted'] = assisted
+        if metrics is not None and self.return_metrics:
+            result['metrics'] = metrics
+        output_tensors = [
+            pd_utils.Tensor('results', np.array([json.dumps(result)], dtype=object)),
+        ]
+        sender.send(pd_utils.InferenceResponse(output_tensors=output_tensors))
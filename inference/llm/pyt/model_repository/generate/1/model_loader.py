@@ -0,0 +1,159 @@
+import os
+import json
+import hashlib
+import logging
+import torch
+import transformers
+
+from transformers import AutoModelForCausalLM
+
+logger = logging.getLogger(__name__)
+
+DTYPES = {
+    'auto': 'auto',
+    'fp32': torch.float32,
+    'bf16': torch.bfloat16,
+    'fp16': torch.float16,
+}
+
+
+def load_model(model_path, config):
+    """Load the causal LM under `model_path` with the execution profile in `config`.
+
+    The profile is read from `model_config.json` and has the keys:
+      * device: `cuda` or `cpu`
+      * dtype: `auto`, `fp32`, `bf16` or `fp16`
+      * quantization: `none`, or `int8` for dynamic quantization of the
+        Linear layers on CPU
+      * num_threads: number of intra-op threads on CPU, 0 keeps the default
+      * quantization_cache_dir: directory of quantized models, defaults to
+        `model_path`, where the image build puts the model it quantized
+
+    Returns the model and whether it was loaded from the quantization cache.
+    """
+    device = config.get('device', 'cuda')
+    dtype = config.get('dtype', 'auto')
+    quantization = config.get('quantization', 'none')
+    if device == 'cuda':
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            device_map='cuda',
+            torch_dtype=DTYPES[dtype],
+            trust_remote_code=True,
+        )
+        return model, False
+
+    if config.get('num_threads', 0) > 0:
+        torch.set_num_threads(config['num_threads'])
+    if quantization == 'none':
+        return _load_cpu_model(model_path, DTYPES[dtype]), False
+    if quantization != 'int8':
+        raise ValueError(f"unsupported quantization: {quantization}")
+
+    # Dynamic quantization replaces float32 Linear layers only, so the rest
+    # of the model stays in float32 whatever dtype is configured.
+    cache_dir = config.get('quantization_cache_dir') or model_path
+    cache_dirs = list(dict.fromkeys([model_path, cache_dir]))
+    # A quantized model is found by the names, sizes and modification times
+    # of the model files, which its manifest records, so a server finds the
+    # model quantized at build time without reading the whole model. Only
+    # when none matches are the contents hashed, to find a model quantized
+    # from the same files elsewhere, e.g. by another image.
+    stat_key = _fingerprint(model_path)
+    for cached_file in _find_manifests(cache_dirs, stat_key):
+        model = _load_quantized(cached_file)
+        if model is not None:
+            return model, True
+
+    content_key = _fingerprint(model_path, contents=True)
+    for directory in cache_dirs:
+        cached_file = os.path.join(directory, f'quantized-int8-{content_key}.pt')
+        model = _load_quantized(cached_file) if os.path.exists(cached_file) else None
+        if model is not None:
+            _save_manifest(cached_file, stat_key)
+            return model, True
+
+    model = _load_cpu_model(model_path, torch.float32)
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    cache_file = os.path.join(cache_dir, f'quantized-int8-{content_key}.pt')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        torch.save(model, f'{cache_file}.tmp')
+        os.replace(f'{cache_file}.tmp', cache_file)
+        _save_manifest(cache_file, stat_key)
+    except OSError as e:
+        logger.warning(f"failed to save quantized model to {cache_file}: {e}")
+    return model, False
+
+
+def _load_cpu_model(model_path, torch_dtype):
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        device_map='cpu',
+        torch_dtype=torch_dtype,
+        trust_remote_code=True,
+    )
+    model.eval()
+    return model
+
+
+def _load_quantized(cached_file):
+    try:
+        model = torch.load(cached_file, map_location='cpu', weights_only=False)
+        model.eval()
+        return model
+    except Exception as e:
+        logger.warning(f"failed to load quantized model from {cached_file}: {e}")
+        return None
+
+
+def _find_manifests(cache_dirs, stat_key):
+    # quantized models whose manifest records `stat_key`
+    cached_files = []
+    for directory in cache_dirs:
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith('quantized-int8-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as in_file:
+                    manifest = json.load(in_file)
+            except (OSError, ValueError):
+                continue
+            cached_file = os.path.join(directory, f'{name[:-len(".json")]}.pt')
+            if manifest.get('stat_key') == stat_key and os.path.exists(cached_file):
+                cached_files.append(cached_file)
+    return cached_files
+
+
+def _save_manifest(cached_file, stat_key):
+    manifest_file = f'{os.path.splitext(cached_file)[0]}.json'
+    try:
+        with open(f'{manifest_file}.tmp', 'w', encoding='utf-8') as out_file:
+            json.dump({'stat_key': stat_key}, out_file)
+        os.replace(f'{manifest_file}.tmp', manifest_file)
+    except OSError as e:
+        logger.warning(f"failed to save quantization manifest to {manifest_file}: {e}")
+
+
+def _fingerprint(model_path, contents=False):
+    # A cached model is only valid for the same model files and library
+    # versions. Files are told apart by name, size and modification time,
+    # or by their contents, since fine-tunes of the same base model have
+    # files of the same names and sizes.
+    h = hashlib.blake2b(digest_size=8)
+    h.update(json.dumps([torch.__version__, transformers.__version__]).encode('utf-8'))
+    for name in sorted(os.listdir(model_path)):
+        path = os.path.join(model_path, name)
+        if not os.path.isfile(path) or name.startswith('quantized-'):
+            continue
+        if not contents:
+            stat = os.stat(path)
+            h.update(json.dumps([name, stat.st_size, stat.st_mtime_ns]).encode('utf-8'))
+            continue
+        h.update(json.dumps([name, os.path.getsize(path)]).encode('utf-8'))
+        with open(path, 'rb') as in_file:
+            for chunk in iter(lambda: in_file.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
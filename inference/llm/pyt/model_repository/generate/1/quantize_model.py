@@ -0,0 +1,48 @@
+import os
+import json
+import argparse
+import logging
+
+from model_loader import load_model
+
+logging.basicConfig(format="%(levelname)s: %(asctime)s %(message)s",
+                    datefmt="%m/%d/%Y %I:%M:%S %p",
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def quantize(model_path, config):
+    _, cached = load_model(model_path, config)
+    prefix = f"quantized-{config['quantization']}-"
+    if not any(name.startswith(prefix) and name.endswith(".pt") for name in os.listdir(model_path)):
+        raise RuntimeError(f"failed to save the {config['quantization']} model to {model_path}")
+    logger.info(f"{'found' if cached else 'saved'} {config['quantization']} model of {model_path} "
+                f"in the quantization cache")
+
+
+def main():
+    # Quantizes the model of a model version, and its draft model if it has
+    # one, at image build time, with the torch and transformers of the image,
+    # so that servers load them from the quantization cache instead of
+    # quantizing them on every start.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--version_dir", type=str, help="model version directory",
+                        default=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+
+    with open(os.path.join(args.version_dir, "model_config.json"), "r", encoding="utf-8") as in_file:
+        config = json.load(in_file)
+    if config.get("device", "cuda") != "cpu" or config.get("quantization", "none") == "none":
+        logger.info("model is not quantized, skip")
+        return
+
+    # the quantized models are kept next to the models, in the image
+    config["quantization_cache_dir"] = ""
+    quantize(os.path.join(args.version_dir, "model"), config)
+    if config.get("draft_model_path"):
+        # the draft model is loaded with the profile of the model
+        quantize(os.path.join(args.version_dir, config["draft_model_path"]), config)
+
+
+if __name__ == "__main__":
+    main()
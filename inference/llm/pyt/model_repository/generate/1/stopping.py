@@ -0,0 +1,37 @@
+import torch
+
+from transformers import StoppingCriteria
+
+
+class TokenTimer(StoppingCriteria):
+    """Stopping criteria that never stops, used to time the first generated token.
+
+    Parameters
+    ----------
+    timer : SequenceTimer
+      Timer of the sequence being generated
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.timer.mark_token()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+class DeadlineCriteria(StoppingCriteria):
+    """Stopping criteria that stops once the request is cancelled or its deadline has passed.
+
+    Parameters
+    ----------
+    deadline : Deadline
+      Deadline of the sequence being generated
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stop = self.deadline.finish_reason() is not None
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
@@ -17,9 +17,19 @@ cd ./tmp/
 export MODEL_ID=$(cat ./config.json | jq -r '.model.id')
 export MODEL_TYPE=$(cat ./config.json | jq -r '.model.type')
 export MODEL_ARTIFACT_PATH=$(cat ./config.json | jq -r '.model.artifact_path')
+export MODEL_DEVICE=$(cat ./config.json | jq -r '.model.device // "cuda"')
+export MODEL_DTYPE=$(cat ./config.json | jq -r '.model.dtype // "auto"')
+export MODEL_QUANTIZATION=$(cat ./config.json | jq -r '.model.quantization // "none"')
+export MODEL_NUM_THREADS=$(cat ./config.json | jq -r '.model.num_threads // 0')
+export MODEL_QUANTIZATION_CACHE_DIR=$(cat ./config.json | jq -r '.model.quantization_cache_dir // ""')
+export MODEL_DRAFT_ID=$(cat ./config.json | jq -r '.model.draft_id // ""')
+export MODEL_DRAFT_ARTIFACT_PATH=$(cat ./config.json | jq -r '.model.draft_artifact_path // ""')
+export MODEL_NUM_ASSISTANT_TOKENS=$(cat ./config.json | jq -r '.model.num_assistant_tokens // 5')
+export MODEL_ASSISTED_GREEDY_ONLY=$(cat ./config.json | jq -r '.model.assisted_greedy_only != false')
 export MODEL_SUBSCRIPTION_ID=$(cat ./config.json | jq -r '.model.subscription_id')
 export MODEL_RESOURCE_GROUP=$(cat ./config.json | jq -r '.model.resource_group')
 export MODEL_WORKSPACE_NAME=$(cat ./config.json | jq -r '.model.workspace_name')
+export MODEL_ADAPTERS=$(cat ./config.json | jq -c '.model.adapters // []')
 
 export IMAGE_NAME=$(cat ./config.json | jq -r '.image.name')
 export IMAGE_TAG_PREFIX=$(cat ./config.json | jq -r '.image.tag_prefix')
@@ -30,6 +40,15 @@ export IMAGE_REGISTRY_SERVER=$(cat ./config.json | jq -r '.image.registry_server
 echo "model id                  = $MODEL_ID"
 echo "model type                = $MODEL_TYPE"
 echo "model artifact path       = $MODEL_ARTIFACT_PATH"
+echo "model device              = $MODEL_DEVICE"
+echo "model dtype               = $MODEL_DTYPE"
+echo "model quantization        = $MODEL_QUANTIZATION"
+echo "model # threads           = $MODEL_NUM_THREADS"
+echo "model quantization cache  = $MODEL_QUANTIZATION_CACHE_DIR"
+echo "model draft id            = $MODEL_DRAFT_ID"
+echo "model draft artifact path = $MODEL_DRAFT_ARTIFACT_PATH"
+echo "model # assistant tokens  = $MODEL_NUM_ASSISTANT_TOKENS"
+echo "model assisted greedy     = $MODEL_ASSISTED_GREEDY_ONLY"
 echo "model subscription id     = $MODEL_SUBSCRIPTION_ID"
 echo "model resource group      = $MODEL_RESOURCE_GROUP"
 echo "model workspace name      = $MODEL_WORKSPACE_NAME"
@@ -53,10 +72,57 @@ az ml model download \
 --resource-group $MODEL_RESOURCE_GROUP \
 --subscription-id $MODEL_SUBSCRIPTION_ID
 
+mkdir ./adapters
+for ADAPTER in $(echo $MODEL_ADAPTERS | jq -c '.[]'); do
+  ADAPTER_NAME=$(echo $ADAPTER | jq -r '.name')
+  mkdir ./adapters/$ADAPTER_NAME
+  az ml model download \
+  --model-id $(echo $ADAPTER | jq -r '.id') \
+  --target-dir ./adapters/$ADAPTER_NAME/ \
+  --workspace-name $MODEL_WORKSPACE_NAME \
+  --resource-group $MODEL_RESOURCE_GROUP \
+  --subscription-id $MODEL_SUBSCRIPTION_ID
+done
+
+if [ -n "$MODEL_DRAFT_ID" ]; then
+  mkdir ./draft
+  az ml model download \
+  --model-id $MODEL_DRAFT_ID \
+  --target-dir ./draft/ \
+  --workspace-name $MODEL_WORKSPACE_NAME \
+  --resource-group $MODEL_RESOURCE_GROUP \
+  --subscription-id $MODEL_SUBSCRIPTION_ID
+fi
+
 mkdir ./build
 cp -r ../Dockerfile ./build/Dockerfile
 cp -r ../model_repository ./build/model_repository
 cp -r ./model/$MODEL_ARTIFACT_PATH/* ./build/model_repository/generate/1/model/
+cp -r ../../common/* ./build/model_repository/generate/1/
+# every adapter is served from its own directory, named as requests refer to it
+for ADAPTER in $(echo $MODEL_ADAPTERS | jq -c '.[]'); do
+  ADAPTER_NAME=$(echo $ADAPTER | jq -r '.name')
+  mkdir -p ./build/model_repository/generate/1/adapters/$ADAPTER_NAME/
+  cp -r ./adapters/$ADAPTER_NAME/$(echo $ADAPTER | jq -r '.artifact_path')/* ./build/model_repository/generate/1/adapters/$ADAPTER_NAME/
+done
+if [ -n "$MODEL_DRAFT_ID" ]; then
+  mkdir -p ./build/model_repository/generate/1/draft/
+  cp -r ./draft/$MODEL_DRAFT_ARTIFACT_PATH/* ./build/model_repository/generate/1/draft/
+  export MODEL_DRAFT_PATH=draft
+fi
+
+python ../update_template.py \
+--input_file ./build/model_repository/generate/1/model_config.json.tmpl \
+--output_file ./build/model_repository/generate/1/model_config.json \
+--device $MODEL_DEVICE \
+--dtype $MODEL_DTYPE \
+--quantization $MODEL_QUANTIZATION \
+--num_threads $MODEL_NUM_THREADS \
+${MODEL_QUANTIZATION_CACHE_DIR:+--quantization_cache_dir $MODEL_QUANTIZATION_CACHE_DIR} \
+--num_assistant_tokens $MODEL_NUM_ASSISTANT_TOKENS \
+--assisted_greedy_only $MODEL_ASSISTED_GREEDY_ONLY \
+${MODEL_DRAFT_PATH:+--draft_model_path $MODEL_DRAFT_PATH}
+rm ./build/model_repository/generate/1/model_config.json.tmpl
 
 cd ./build
 docker build -t custom_image:latest .
@@ -66,7 +132,16 @@ docker run --rm -d --shm-size 1g \
   -p8000:8000 -p8001:8001 -p8002:8002 \
   custom_image:latest \
   tritonserver --model-repository=/model_repository
-sleep 20
+# models run their warmup while loading, so the server is only ready after it
+SECONDS=0
+until curl -sf -o /dev/null localhost:8000/v2/health/ready; do
+  if [ $SECONDS -ge 900 ]; then
+    echo "server not ready after $SECONDS seconds"
+    exit 1
+  fi
+  sleep 5
+done
+echo "server ready after $SECONDS seconds"
 curl -v localhost:8000/v2/health/ready
 
 az account set --subscription $MODEL_SUBSCRIPTION_ID
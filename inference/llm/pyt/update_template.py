@@ -0,0 +1,50 @@
+import argparse
+import logging
+from string import Template
+
+logging.basicConfig(format="%(levelname)s: %(asctime)s %(message)s",
+                    datefmt="%m/%d/%Y %I:%M:%S %p",
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_file", type=str, help="input file")
+    parser.add_argument("--output_file", type=str, help="output file")
+    parser.add_argument("--device", type=str, help="device, cuda or cpu", required=False)
+    parser.add_argument("--dtype", type=str, help="dtype, auto, fp32, bf16 or fp16", required=False)
+    parser.add_argument("--quantization", type=str, help="quantization, none or int8", required=False)
+    parser.add_argument("--num_threads", type=int, help="number of cpu threads", required=False)
+    parser.add_argument("--quantization_cache_dir", type=str, help="quantized model cache directory", required=False)
+    parser.add_argument("--draft_model_path", type=str, help="draft model path for assisted generation", required=False)
+    parser.add_argument("--num_assistant_tokens", type=int, help="draft lookahead tokens", required=False)
+    parser.add_argument("--assisted_greedy_only", type=str, help="whether to assist greedy requests only", required=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    logger.info(f"load template file from: {args.input_file}")
+    with open(args.input_file, "r", encoding="utf-8") as in_file:
+        tmpl = in_file.read()
+
+    replaces = {
+        "device": args.device or "cuda",
+        "dtype": args.dtype or "auto",
+        "quantization": args.quantization or "none",
+        "num_threads": args.num_threads or 0,
+        "quantization_cache_dir": args.quantization_cache_dir or "",
+        "draft_model_path": args.draft_model_path or "",
+        "num_assistant_tokens": args.num_assistant_tokens or 5,
+        "assisted_greedy_only": "false" if args.assisted_greedy_only == "false" else "true",
+    }
+
+    t = Template(tmpl)
+    res = t.substitute(replaces)
+
+    logger.info(f"save updated file to {args.output_file}")
+    with open(args.output_file, "w", encoding="utf-8") as out_file:
+        out_file.write(res)
+
+
+if __name__ == "__main__":
+    main()
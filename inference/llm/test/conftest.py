@@ -0,0 +1,32 @@
+import importlib.util
+import os
+import sys
+import uuid
+
+import pytest
+
+LLM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(LLM_DIR, 'common'))
+sys.path.append(os.path.join(LLM_DIR, '../llm_test'))
+
+# the common modules and the models import the utils of the Triton Python
+# backend, which the in-process backend of the test clients provides
+import inprocess_backend  # noqa: E402
+
+sys.modules.setdefault('triton_python_backend_utils', inprocess_backend)
+
+
+@pytest.fixture
+def import_model():
+    """Imports `model.py` of a runtime, with the other modules of its version importable."""
+    def load(runtime):
+        version_dir = os.path.join(LLM_DIR, runtime, 'model_repository/generate/1')
+        if version_dir not in sys.path:
+            sys.path.insert(0, version_dir)
+        spec = importlib.util.spec_from_file_location(f'{runtime}_model_{uuid.uuid4().hex}',
+                                                      os.path.join(version_dir, 'model.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
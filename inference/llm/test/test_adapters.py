@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import inprocess_backend as pd_utils
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'pyt/model_repository/generate/1'))
+from adapter_cache import AdapterCache  # noqa: E402
+
+ARGUMENT = {'max_tokens': 8, 'temperature': 0.0, 'top_p': 1.0, 'top_k': 1, 'repetition_penalty': 1.0}
+
+
+def make_request(adapter=None):
+    argument = {**ARGUMENT, 'adapter': adapter} if adapter else ARGUMENT
+    return pd_utils.InferenceRequest([
+        pd_utils.Tensor('messages', np.array([json.dumps({'role': 'user', 'content': 'Hi'}).encode('utf-8')],
+                                             dtype=object)),
+        pd_utils.Tensor('arguments', np.array([json.dumps(argument).encode('utf-8')], dtype=object)),
+    ])
+
+
+class ContextBudget:
+
+    def fit(self, messages, max_tokens, prompt_ids=None):
+        return messages, [1, 2, 3]
+
+
+@pytest.fixture
+def adapters(tmp_path):
+    os.makedirs(tmp_path / 'known')
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('name', ['unknown', '../known', None])
+def test_adapter_cache_resolve(adapters, name):
+    cache = AdapterCache(model=None, directory=adapters, capacity=1)
+    assert cache.resolve({'adapter': 'known'}) == ('known', os.path.join(adapters, 'known'))
+    if name is None:
+        assert cache.resolve({}) == (None, None)
+        with pytest.raises(ValueError, match='max_adapters is 0'):
+            AdapterCache(model=None, directory=adapters, capacity=0).resolve({'adapter': 'known'})
+    else:
+        with pytest.raises(ValueError, match=f'unknown adapter {name}'):
+            cache.resolve({'adapter': name})
+
+
+@pytest.mark.parametrize('decoupled', [False, True])
+def test_vllm_unknown_adapter_in_batch(import_model, adapters, decoupled):
+    # the vllm runtime directory would import as an empty namespace package
+    pytest.importorskip('vllm.sampling_params')
+    module = import_model('vllm')
+    model = module.TritonPythonModel.__new__(module.TritonPythonModel)
+    model.fan_out = False
+    model.response_cache = None
+    model.context_budget = ContextBudget()
+    model.max_adapters = 1
+    model.adapter_dir = adapters
+    model.adapter_ids = {}
+
+    requests = [make_request(), make_request('unknown'), make_request('known')]
+    senders = [request.get_response_sender() for request in requests] if decoupled else None
+    prompts, _, slots, _, output_results = model._collect_requests(requests, senders, start_time=0.0)
+
+    # the request with the unknown adapter gets its own error, the others are generated
+    assert len(prompts) == 2 and [slot[0] for slot in slots] == [0, 2]
+    assert slots[0][4] is None and slots[1][4].lora_name == 'known'
+    assert isinstance(output_results[1], ValueError)
+    assert output_results[0] == output_results[2] == [None]
+    if decoupled:
+        assert senders[1] is None
+        (_, response), = requests[1].sender.responses
+        assert response.error().message() == 'unknown adapter unknown'
+        assert requests[1].sender.done.is_set()
+        assert not requests[0].sender.responses and not requests[2].sender.responses
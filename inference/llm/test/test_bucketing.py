@@ -0,0 +1,67 @@
+import pytest
+from bucketing import LengthBucketScheduler, bucket_of
+
+BOUNDARIES = (64, 128, 256)
+
+
+@pytest.mark.parametrize("input, expected", [
+    (1, 64),
+    (64, 64),
+    (65, 128),
+    (256, 256),
+    # past the last boundary, the next power of two
+    (257, 512),
+    (1024, 1024),
+    (1025, 2048),
+])
+def test_bucket_of(input, expected):
+    assert bucket_of(input, BOUNDARIES) == expected
+
+
+@pytest.mark.parametrize("input, expected", [
+    # (prompt length, max tokens) of the pending items, batches in the order they are served
+    ([(10, 16), (500, 16), (20, 16)], [[0, 2], [1]]),
+    ([(10, 16), (10, 500), (10, 16)], [[0, 2], [1]]),
+    # the bucket with the cheapest head goes first
+    ([(500, 16), (10, 16)], [[1], [0]]),
+    # at most max_batch_size items a batch
+    ([(10, 16)] * 5, [[0, 1, 2], [3, 4]]),
+])
+def test_next_batch(input, expected):
+    scheduler = LengthBucketScheduler(max_batch_size=3, token_budget=4096, max_wait=10.0)
+    for i, (prompt_length, max_tokens) in enumerate(input):
+        scheduler.add(i, prompt_length, max_tokens, now=0.0)
+    assert len(scheduler) == len(input)
+    assert [scheduler.next_batch(now=1.0) for _ in expected] == expected
+    assert len(scheduler) == 0 and scheduler.next_batch() == []
+
+
+def test_token_budget():
+    # the padded size of a batch is its size times the longest prompt plus the largest max_tokens
+    scheduler = LengthBucketScheduler(max_batch_size=8, token_budget=200)
+    for i, prompt_length in enumerate([40, 60, 60, 60]):
+        scheduler.add(i, prompt_length, 40, now=0.0)
+    assert list(scheduler.drain()) == [[0, 1], [2, 3]]
+
+    # a single item over the budget is still served on its own
+    scheduler.add('long', 1000, 1000, now=0.0)
+    assert scheduler.next_batch(now=0.0) == ['long']
+
+
+def test_max_wait():
+    scheduler = LengthBucketScheduler(max_batch_size=8, token_budget=4096, max_wait=1.0)
+    scheduler.add('expensive', 500, 16, now=0.0)
+    scheduler.add('cheap', 10, 16, now=0.5)
+    assert scheduler.next_batch(now=1.0) == ['cheap']
+    scheduler.add('cheap', 10, 16, now=1.0)
+    # the oldest item waited longer than max_wait, so its bucket goes first
+    assert scheduler.next_batch(now=1.5) == ['expensive']
+    assert scheduler.next_batch(now=1.5) == ['cheap']
+
+
+def test_groups():
+    # items of different groups, e.g. search options, are never batched together
+    scheduler = LengthBucketScheduler(max_batch_size=8, token_budget=4096)
+    for i, group in enumerate(['greedy', 'sampled', 'greedy']):
+        scheduler.add(i, 10, 16, group=group, now=0.0)
+    assert sorted(scheduler.drain()) == [[0, 2], [1]]
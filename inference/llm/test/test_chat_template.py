@@ -0,0 +1,82 @@
+import re
+
+import pytest
+from chat_template import ChatTemplate
+
+MESSAGES = [
+    {'role': 'system', 'content': 'Be brief.'},
+    {'role': 'user', 'content': 'hello world'},
+    {'role': 'assistant', 'content': 'Hi there.'},
+    {'role': 'user', 'content': 'how are you?'},
+]
+
+
+class CharTokenizer:
+    """Encodes every character on its own, so the ids of joined text are the joined ids."""
+
+    def encode(self, text):
+        return [ord(c) for c in text]
+
+
+class SentencePieceTokenizer:
+    """Encodes words like SentencePiece, which prefixes '▁' to the start of every encoded text."""
+
+    def __init__(self):
+        self.vocab = {}
+
+    def encode(self, text):
+        pieces = re.findall(r'<\|[a-z]+\|>|\s+|[^\s<]+|<', text)
+        pieces = ['▁' + pieces[0]] + pieces[1:] if pieces else []
+        return [self.vocab.setdefault(piece, len(self.vocab)) for piece in pieces]
+
+
+@pytest.mark.parametrize("input, expected", [
+    (CharTokenizer(), True),
+    (SentencePieceTokenizer(), False),
+])
+def test_encode(input, expected):
+    template = ChatTemplate(None, input.encode, bos_ids=[1])
+    assert template.incremental == expected
+    assert template.encode(MESSAGES) == [1] + input.encode(template.format(MESSAGES))
+
+
+LLAMA3_TEMPLATE = (
+    "{% for message in messages %}"
+    "{{ '<|start_header_id|>' + message['role'] + '<|end_header_id|>\n\n' + message['content'] + '<|eot_id|>' }}"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}{{ '<|start_header_id|>assistant<|end_header_id|>\n\n' }}{% endif %}"
+)
+CHATML_TEMPLATE = (
+    "{% for message in messages %}"
+    "{{ '<|im_start|>' + message['role'] + '\n' + message['content'] + '<|im_end|>\n' }}"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}{{ '<|im_start|>assistant\n' }}{% endif %}"
+)
+
+
+@pytest.mark.parametrize("input, expected", [
+    (None, '<|end|>'),
+    (LLAMA3_TEMPLATE, '<|eot_id|>'),
+    (CHATML_TEMPLATE, '<|im_end|>'),
+    # content that is not rendered verbatim cannot be split into markers
+    ("{% for message in messages %}{{ message['content'] | upper }}{% endfor %}", None),
+])
+def test_end_of_turn(input, expected):
+    assert ChatTemplate(input, CharTokenizer().encode).end_of_turn == expected
+
+
+@pytest.mark.parametrize("input", [
+    'microsoft/Phi-3-mini-4k-instruct',
+    'TinyLlama/TinyLlama-1.1B-Chat-v1.0',
+])
+def test_encode_hf_tokenizer(input):
+    transformers = pytest.importorskip('transformers')
+    try:
+        tokenizer = transformers.AutoTokenizer.from_pretrained(input)
+    except OSError:
+        pytest.skip(f'tokenizer {input} is not available')
+    template = ChatTemplate.from_hf_tokenizer(tokenizer)
+    messages = [m for m in MESSAGES if m['role'] != 'system']
+    for _ in range(2):
+        # the second pass reads the content ids from the cache
+        assert template.encode(messages) == tokenizer.apply_chat_template(messages, add_generation_prompt=True)
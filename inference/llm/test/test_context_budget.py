@@ -0,0 +1,99 @@
+import pytest
+from context_budget import DROP_OLDEST, KEEP_SYSTEM, REJECT, ContextBudget, ContextOverflow, read_context_budget
+
+MESSAGES = [
+    {'role': 'system', 'content': 'sss'},
+    {'role': 'user', 'content': 'u1'},
+    {'role': 'assistant', 'content': 'a1'},
+    {'role': 'user', 'content': 'u2'},
+    {'role': 'assistant', 'content': 'a2'},
+    {'role': 'user', 'content': 'u3'},
+]
+
+
+def encode(messages):
+    # one token per character of the contents
+    return [ord(c) for m in messages for c in m['content']]
+
+
+class Metrics:
+
+    def __init__(self):
+        self.stats = []
+
+    def record_context(self, stats):
+        self.stats.append(stats)
+
+
+@pytest.mark.parametrize("input, expected", [
+    # (policy, context length), contents of the fitted messages
+    ((KEEP_SYSTEM, 0), ['sss', 'u1', 'a1', 'u2', 'a2', 'u3']),
+    ((KEEP_SYSTEM, 17), ['sss', 'u1', 'a1', 'u2', 'a2', 'u3']),
+    # whole turns are dropped, oldest first
+    ((KEEP_SYSTEM, 16), ['sss', 'u2', 'a2', 'u3']),
+    ((KEEP_SYSTEM, 13), ['sss', 'u2', 'a2', 'u3']),
+    ((KEEP_SYSTEM, 12), ['sss', 'u3']),
+    ((KEEP_SYSTEM, 11), ['sss', 'u3']),
+    ((DROP_OLDEST, 16), ['u1', 'a1', 'u2', 'a2', 'u3']),
+    ((DROP_OLDEST, 11), ['u2', 'a2', 'u3']),
+    ((DROP_OLDEST, 6), ['u3']),
+])
+def test_fit(input, expected):
+    policy, context_length = input
+    metrics = Metrics()
+    budget = ContextBudget(context_length, encode, policy, metrics)
+    messages, prompt_ids = budget.fit(MESSAGES, 4)
+    assert [m['content'] for m in messages] == expected
+    assert prompt_ids == encode(messages)
+    if len(messages) < len(MESSAGES):
+        assert metrics.stats == [{
+            'context_trimmed': 1,
+            'context_trimmed_messages': len(MESSAGES) - len(messages),
+            'context_trimmed_tokens': len(encode(MESSAGES)) - len(prompt_ids),
+        }]
+    else:
+        assert metrics.stats == []
+
+
+@pytest.mark.parametrize("input", [
+    (REJECT, 16),
+    # the system message and the last message are never dropped
+    (KEEP_SYSTEM, 8),
+    (DROP_OLDEST, 5),
+    # max_tokens alone exceeds the context length
+    (DROP_OLDEST, 4),
+])
+def test_fit_overflow(input):
+    metrics = Metrics()
+    budget = ContextBudget(input[1], encode, input[0], metrics)
+    with pytest.raises(ContextOverflow, match=f'exceed the context length of {input[1]}'):
+        budget.fit(MESSAGES, 4)
+    assert metrics.stats == [{'context_rejected': 1}]
+
+
+def test_fit_prompt_ids():
+    # a prompt tokenized by the caller is only checked
+    budget = ContextBudget(8, encode, KEEP_SYSTEM)
+    assert budget.fit(None, 4, [1, 2, 3, 4]) == (None, [1, 2, 3, 4])
+    with pytest.raises(ContextOverflow):
+        budget.fit(None, 4, [1, 2, 3, 4, 5])
+
+
+@pytest.mark.parametrize("input, expected", [
+    # (parameters, context length of the model), (context length, policy)
+    (({}, 4096), (4096, KEEP_SYSTEM)),
+    (({'context_length': '1024'}, 4096), (1024, KEEP_SYSTEM)),
+    (({'context_length': '8192'}, 4096), (4096, KEEP_SYSTEM)),
+    (({'context_length': '1024'}, None), (1024, KEEP_SYSTEM)),
+    (({'context_policy': 'reject'}, 4096), (4096, REJECT)),
+])
+def test_read_context_budget(input, expected):
+    parameters, context_length = input
+    model_config = {'parameters': {k: {'string_value': v} for k, v in parameters.items()}}
+    budget = read_context_budget(model_config, context_length, encode)
+    assert (budget.context_length, budget.policy) == expected
+
+
+def test_unsupported_policy():
+    with pytest.raises(ValueError, match='unsupported context policy'):
+        ContextBudget(16, encode, 'truncate')
@@ -0,0 +1,133 @@
+import random
+import sys
+
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+pytest.importorskip('llama_cpp')
+
+from chat_template import ChatTemplate  # noqa: E402
+from deadline import Deadline  # noqa: E402
+from metrics import SequenceTimer  # noqa: E402
+
+ARGUMENT = {'max_tokens': 4, 'temperature': 0.0, 'top_p': 1.0, 'top_k': 1, 'repetition_penalty': 1.0}
+
+
+class StreamingModel:
+    """Streams like `Llama.__call__`, which saves the KV state to its cache after the final chunk."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.cache = {}
+        self.closed = False
+
+    def __call__(self, prompt_ids, stream=True, **kwargs):
+        try:
+            for k, text in enumerate(self.texts):
+                finish_reason = 'stop' if k == len(self.texts) - 1 else None
+                yield {'choices': [{'text': text, 'finish_reason': finish_reason}]}
+            self.cache[tuple(prompt_ids)] = 'state'
+        except GeneratorExit:
+            self.closed = True
+            raise
+
+
+@pytest.mark.parametrize("input, expected", [
+    (({}, ['a', 'b', '']), (['a', 'b', ''], 'stop', {(1, 2, 3): 'state'}, False)),
+    (({'deadline_ms': 1e-6}, ['a', 'b', '']), ([''], 'deadline', {}, False)),
+])
+def test_stream_completion(import_model, input, expected):
+    module = import_model('gguf')
+    backend = module.TritonPythonModel.__new__(module.TritonPythonModel)
+    backend.chat_template = ChatTemplate(None, lambda text: [ord(c) for c in text])
+    argument, texts = input
+    model = StreamingModel(texts)
+    chunks = list(backend._stream_completion(model, [1, 2, 3], {**ARGUMENT, **argument}, SequenceTimer(),
+                                             Deadline({**ARGUMENT, **argument})))
+    assert ([text for text, _ in chunks], chunks[-1][1], model.cache, model.closed) == expected
+
+
+def test_stream_completion_cancelled(import_model):
+    module = import_model('gguf')
+    backend = module.TritonPythonModel.__new__(module.TritonPythonModel)
+    backend.chat_template = ChatTemplate(None, lambda text: [ord(c) for c in text])
+    model = StreamingModel(['a', 'b', ''])
+    cancelled = iter([False, True, True, True])
+    deadline = Deadline(ARGUMENT, lambda: next(cancelled), check_interval=0.0)
+    chunks = list(backend._stream_completion(model, [1, 2, 3], ARGUMENT, SequenceTimer(), deadline))
+    assert (chunks[-1][1], model.cache, model.closed) == ('cancelled', {}, True)
+
+
+@pytest.mark.parametrize("input, expected", [
+    (None, ['<|end|>']),
+    ("{% for message in messages %}{{ message['content'] | upper }}{% endfor %}", None),
+])
+def test_completion_args_stop(import_model, input, expected):
+    # generation stops at the end-of-turn marker of the chat template, if it has one
+    module = import_model('gguf')
+    backend = module.TritonPythonModel.__new__(module.TritonPythonModel)
+    backend.chat_template = ChatTemplate(input, lambda text: [ord(c) for c in text])
+    assert backend._create_completion_args(ARGUMENT).get('stop') == expected
+
+
+class State:
+    """Saved KV state of `Llama.save_state`, as far as the prefix cache reads it."""
+
+    def __init__(self, llama_state_size):
+        self.llama_state_size = llama_state_size
+
+
+def test_prefix_cache_shared_by_contexts(import_model):
+    # a follow-up turn finds the state saved by its earlier turn in another
+    # context of the pool, while concurrent contexts read and write the cache
+    import_model('gguf')
+    from prefix_cache import PrefixStateCache
+
+    cache = PrefixStateCache(capacity_bytes=1024, block_size=2)
+    first_turn = State(512)
+    cache[[1, 2, 3, 4]] = first_turn
+
+    def serve(k):
+        cache[[10 + k, 11, 12, 13]] = State(1)
+        return cache[[1, 2, 3, 4, 5, 6]]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        states = list(executor.map(serve, range(4)))
+    assert (states, cache.stats()['entries']) == ([first_turn] * 4, 5)
+
+
+def test_encode_concurrently_in_pool():
+    # every context of the pool encodes its prompts on its own executor
+    # thread, with threads switching often enough to interleave the updates
+    # of the content cache of the shared chat template
+    template = ChatTemplate(None, lambda text: [ord(c) for c in text], cache_size=8)
+
+    def encode(seed):
+        rng = random.Random(seed)
+        for _ in range(100000):
+            content = str(rng.randrange(12))
+            assert template._encode_content(content) == [ord(c) for c in content]
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(encode, range(4)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert len(template.content_cache) == 8
+
+
+def test_prefix_cache_eviction(import_model):
+    # the least recently used states are evicted once the states exceed the capacity
+    import_model('gguf')
+    from prefix_cache import PrefixStateCache
+
+    cache = PrefixStateCache(capacity_bytes=1024, block_size=2)
+    cache[[1, 2]] = State(512)
+    cache[[3, 4]] = State(512)
+    cache[[1, 2]]
+    cache[[5, 6]] = State(256)
+    assert ([1, 2] in cache, [3, 4] in cache, [5, 6] in cache) == (True, False, True)
+    assert cache.stats()['size_bytes'] == 768
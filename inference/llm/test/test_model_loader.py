@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'pyt/model_repository/generate/1'))
+import model_loader  # noqa: E402
+from model_loader import _fingerprint, load_model  # noqa: E402
+
+CONFIG = {'device': 'cpu', 'dtype': 'fp32', 'quantization': 'int8'}
+
+
+def write_model(model_dir, weights):
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, 'config.json'), 'w', encoding='utf-8') as out_file:
+        out_file.write('{"model_type": "llama"}')
+    with open(os.path.join(model_dir, 'model.safetensors'), 'wb') as out_file:
+        out_file.write(weights)
+    return str(model_dir)
+
+
+@pytest.mark.parametrize("contents", [True, False])
+def test_fingerprint_of_fine_tunes(tmp_path, contents):
+    # fine-tunes of a base model have files of the same names and sizes
+    base = write_model(tmp_path / 'base', b'\x00' * 64)
+    fine_tune = write_model(tmp_path / 'fine_tune', b'\x00' * 32 + b'\x01' * 32)
+    for model_dir in (base, fine_tune):
+        for name in os.listdir(model_dir):
+            os.utime(os.path.join(model_dir, name), ns=(0, 0))
+    assert (_fingerprint(base, contents) != _fingerprint(fine_tune, contents)) == contents
+
+    # the quantization cache itself is not part of the model
+    key = _fingerprint(base, contents)
+    with open(os.path.join(base, f'quantized-int8-{key}.pt'), 'wb') as out_file:
+        out_file.write(b'\x02')
+    assert _fingerprint(base, contents) == key
+
+
+@pytest.fixture
+def fingerprints(monkeypatch):
+    # quantizes a single Linear layer in place of a model, and records
+    # whether model files were read to find a quantized model
+    calls = []
+
+    def fingerprint(model_path, contents=False):
+        calls.append(contents)
+        return _fingerprint(model_path, contents)
+
+    monkeypatch.setattr(model_loader, '_fingerprint', fingerprint)
+    monkeypatch.setattr(model_loader, '_load_cpu_model', lambda model_path, torch_dtype: torch.nn.Linear(4, 4))
+    return calls
+
+
+def test_load_quantized_model(tmp_path, fingerprints):
+    model_path = write_model(tmp_path / 'model', b'\x00' * 64)
+    _, cached = load_model(model_path, CONFIG)
+    assert not cached
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(model_path) if name.startswith('quantized-')) == \
+        ['.json', '.pt']
+
+    # an unchanged model is found by its manifest, without hashing its contents
+    fingerprints.clear()
+    _, cached = load_model(model_path, CONFIG)
+    assert cached and fingerprints == [False]
+
+    # the same files with other modification times, e.g. copied elsewhere, are found by contents
+    os.utime(os.path.join(model_path, 'model.safetensors'), ns=(0, 0))
+    fingerprints.clear()
+    _, cached = load_model(model_path, CONFIG)
+    assert cached and fingerprints == [False, True]
+    fingerprints.clear()
+    _, cached = load_model(model_path, CONFIG)
+    assert cached and fingerprints == [False]
+
+    # a fine-tune of the same size is quantized again
+    write_model(model_path, b'\x00' * 32 + b'\x01' * 32)
+    os.utime(os.path.join(model_path, 'model.safetensors'), ns=(0, 0))
+    _, cached = load_model(model_path, CONFIG)
+    assert not cached
+    assert len([name for name in os.listdir(model_path) if name.endswith('.pt')]) == 2
+
+
+def test_quantization_cache_dir(tmp_path, fingerprints):
+    model_path = write_model(tmp_path / 'model', b'\x00' * 64)
+    config = {**CONFIG, 'quantization_cache_dir': str(tmp_path / 'cache')}
+    assert not load_model(model_path, config)[1]
+    assert load_model(model_path, config)[1]
+    assert not any(name.startswith('quantized-') for name in os.listdir(model_path))
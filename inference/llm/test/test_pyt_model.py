@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+import inprocess_backend as pd_utils
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+ARGUMENT = {'max_tokens': 8, 'temperature': 0.0, 'top_p': 1.0, 'top_k': 1, 'repetition_penalty': 1.0}
+
+
+class ContextBudget:
+
+    def fit(self, messages, max_tokens, prompt_ids=None):
+        return messages, [1, 2, 3]
+
+
+class Adapters:
+
+    misses = 0
+
+    def resolve(self, argument):
+        return None, None
+
+    def activate(self, argument):
+        pass
+
+
+class FailingModel:
+    """Fails like `generate` running out of memory, before any token is streamed."""
+
+    device = 'cpu'
+
+    def generate(self, input_ids, **kwargs):
+        raise RuntimeError('out of memory')
+
+
+class StalledModel:
+    """Streams nothing until its stopping criteria tell it to stop."""
+
+    device = 'cpu'
+
+    def __init__(self):
+        self.stopped = False
+
+    def generate(self, input_ids, stopping_criteria=None, **kwargs):
+        while not stopping_criteria(input_ids, None).all():
+            pass
+        self.stopped = True
+        return input_ids
+
+
+@pytest.mark.parametrize("input, expected", [
+    (FailingModel(), 'out of memory'),
+    (StalledModel(), 'no token generated in 0.05s'),
+])
+def test_stream_results_failure(import_model, monkeypatch, input, expected):
+    # a failing or stalled generate ends the stream with an error instead of blocking it
+    module = import_model('pyt')
+    monkeypatch.setattr(module, 'STREAM_TIMEOUT', 0.05)
+    model = module.TritonPythonModel.__new__(module.TritonPythonModel)
+    model.model = input
+    model.tokenizer = None
+    model.fan_out = False
+    model.response_cache = None
+    model.context_budget = ContextBudget()
+    model.adapters = Adapters()
+    model.draft_model = None
+    model.config = {}
+
+    request = pd_utils.InferenceRequest([
+        pd_utils.Tensor('messages', np.array([json.dumps({'role': 'user', 'content': 'Hi'}).encode('utf-8')],
+                                             dtype=object)),
+        pd_utils.Tensor('arguments', np.array([json.dumps(ARGUMENT).encode('utf-8')], dtype=object)),
+    ])
+    model._execute_decoupled(request, arrival_time=0.0)
+    (_, response), = request.sender.responses
+    assert response.error().message() == expected
+    assert request.sender.done.is_set()
+    assert getattr(input, 'stopped', True)
@@ -0,0 +1,118 @@
+import json
+import os
+
+import pytest
+import response_cache
+from response_cache import ResponseCache, read_response_cache
+
+GREEDY = {'max_tokens': 8, 'temperature': 0.0, 'top_p': 1.0, 'top_k': 1, 'repetition_penalty': 1.0}
+SAMPLED = {**GREEDY, 'temperature': 0.7, 'top_k': 50}
+MESSAGES = [{'role': 'user', 'content': 'Hi'}]
+
+
+def result(content, finish_reason='stop'):
+    return {'content': content, 'finish_reason': finish_reason}
+
+
+def size(value):
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+@pytest.mark.parametrize("input, expected", [
+    ((MESSAGES, GREEDY), True),
+    # only the deadline of an argument set does not change its result
+    ((MESSAGES, {**GREEDY, 'deadline_ms': 100}), True),
+    (([{'role': 'user', 'content': 'Hi '}], GREEDY), False),
+    (([{'role': 'user', 'content': ' Hi'}], GREEDY), False),
+    (([{'role': 'User', 'content': 'Hi'}], GREEDY), False),
+    ((MESSAGES, {**GREEDY, 'max_tokens': 16}), False),
+])
+def test_key(input, expected):
+    cache = ResponseCache(1024)
+    assert (cache.key(*input) == cache.key(MESSAGES, GREEDY)) == expected
+
+
+def test_key_of_prompt_ids():
+    cache = ResponseCache(1024)
+    assert cache.key(None, GREEDY, [1, 2, 3]) == cache.key(None, GREEDY, [1, 2, 3])
+    assert cache.key(None, GREEDY, [1, 2, 3]) != cache.key(None, GREEDY, [1, 2])
+    assert cache.key(MESSAGES, SAMPLED) is None
+    assert ResponseCache(1024, namespace='a').key(MESSAGES, GREEDY) != ResponseCache(1024, namespace='b').key(MESSAGES, GREEDY)
+
+
+@pytest.mark.parametrize("input, expected", [
+    # results are evicted by size, least recently used first
+    (['a', 'b', 'c'], ['b', 'c']),
+    (['a', 'b', 'get a', 'c'], ['a', 'c']),
+    (['a', 'b', 'a', 'c'], ['a', 'c']),
+])
+def test_lru_by_bytes(input, expected):
+    cache = ResponseCache(2 * size(result('a')))
+    for op in input:
+        if op.startswith('get '):
+            assert cache.get(op[4:]) == result(op[4:])
+        else:
+            cache.put(op, result(op))
+    assert list(cache.entries) == expected
+    assert cache.size_bytes == sum(size(result(key)) for key in expected)
+    assert [cache.get(key) for key in 'abc'] == [result(key) if key in expected else None for key in 'abc']
+
+
+def test_put():
+    cache = ResponseCache(size(result('a')))
+    cache.put(None, result('a'))
+    cache.put('a', result('a', 'deadline'))
+    cache.put('b', result('bb'))
+    assert not cache.entries
+    cache.put('a', result('a'))
+    assert cache.get('a') == result('a')
+    assert cache.stats() == {
+        'hits': 1, 'disk_hits': 0, 'misses': 0, 'hit_rate': 1.0, 'entries': 1, 'size_bytes': size(result('a')),
+    }
+
+
+def test_ttl(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = ResponseCache(1024, ttl=10, cache_dir=str(tmp_path))
+    cache.put('a', result('a'))
+    now[0] += 9
+    assert cache.get('a') == result('a')
+    now[0] += 1
+    assert cache.get('a') is None
+    assert not cache.entries and cache.size_bytes == 0
+    # the expired result is removed from disk too
+    assert not os.path.exists(cache._path('a'))
+
+
+def test_disk_tier(tmp_path):
+    cache = ResponseCache(1024, cache_dir=str(tmp_path))
+    cache.put('a', result('a'))
+    # a new cache over the same directory, as after a restart
+    restarted = ResponseCache(1024, cache_dir=str(tmp_path))
+    assert restarted.get('a') == result('a')
+    assert restarted.get('a') == result('a')
+    assert (restarted.disk_hits, restarted.hits) == (1, 1)
+    assert restarted.get('b') is None
+    assert restarted.misses == 1
+
+
+def test_disk_tier_beyond_memory(tmp_path):
+    cache = ResponseCache(size(result('a')), cache_dir=str(tmp_path))
+    cache.put('a', result('a'))
+    cache.put('b', result('b'))
+    assert list(cache.entries) == ['b']
+    assert cache.get('a') == result('a')
+    assert list(cache.entries) == ['a']
+
+
+@pytest.mark.parametrize("input, expected", [
+    ({}, None),
+    ({'response_cache_bytes': '0'}, None),
+    ({'response_cache_bytes': '1024'}, (1024, None)),
+    ({'response_cache_bytes': '1024', 'response_cache_ttl': '60'}, (1024, 60.0)),
+])
+def test_read_response_cache(input, expected):
+    model_config = {'name': 'generate', 'parameters': {k: {'string_value': v} for k, v in input.items()}}
+    cache = read_response_cache(model_config)
+    assert (None if cache is None else (cache.capacity_bytes, cache.ttl)) == expected
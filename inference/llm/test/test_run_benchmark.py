@@ -0,0 +1,135 @@
+import glob
+import os
+import shutil
+import textwrap
+
+import pytest
+import inprocess_backend
+from response_cache import read_response_cache
+from run_benchmark import InProcessClient, bench_runtime
+
+# Echoes the last message through the input and output handling of the
+# generate models, as a decoupled or a non-decoupled model.
+STUB_MODEL = textwrap.dedent('''
+    import json
+    import numpy as np
+    import triton_python_backend_utils as pd_utils
+    from metrics import create_stats
+    from request_inputs import read_inputs
+
+
+    class TritonPythonModel:
+
+        def initialize(self, args):
+            model_config = json.loads(args['model_config'])
+            self.decoupled = pd_utils.using_decoupled_model_transaction_policy(model_config)
+            self.batching = model_config['max_batch_size'] > 0
+
+        def execute(self, requests):
+            responses = []
+            for request in requests:
+                messages, _, arguments = read_inputs(request)
+                stats = create_stats(0.0, 0.01, 0.02, 8, 3)
+                results = [
+                    {'index': j, 'role': 'assistant', 'content': messages[-1]['content'], 'finish_reason': 'stop',
+                     'metrics': stats}
+                    for j in range(len(arguments))
+                ]
+                results = np.array([json.dumps(d) for d in results], dtype=object)
+                if self.batching:
+                    results = results.reshape(1, -1)
+                response = pd_utils.InferenceResponse(output_tensors=[pd_utils.Tensor('results', results)])
+                if self.decoupled:
+                    sender = request.get_response_sender()
+                    sender.send(response)
+                    sender.send(flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+                else:
+                    responses.append(response)
+            return None if self.decoupled else responses
+''')
+
+EXAMPLE = {
+    "id": "test_generate-1",
+    "input": {
+        "messages": [{"role": "user", "content": "hello world"}],
+        "arguments": [
+            {"max_tokens": 16, "temperature": 0.0, "top_p": 1.0, "top_k": 5, "repetition_penalty": 1.0},
+        ] * 2,
+    },
+}
+
+
+@pytest.mark.parametrize("input, expected", [
+    ((32, False), (["hello world", "hello world"], 2)),
+    ((0, False), (["hello world", "hello world"], 2)),
+    ((32, True), (["hello world", "hello world"], 2)),
+])
+def test_inprocess_client(tmp_path, monkeypatch, input, expected):
+    max_batch_size, decoupled = input
+    version_dir = tmp_path / 'generate' / '1'
+    version_dir.mkdir(parents=True)
+    (version_dir / 'model.py').write_text(STUB_MODEL)
+    model_config = {
+        'name': 'generate',
+        'max_batch_size': max_batch_size,
+        'parameters': {},
+        'model_transaction_policy': {'decoupled': decoupled},
+    }
+    monkeypatch.setattr(inprocess_backend, 'read_model_config', lambda model_dir, config_name=None: model_config)
+
+    client = InProcessClient(str(tmp_path / 'generate'), '1', None, 10.0)
+    results, _ = client.generate(EXAMPLE)
+    summary, _ = bench_runtime(client, [EXAMPLE], 2, 1)
+    client.close()
+    assert ([d["content"] for d in results], summary["num_requests"]) == expected
+    assert summary["prefill_tokens_per_second"] == pytest.approx(800.0)
+
+
+# Keeps the model config it was initialized with.
+CONFIG_MODEL = textwrap.dedent('''
+    import json
+
+
+    class TritonPythonModel:
+
+        def initialize(self, args):
+            self.model_config = json.loads(args['model_config'])
+''')
+
+LLM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("input", sorted(
+    os.path.relpath(path, LLM_DIR)
+    for pattern in ('*/model_repository/generate/config.pbtxt', '*/model_repository/generate/configs/*.pbtxt')
+    for path in glob.glob(os.path.join(LLM_DIR, pattern))
+))
+def test_inprocess_client_disables_response_cache(tmp_path, input):
+    pytest.importorskip('google.protobuf')
+    pytest.importorskip('tritonclient.grpc')
+    model_dir = tmp_path / 'generate'
+    config_dir = model_dir / 'configs' if os.path.basename(os.path.dirname(input)) == 'configs' else model_dir
+    config_dir.mkdir(parents=True)
+    shutil.copy(os.path.join(LLM_DIR, input), config_dir)
+    (model_dir / '1').mkdir()
+    (model_dir / '1' / 'model.py').write_text(CONFIG_MODEL)
+    config_name = os.path.splitext(os.path.basename(input))[0] if config_dir != model_dir else None
+
+    assert read_response_cache(inprocess_backend.read_model_config(str(model_dir), config_name)) is None
+    client = InProcessClient(str(model_dir), '1', config_name, 10.0)
+    assert read_response_cache(client.model.model_config) is None
+
+
+def test_inprocess_client_overrides_response_cache(tmp_path, monkeypatch):
+    version_dir = tmp_path / 'generate' / '1'
+    version_dir.mkdir(parents=True)
+    (version_dir / 'model.py').write_text(CONFIG_MODEL)
+    model_config = {
+        'name': 'generate',
+        'max_batch_size': 0,
+        'parameters': {'response_cache_bytes': {'string_value': '1024'}},
+    }
+    monkeypatch.setattr(inprocess_backend, 'read_model_config', lambda model_dir, config_name=None: model_config)
+
+    client = InProcessClient(str(tmp_path / 'generate'), '1', None, 10.0)
+    assert read_response_cache(client.model.model_config) is None
@@ -0,0 +1,93 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import inprocess_backend as pd_utils
+
+ARGUMENTS = [
+    {'max_tokens': 8, 'temperature': 0.0, 'top_p': 1.0, 'top_k': 1, 'repetition_penalty': 1.0},
+    {'max_tokens': 8, 'temperature': 0.7, 'top_p': 1.0, 'top_k': 1, 'repetition_penalty': 1.0},
+]
+
+
+class ContextBudget:
+
+    def fit(self, messages, max_tokens, prompt_ids=None):
+        return messages, [1, 2, 3]
+
+
+class Engine:
+    """Fails the greedy sequence and keeps the sampled one running until it is aborted."""
+
+    def __init__(self):
+        self.aborted = set()
+
+    async def generate(self, prompt, params, request_id, **kwargs):
+        if params.temperature == 0.0:
+            raise RuntimeError('out of memory')
+        while request_id not in self.aborted:
+            await asyncio.sleep(0.01)
+        yield None
+
+    async def abort(self, request_id):
+        self.aborted.add(request_id)
+
+
+class CompletingEngine:
+    """Completes every sequence with the token ids of its sampling temperature."""
+
+    async def generate(self, prompt, params, request_id, **kwargs):
+        token_ids = [7, 8] if params.temperature == 0.0 else [9]
+        completions = [SimpleNamespace(text='ok', finish_reason='stop', token_ids=token_ids)] * params.n
+        yield SimpleNamespace(outputs=completions)
+
+
+def create_model(module, engine):
+    model = module.TritonPythonModel.__new__(module.TritonPythonModel)
+    model.engine = engine
+    model.fan_out = True
+    model.response_cache = None
+    model.context_budget = ContextBudget()
+    model.adapter_dir = None
+    model.return_metrics = False
+    model._record_stats = lambda *args: {}
+    return model
+
+
+def create_request(requested_output_names=None):
+    return pd_utils.InferenceRequest([
+        pd_utils.Tensor('messages', np.array([json.dumps({'role': 'user', 'content': 'Hi'}).encode('utf-8')],
+                                             dtype=object)),
+        pd_utils.Tensor('arguments', np.array([json.dumps(d).encode('utf-8') for d in ARGUMENTS], dtype=object)),
+    ], requested_output_names)
+
+
+def test_generate_aborts_other_sequences(import_model):
+    # a failing group ends the request with a single error, and the other groups are aborted in the engine
+    pytest.importorskip('vllm.sampling_params')
+    model = create_model(import_model('vllm_async'), Engine())
+    request = create_request()
+    asyncio.run(asyncio.wait_for(model._generate(request, 0.0, 0.0), timeout=5.0))
+    (_, response), = request.sender.responses
+    assert response.error().message() == 'out of memory'
+    assert request.sender.done.is_set()
+    assert len(model.engine.aborted) == 2
+
+
+def test_generate_returns_engine_token_ids(import_model):
+    # every finished group returns the ids generated by the engine next to its results
+    pytest.importorskip('vllm.sampling_params')
+    model = create_model(import_model('vllm_async'), CompletingEngine())
+    request = create_request(['results', 'output_ids'])
+    asyncio.run(asyncio.wait_for(model._generate(request, 0.0, 0.0), timeout=5.0))
+    output_ids = {}
+    for _, response in request.sender.responses:
+        if response is None:
+            continue
+        results, ids = (tensor.as_numpy() for tensor in response.output_tensors())
+        for result, row in zip(results, ids.tolist()):
+            output_ids[json.loads(result)['index']] = [i for i in row if i >= 0]
+    assert output_ids == {0: [7, 8], 1: [9]}
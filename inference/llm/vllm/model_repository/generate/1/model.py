@@ -1,9 +1,22 @@
 import os
 import json
+import time
 import numpy as np
 import triton_python_backend_utils as pd_utils
 
 from vllm import LLM, SamplingParams
+from vllm.lora.request import LoRARequest
+from vllm.outputs import CompletionOutput, RequestOutput
+from vllm.sequence import RequestMetrics
+from chat_template import ChatTemplate
+from fan_out import group_arguments, is_greedy, read_fan_out
+from response_cache import read_response_cache
+from metrics import GenerationMetrics, create_stats, read_return_metrics
+from deadline import Deadline
+from warmup import read_warmup, run_warmup
+from adapters import adapter_dir, read_max_adapters, resolve_adapter
+from context_budget import read_context_budget
+from request_inputs import output_ids_tensor, read_inputs, wants_output_ids
 
 
 class TritonPythonModel:
@@ -28,8 +41,38 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
+        self.batching = self.model_config['max_batch_size'] > 0
+        self.decoupled = pd_utils.using_decoupled_model_transaction_policy(self.model_config)
+        self.fan_out = read_fan_out(self.model_config)
+        self.response_cache = read_response_cache(self.model_config)
+        self.metrics = GenerationMetrics(args)
+        self.return_metrics = read_return_metrics(self.model_config)
+        self.max_adapters = read_max_adapters(self.model_config)
+        self.adapter_dir = adapter_dir(args)
+        self.adapter_ids = {}
+
+        # Prefix caching lets argument sets of the same prompt that cannot be
+        # sampled together still share the prefill of the prompt. With
+        # adapters, vLLM keeps up to `max_adapters` of them on the GPU next to
+        # a single copy of the base weights and up to `max_cpu_adapters` in
+        # host memory, evicting the least recently used, and batches requests
+        # for different adapters together.
         model_path = os.path.join(args['model_repository'], args['model_version'], 'model')
-        self.model = LLM(modelh=model_path)
+        lora_kwargs = {}
+        if self.max_adapters > 0:
+            parameters = self.model_config['parameters']
+            lora_kwargs = {
+                'enable_lora': True,
+                'max_loras': self.max_adapters,
+                'max_lora_rank': int(parameters['max_adapter_rank']['string_value']),
+                'max_cpu_loras': int(parameters['max_cpu_adapters']['string_value']),
+            }
+        self.model = LLM(model=model_path, enable_prefix_caching=self.fan_out, **lora_kwargs)
+        self.chat_template = ChatTemplate.from_hf_tokenizer(self.model.get_tokenizer())
+        self.context_budget = read_context_budget(self.model_config, self.model.llm_engine.model_config.max_model_len,
+                                                  self.chat_template.encode, self.metrics)
+        run_warmup(read_warmup(self.model_config), self._warmup)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -51,43 +94,255 @@ class TritonPythonModel:
           be the same as `requests`
         """
 
-        responses = []
-        # Every Python backend must iterate over everyone of the requests
-        # and create a pb_utils.InferenceResponse for each of them.
-        for request in requests:
-            messages = pd_utils.get_input_tensor_by_name(request, 'messages').as_numpy().tolist()
-            prompt = self._format_messages(messages)
-            arguments = pd_utils.get_input_tensor_by_name(request, 'arguments').as_numpy().tolist()
-            output_results = []
-            for arg in arguments:
-                argument = json.loads(arg.decode('utf-8'))
-                params = SamplingParams(
-                    max_tokens=argument['max_tokens'],
-                    temperature=argument['temperature'],
-                    top_p=argument['top_p'],
-                    top_k=argument['top_k'],
-                    repetition_penalty=argument['repetition_penalty']
-                )
-                outputs = self.model.generate(prompt, params)
+        arrival_time = time.time()
+        start_time = time.perf_counter()
+        senders = [request.get_response_sender() for request in requests] if self.decoupled else None
+        prompts, params_list, slots, cached_slots, output_results = self._collect_requests(requests, senders, start_time)
+        if self.decoupled:
+            self._execute_decoupled(senders, prompts, params_list, slots, cached_slots, arrival_time)
+            return None
+
+        # ids of the generated tokens, for the requests that ask for them
+        output_ids = [[[] for _ in results] if isinstance(results, list) else None for results in output_results]
+        for i, indices, cached in cached_slots:
+            for j in indices:
                 result = {
                     'role': 'assistant',
-                    'content': outputs[0].outputs[0].text,
+                    'content': cached['content'],
+                    'finish_reason': cached['finish_reason'],
                 }
-                output_results.append(json.dumps(result))
+                output_results[i][j] = json.dumps(result)
+                output_ids[i][j] = cached.get('output_ids', [])
+
+        def on_output(k, output, interrupted):
+            if not output.finished and interrupted is None:
+                return
+            i, indices, cache_key, _, _ = slots[k]
+            stats = [self._record_stats(output, completion, arrival_time, end_time=time.time())
+                     for completion in output.outputs]
+            for k, j in enumerate(indices):
+                completion = output.outputs[k % len(output.outputs)]
+                result = {
+                    'role': 'assistant',
+                    'content': completion.text,
+                    'finish_reason': completion.finish_reason or interrupted,
+                }
+                if self.return_metrics:
+                    result['metrics'] = stats[k % len(output.outputs)]
+                output_results[i][j] = json.dumps(result)
+                output_ids[i][j] = list(completion.token_ids)
+            self._cache_put(cache_key, output.outputs[0], interrupted)
+
+        self._run_engine(prompts, params_list, slots, on_output)
+        self._log_cache_stats()
+
+        responses = []
+        # Every Python backend must iterate over everyone of the requests
+        # and create a pb_utils.InferenceResponse for each of them.
+        for request, results, ids in zip(requests, output_results, output_ids):
+            if isinstance(results, ValueError):
+                responses.append(pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(results))))
+                continue
+            results = np.array(results, dtype=object)
+            if self.batching:
+                results = results.reshape(1, -1)
             output_tensors = [
-                pd_utils.Tensor('results', np.array(output_results, dtype=object)),
+                pd_utils.Tensor('results', results),
             ]
+            if wants_output_ids(request):
+                output_tensors.append(output_ids_tensor(ids, self.batching))
             response = pd_utils.InferenceResponse(output_tensors=output_tensors)
             responses.append(response)
 
         return responses
 
-    def _format_messages(self, messages):
-        texts = []
-        for msg in messages:
-            message = json.loads(msg.decode('utf-8'))
-            role, content = message['role'], message['content']
-            texts.append(f'<|{role}|>\n{content}<|end|>')
-        texts.append('<|assistant|>')
-        prompt = '\n'.join(texts)
-        return prompt
+    def _collect_requests(self, requests, senders, start_time):
+        # Collect every (prompt ids, params) pair across all requests so that
+        # vLLM can schedule them as a single batch, and remember which
+        # request and result slots each prompt belongs to. Identical argument
+        # sets of a request are fanned out from one prompt: greedy ones are
+        # decoded once, sampled ones as `n` sequences sharing the prefill.
+        # Greedy argument sets found in the response cache are not generated.
+        # Every prompt gets the deadline and the adapter of its argument set.
+        # Requests with invalid inputs or adapters, or whose prompt does not
+        # fit the context window, get their error instead of results, and
+        # are done with once it is sent.
+        prompts, params_list, slots, cached_slots = [], [], [], []
+        output_results = []
+        for i, request in enumerate(requests):
+            sender = senders[i] if senders is not None else None
+            output_results.append(None)
+            try:
+                messages, prompt_ids, arguments = read_inputs(request)
+                output_results[i] = [None] * len(arguments)
+                _, prompt_ids = self.context_budget.fit(messages, max(a['max_tokens'] for a in arguments), prompt_ids)
+                groups = [
+                    (argument, indices, self._lora_request(argument))
+                    for argument, indices in group_arguments(arguments, self.fan_out)
+                ]
+            except ValueError as e:
+                output_results[i] = e
+                if sender is not None:
+                    response = pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(e)))
+                    sender.send(response, flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+                    senders[i] = None
+                continue
+            for argument, indices, lora_request in groups:
+                cache_key = self._cache_key(messages, argument, prompt_ids)
+                cached = self.response_cache.get(cache_key) if cache_key else None
+                if cached is not None:
+                    cached_slots.append((i, indices, cached))
+                    continue
+                params = self._create_sampling_params(argument, 1 if is_greedy(argument) else len(indices))
+                deadline = Deadline.for_request(request, argument, sender, start_time)
+                prompts.append(prompt_ids)
+                params_list.append(params)
+                slots.append((i, indices, cache_key, deadline, lora_request))
+
+        return prompts, params_list, slots, cached_slots, output_results
+
+    def _execute_decoupled(self, senders, prompts, params_list, slots, cached_slots, arrival_time):
+        # Push the newly generated text of each sequence to its client after
+        # every engine step.
+        for i, indices, cached in cached_slots:
+            for j in indices:
+                self._send_delta(senders[i], j, cached['content'], cached['finish_reason'])
+
+        seq_texts = [[''] * params.n for params in params_list]
+        seq_finished = [[False] * params.n for params in params_list]
+
+        def on_output(k, output, interrupted):
+            i, indices, cache_key, _, _ = slots[k]
+            texts, finished = seq_texts[k], seq_finished[k]
+            for completion in output.outputs:
+                # a greedy sequence is shared by every slot of its group
+                n = completion.index
+                if finished[n]:
+                    continue
+                delta = completion.text[len(texts[n]):]
+                texts[n] = completion.text
+                finish_reason = completion.finish_reason or interrupted
+                finished[n] = finish_reason is not None
+                stats = None
+                if finished[n]:
+                    stats = self._record_stats(output, completion, arrival_time, end_time=time.time())
+                if delta or finish_reason:
+                    for j in (indices if len(texts) == 1 else [indices[n]]):
+                        self._send_delta(senders[i], j, delta, finish_reason, stats)
+            if output.finished or interrupted:
+                self._cache_put(cache_key, output.outputs[0], interrupted)
+
+        self._run_engine(prompts, params_list, slots, on_output)
+        for sender in senders:
+            if sender is not None:
+                sender.send(flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+        self._log_cache_stats()
+
+    def _run_engine(self, prompts, params_list, slots, on_output):
+        # Drive the engine underneath `LLM` step by step, calling `on_output`
+        # with the index of a prompt and each of its new outputs. Between
+        # steps, prompts whose request was cancelled or whose deadline passed
+        # are aborted, and get a last call with their partial output, an
+        # empty one if they were never scheduled, and why they stopped.
+        engine = self.model.llm_engine
+        seq_indices, seq_outputs = {}, {}
+        for k, (prompt_ids, params) in enumerate(zip(prompts, params_list)):
+            seq_id = str(next(self.model.request_counter))
+            engine.add_request(seq_id, None, params, prompt_token_ids=prompt_ids, lora_request=slots[k][4])
+            seq_indices[seq_id] = k
+            completions = [CompletionOutput(n, '', [], 0.0, None) for n in range(params.n)]
+            metrics = RequestMetrics(arrival_time=time.time(), last_token_time=None, first_scheduled_time=None,
+                                     first_token_time=None, time_in_queue=None)
+            seq_outputs[seq_id] = RequestOutput(seq_id, None, prompt_ids, None, completions, False, metrics=metrics)
+
+        while engine.has_unfinished_requests():
+            for output in engine.step():
+                seq_outputs[output.request_id] = output
+                k = seq_indices[output.request_id]
+                if output.finished:
+                    del seq_indices[output.request_id]
+                on_output(k, output, None)
+            for seq_id, k in list(seq_indices.items()):
+                finish_reason = slots[k][3].finish_reason()
+                if finish_reason is not None:
+                    engine.abort_request(seq_id)
+                    del seq_indices[seq_id]
+                    on_output(k, seq_outputs[seq_id], finish_reason)
+
+    def _create_sampling_params(self, argument, n=1):
+        return SamplingParams(
+            n=n,
+            max_tokens=argument['max_tokens'],
+            temperature=argument['temperature'],
+            top_p=argument['top_p'],
+            top_k=argument['top_k'],
+            repetition_penalty=argument['repetition_penalty']
+        )
+
+    def _lora_request(self, argument):
+        # vLLM loads an adapter from its path the first time a request names
+        # it, and tells adapters apart by a positive integer id.
+        name, path = resolve_adapter(self.adapter_dir, argument)
+        if name is None:
+            return None
+        if self.max_adapters <= 0:
+            raise ValueError(f"adapter {name} requested, but max_adapters is 0")
+        lora_id = self.adapter_ids.setdefault(name, len(self.adapter_ids) + 1)
+        return LoRARequest(name, lora_id, path)
+
+    def _warmup(self, messages, argument):
+        prompt_ids = self.chat_template.encode(messages)
+        self.model.generate(sampling_params=self._create_sampling_params(argument), prompt_token_ids=[prompt_ids],
+                            use_tqdm=False, lora_request=self._lora_request(argument))
+
+    def _cache_key(self, messages, argument, prompt_ids=None):
+        if self.response_cache is None:
+            return None
+        return self.response_cache.key(messages, argument, prompt_ids)
+
+    def _cache_put(self, cache_key, completion, interrupted=None):
+        if cache_key is not None:
+            finish_reason = completion.finish_reason or interrupted
+            self.response_cache.put(cache_key, {
+                'content': completion.text,
+                'finish_reason': finish_reason,
+                'output_ids': list(completion.token_ids),
+            })
+
+    def _log_cache_stats(self):
+        if self.response_cache is not None:
+            pd_utils.Logger.log_info(f"response cache stats: {json.dumps(self.response_cache.stats())}")
+
+    def _record_stats(self, output, completion, arrival_time, end_time=None):
+        # vLLM timestamps every request from the moment it was added to the
+        # engine until it finished.
+        m = output.metrics
+        end_time = end_time or m.finished_time or m.last_token_time
+        first_scheduled_time = m.first_scheduled_time or arrival_time
+        first_token_time = m.first_token_time or end_time
+        stats = create_stats(
+            first_scheduled_time - arrival_time,
+            first_token_time - first_scheduled_time,
+            end_time - first_token_time,
+            len(output.prompt_token_ids),
+            len(completion.token_ids),
+        )
+        self.metrics.record(stats)
+        return stats
+
+    def _send_delta(self, sender, index, content, finish_reason=None, metrics=None):
+        result = {
+            'index': index,
+            'role': 'assistant',
+            'content': content,
+            'finish_reason': finish_reason,
+        }
+        if metrics is not None and self.return_metrics:
+            result['metrics'] = metrics
+        results = np.array([json.dumps(result)], dtype=object)
+        if self.batching:
+            results = results.reshape(1, -1)
+        output_tensors = [
+            pd_utils.Tensor('results', results),
+        ]
+        sender.send(pd_utils.InferenceResponse(output_tensors=output_tensors))
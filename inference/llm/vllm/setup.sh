@@ -20,6 +20,7 @@ export MODEL_ARTIFACT_PATH=$(cat ./config.json | jq -r '.model.artifact_path')
 export MODEL_SUBSCRIPTION_ID=$(cat ./config.json | jq -r '.model.subscription_id')
 export MODEL_RESOURCE_GROUP=$(cat ./config.json | jq -r '.model.resource_group')
 export MODEL_WORKSPACE_NAME=$(cat ./config.json | jq -r '.model.workspace_name')
+export MODEL_ADAPTERS=$(cat ./config.json | jq -c '.model.adapters // []')
 
 export IMAGE_NAME=$(cat ./config.json | jq -r '.image.name')
 export IMAGE_TAG_PREFIX=$(cat ./config.json | jq -r '.image.tag_prefix')
@@ -53,10 +54,29 @@ az ml model download \
 --resource-group $MODEL_RESOURCE_GROUP \
 --subscription-id $MODEL_SUBSCRIPTION_ID
 
+mkdir ./adapters
+for ADAPTER in $(echo $MODEL_ADAPTERS | jq -c '.[]'); do
+  ADAPTER_NAME=$(echo $ADAPTER | jq -r '.name')
+  mkdir ./adapters/$ADAPTER_NAME
+  az ml model download \
+  --model-id $(echo $ADAPTER | jq -r '.id') \
+  --target-dir ./adapters/$ADAPTER_NAME/ \
+  --workspace-name $MODEL_WORKSPACE_NAME \
+  --resource-group $MODEL_RESOURCE_GROUP \
+  --subscription-id $MODEL_SUBSCRIPTION_ID
+done
+
 mkdir ./build
 cp -r ../Dockerfile ./build/Dockerfile
 cp -r ../model_repository ./build/model_repository
 cp -r ./model/$MODEL_ARTIFACT_PATH/* ./build/model_repository/generate/1/model/
+cp -r ../../common/* ./build/model_repository/generate/1/
+# every adapter is served from its own directory, named as requests refer to it
+for ADAPTER in $(echo $MODEL_ADAPTERS | jq -c '.[]'); do
+  ADAPTER_NAME=$(echo $ADAPTER | jq -r '.name')
+  mkdir -p ./build/model_repository/generate/1/adapters/$ADAPTER_NAME/
+  cp -r ./adapters/$ADAPTER_NAME/$(echo $ADAPTER | jq -r '.artifact_path')/* ./build/model_repository/generate/1/adapters/$ADAPTER_NAME/
+done
 
 cd ./build
 docker build -t custom_image:latest .
@@ -66,7 +86,16 @@ docker run --rm -d --shm-size 1g \
   -p8000:8000 -p8001:8001 -p8002:8002 \
   custom_image:latest \
   tritonserver --model-repository=/model_repository
-sleep 20
+# models run their warmup while loading, so the server is only ready after it
+SECONDS=0
+until curl -sf -o /dev/null localhost:8000/v2/health/ready; do
+  if [ $SECONDS -ge 900 ]; then
+    echo "server not ready after $SECONDS seconds"
+    exit 1
+  fi
+  sleep 5
+done
+echo "server ready after $SECONDS seconds"
 curl -v localhost:8000/v2/health/ready
 
 az account set --subscription $MODEL_SUBSCRIPTION_ID
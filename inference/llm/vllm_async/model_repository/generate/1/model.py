@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+import numpy as np
+import triton_python_backend_utils as pd_utils
+
+from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams
+from vllm.lora.request import LoRARequest
+from chat_template import ChatTemplate
+from fan_out import group_arguments, is_greedy, read_fan_out
+from response_cache import read_response_cache
+from metrics import GenerationMetrics, create_stats, read_return_metrics
+from deadline import Deadline
+from warmup import read_warmup, run_warmup
+from adapters import adapter_dir, read_max_adapters, resolve_adapter
+from context_budget import read_context_budget
+from request_inputs import output_ids_tensor, read_inputs, wants_output_ids
+
+
+class TritonPythonModel:
+    """Your Python model must use the same class name. Every Python model
+    that is created must have "TritonPythonModel" as the class name.
+    """
+
+    def initialize(self, args):
+        """`initialize` is called only once when the model is being loaded.
+        Implementing `initialize` function is optional. This function allows
+        the model to intialize any state associated with this model.
+
+        Parameters
+        ----------
+        args : dict
+          Both keys and values are strings. The dictionary keys and values are:
+          * model_config: A JSON string containing the model configuration
+          * model_instance_kind: A string containing model instance kind
+          * model_instance_device_id: A string containing model instance device ID
+          * model_repository: Model repository path
+          * model_version: Model version
+          * model_name: Model name
+        """
+
+        self.model_config = json.loads(args['model_config'])
+        if not pd_utils.using_decoupled_model_transaction_policy(self.model_config):
+            raise pd_utils.TritonModelException("model must be configured with a decoupled transaction policy")
+        self.fan_out = read_fan_out(self.model_config)
+        self.response_cache = read_response_cache(self.model_config)
+        self.metrics = GenerationMetrics(args)
+        self.return_metrics = read_return_metrics(self.model_config)
+        self.max_adapters = read_max_adapters(self.model_config)
+        self.adapter_dir = adapter_dir(args)
+        self.adapter_ids = {}
+
+        # With adapters, the engine keeps the least recently used ones on the
+        # GPU and in host memory next to a single copy of the base weights.
+        model_path = os.path.join(args['model_repository'], args['model_version'], 'model')
+        lora_kwargs = {}
+        if self.max_adapters > 0:
+            parameters = self.model_config['parameters']
+            lora_kwargs = {
+                'enable_lora': True,
+                'max_loras': self.max_adapters,
+                'max_lora_rank': int(parameters['max_adapter_rank']['string_value']),
+                'max_cpu_loras': int(parameters['max_cpu_adapters']['string_value']),
+            }
+        engine_args = AsyncEngineArgs(model=model_path, enable_prefix_caching=self.fan_out, **lora_kwargs)
+        self.engine = AsyncLLMEngine.from_engine_args(engine_args)
+        self.chat_template = ChatTemplate.from_hf_tokenizer(self.engine.engine.get_tokenizer())
+        self.context_budget = read_context_budget(self.model_config, self.engine.engine.model_config.max_model_len,
+                                                  self.chat_template.encode, self.metrics)
+
+        # The engine runs its continuous batching loop on a dedicated event
+        # loop, so `execute` only has to hand requests over and return.
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.loop_thread.start()
+        run_warmup(read_warmup(self.model_config), self._warmup)
+
+    def execute(self, requests):
+        """`execute` MUST be implemented in every Python model. `execute`
+        function receives a list of pb_utils.InferenceRequest as the only
+        argument. This function is called when an inference request is made
+        for this model. Depending on the batching configuration (e.g. Dynamic
+        Batching) used, `requests` may contain multiple requests. This model
+        is decoupled, so responses are sent through the response sender of
+        each pb_utils.InferenceRequest as soon as every sequence finishes,
+        and `execute` returns without waiting for them.
+        Parameters
+        ----------
+        requests : list
+          A list of pb_utils.InferenceRequest
+        Returns
+        -------
+        None
+        """
+
+        for request in requests:
+            asyncio.run_coroutine_threadsafe(self._generate(request, time.time(), time.perf_counter()), self.loop)
+        # requests finish on the event loop after `execute` returns, so these
+        # are the stats of the requests finished by now
+        self._log_cache_stats()
+        return None
+
+    def finalize(self):
+        """`finalize` is called only once when the model is being unloaded.
+        Implementing `finalize` function is optional. This function allows
+        the model to perform any necessary clean ups before exit.
+        """
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _generate(self, request, arrival_time, start_time):
+        sender = request.get_response_sender()
+        sequences = {}
+        try:
+            messages, prompt_ids, arguments = read_inputs(request)
+            _, prompt_ids = self.context_budget.fit(messages, max(a['max_tokens'] for a in arguments), prompt_ids)
+            # adapters are resolved first, so an unknown one fails the request before anything is sent
+            groups = [
+                (argument, indices, self._lora_request(argument))
+                for argument, indices in group_arguments(arguments, self.fan_out)
+            ]
+            for argument, indices, lora_request in groups:
+                cache_key = self._cache_key(messages, argument, prompt_ids)
+                cached = self.response_cache.get(cache_key) if cache_key else None
+                if cached is not None:
+                    self._send_results(sender, indices, [cached], return_ids=wants_output_ids(request))
+                    continue
+                params = self._create_sampling_params(argument, 1 if is_greedy(argument) else len(indices))
+                deadline = Deadline.for_request(request, argument, sender, start_time)
+                request_id = uuid.uuid4().hex
+                sequences[request_id] = asyncio.ensure_future(self._generate_sequence(
+                    sender, indices, request_id, prompt_ids, params, lora_request, deadline, arrival_time, cache_key,
+                    wants_output_ids(request)))
+            await asyncio.gather(*sequences.values())
+            sender.send(flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+        except Exception as e:
+            # the other groups of the request are stopped and aborted in the
+            # engine, so nothing is sent after the final error response
+            await self._abort_sequences(sequences)
+            response = pd_utils.InferenceResponse(output_tensors=[], error=pd_utils.TritonError(str(e)))
+            sender.send(response, flags=pd_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+
+    async def _abort_sequences(self, sequences):
+        for task in sequences.values():
+            task.cancel()
+        await asyncio.gather(*sequences.values(), return_exceptions=True)
+        for request_id in sequences:
+            try:
+                await self.engine.abort(request_id)
+            except Exception as e:
+                # a dead engine has nothing left to abort
+                pd_utils.Logger.log_warn(f"failed to abort request {request_id}: {e}")
+
+    async def _generate_sequence(self, sender, indices, request_id, prompt_ids, params, lora_request, deadline,
+                                 arrival_time, cache_key=None, return_ids=False):
+        # Every group of sequences joins the running batch of the engine and
+        # is sent back on its own as soon as it finishes. The next output is
+        # awaited with a timeout, so that a cancelled or expired group is
+        # aborted even while it is still queued inside the engine.
+        outputs = self.engine.generate(None, params, request_id, prompt_token_ids=prompt_ids,
+                                       lora_request=lora_request).__aiter__()
+        final_output, interrupted = None, None
+        next_output = asyncio.ensure_future(outputs.__anext__())
+        while True:
+            try:
+                done, _ = await asyncio.wait({next_output}, timeout=deadline.check_interval)
+            except asyncio.CancelledError:
+                next_output.cancel()
+                raise
+            if done:
+                try:
+                    final_output = next_output.result()
+                except StopAsyncIteration:
+                    break
+                next_output = asyncio.ensure_future(outputs.__anext__())
+            interrupted = deadline.finish_reason()
+            if interrupted is not None:
+                next_output.cancel()
+                await self.engine.abort(request_id)
+                break
+
+        if final_output is None:
+            completions = [{'content': '', 'finish_reason': interrupted, 'output_ids': []}]
+            self._send_results(sender, indices, completions, return_ids=return_ids)
+            return
+        completions = [
+            {
+                'content': completion.text,
+                'finish_reason': completion.finish_reason or interrupted,
+                'output_ids': list(completion.token_ids),
+            }
+            for completion in final_output.outputs
+        ]
+        if cache_key is not None:
+            self.response_cache.put(cache_key, completions[0])
+        end_time = time.time() if interrupted else None
+        stats = [self._record_stats(final_output, completion, arrival_time, end_time) for completion in final_output.outputs]
+        self._send_results(sender, indices, completions, stats, return_ids)
+
+    def _create_sampling_params(self, argument, n=1):
+        return SamplingParams(
+            n=n,
+            max_tokens=argument['max_tokens'],
+            temperature=argument['temperature'],
+            top_p=argument['top_p'],
+            top_k=argument['top_k'],
+            repetition_penalty=argument['repetition_penalty']
+        )
+
+    def _lora_request(self, argument):
+        # the engine loads an adapter from its path the first time a request
+        # names it, and tells adapters apart by a positive integer id
+        name, path = resolve_adapter(self.adapter_dir, argument)
+        if name is None:
+            return None
+        if self.max_adapters <= 0:
+            raise ValueError(f"adapter {name} requested, but max_adapters is 0")
+        lora_id = self.adapter_ids.setdefault(name, len(self.adapter_ids) + 1)
+        return LoRARequest(name, lora_id, path)
+
+    def _warmup(self, messages, argument):
+        async def generate():
+            params = self._create_sampling_params(argument)
+            async for _ in self.engine.generate(None, params, uuid.uuid4().hex, prompt_token_ids=prompt_ids,
+                                                lora_request=self._lora_request(argument)):
+                pass
+
+        prompt_ids = self.chat_template.encode(messages)
+        asyncio.run_coroutine_threadsafe(generate(), self.loop).result()
+
+    def _log_cache_stats(self):
+        if self.response_cache is not None:
+            pd_utils.Logger.log_info(f"response cache stats: {json.dumps(self.response_cache.stats())}")
+
+    def _record_stats(self, output, completion, arrival_time, end_time=None):
+        # vLLM timestamps every request from the moment it was added to the
+        # engine until it finished.
+        m = output.metrics
+        end_time = end_time or m.finished_time or m.last_token_time
+        first_scheduled_time = m.first_scheduled_time or arrival_time
+        first_token_time = m.first_token_time or end_time
+        stats = create_stats(
+            first_scheduled_time - arrival_time,
+            first_token_time - first_scheduled_time,
+            end_time - first_token_time,
+            len(output.prompt_token_ids),
+            len(completion.token_ids),
+        )
+        self.metrics.record(stats)
+        return stats
+
+    def _cache_key(self, messages, argument, prompt_ids=None):
+        if self.response_cache is None:
+            return None
+        return self.response_cache.key(messages, argument, prompt_ids)
+
+    def _send_results(self, sender, indices, completions, stats=None, return_ids=False):
+        output_results = []
+        output_ids = []
+        for k, index in enumerate(indices):
+            completion = completions[k % len(completions)]
+            result = {
+                'index': index,
+                'role': 'assistant',
+                'content': completion['content'],
+                'finish_reason': completion['finish_reason'],
+            }
+            if stats is not None and self.return_metrics:
+                result['metrics'] = stats[k % len(stats)]
+            output_results.append(json.dumps(result))
+            output_ids.append(completion.get('output_ids', []))
+        output_tensors = [
+            pd_utils.Tensor('results', np.array(output_results, dtype=object)),
+        ]
+        if return_ids:
+            output_tensors.append(output_ids_tensor(output_ids))
+        sender.send(pd_utils.InferenceResponse(output_tensors=output_tensors))
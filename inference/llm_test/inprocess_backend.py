@@ -0,0 +1,219 @@
+"""Runs a `generate` model of the Triton Python backend inside this process.
+
+The module provides the parts of `triton_python_backend_utils` that the
+`generate` models use, and registers itself under that name, so that a
+staged model directory (the `model_repository/generate` that `setup.sh`
+builds, with `common` copied into its version) can be loaded, warmed up
+and executed without a Triton server.
+"""
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+TRITONSERVER_RESPONSE_COMPLETE_FINAL = 1
+
+logger = logging.getLogger(__name__)
+
+
+class TritonError:
+
+    def __init__(self, message):
+        self._message = message
+
+    def message(self):
+        return self._message
+
+
+class TritonModelException(Exception):
+    pass
+
+
+class Tensor:
+
+    def __init__(self, name, array):
+        self._name = name
+        self._array = array
+
+    def name(self):
+        return self._name
+
+    def as_numpy(self):
+        return self._array
+
+
+class InferenceResponse:
+
+    def __init__(self, output_tensors, error=None):
+        self._output_tensors = [_delivered(tensor) for tensor in output_tensors]
+        self._error = error
+
+    def output_tensors(self):
+        return self._output_tensors
+
+    def has_error(self):
+        return self._error is not None
+
+    def error(self):
+        return self._error
+
+
+def _delivered(tensor):
+    # Triton serializes BYTES tensors, so clients always receive bytes
+    array = tensor.as_numpy()
+    if array.dtype == object:
+        array = np.array([v.encode('utf-8') if isinstance(v, str) else v for v in array.reshape(-1)],
+                         dtype=object).reshape(array.shape)
+    return Tensor(tensor.name(), array)
+
+
+class ResponseSender:
+    """Keeps the responses of a decoupled model with the time they were sent."""
+
+    def __init__(self, on_send=None):
+        self.responses = []
+        self.on_send = on_send
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def send(self, response=None, flags=0):
+        sent = (time.perf_counter(), response)
+        self.responses.append(sent)
+        if self.on_send is not None:
+            self.on_send(*sent)
+        if flags & TRITONSERVER_RESPONSE_COMPLETE_FINAL:
+            self.done.set()
+
+    def is_cancelled(self):
+        return self.cancelled
+
+
+class InferenceRequest:
+
+    def __init__(self, inputs, requested_output_names=None, on_send=None):
+        self._inputs = {tensor.name(): tensor for tensor in inputs}
+        self._requested_output_names = list(requested_output_names or [])
+        self.sender = ResponseSender(on_send)
+
+    def inputs(self):
+        return list(self._inputs.values())
+
+    def requested_output_names(self):
+        return self._requested_output_names
+
+    def get_response_sender(self):
+        return self.sender
+
+    def is_cancelled(self):
+        return self.sender.cancelled
+
+
+class Logger:
+
+    @staticmethod
+    def log_info(message):
+        logger.info(message)
+
+    @staticmethod
+    def log_warn(message):
+        logger.warning(message)
+
+    @staticmethod
+    def log_error(message):
+        logger.error(message)
+
+    @staticmethod
+    def log_verbose(message):
+        logger.debug(message)
+
+
+class Metric:
+
+    def __init__(self, labels, buckets=None):
+        self.labels = labels
+        self.buckets = buckets
+        self.values = []
+
+    def increment(self, value):
+        self.values.append(value)
+
+    def set(self, value):
+        self.values = [value]
+
+    def observe(self, value):
+        self.values.append(value)
+
+    def value(self):
+        return sum(self.values)
+
+
+class MetricFamily:
+    COUNTER = 'counter'
+    GAUGE = 'gauge'
+    HISTOGRAM = 'histogram'
+
+    def __init__(self, name, description, kind):
+        self.name = name
+        self.description = description
+        self.kind = kind
+
+    def Metric(self, labels=None, buckets=None):
+        return Metric(labels or {}, buckets)
+
+
+def get_input_tensor_by_name(request, name):
+    return request._inputs.get(name)
+
+
+def using_decoupled_model_transaction_policy(model_config):
+    return model_config.get('model_transaction_policy', {}).get('decoupled', False)
+
+
+def read_model_config(model_dir, config_name=None):
+    """`config.pbtxt` of a model, or `configs/<config_name>.pbtxt`, as the JSON Triton gives `initialize`."""
+    from google.protobuf import json_format, text_format
+    from tritonclient.grpc import model_config_pb2
+
+    config_file = os.path.join(model_dir, 'configs', f'{config_name}.pbtxt') if config_name else \
+        os.path.join(model_dir, 'config.pbtxt')
+    with open(config_file, 'r', encoding='utf-8') as in_file:
+        config = text_format.Parse(in_file.read(), model_config_pb2.ModelConfig())
+    model_config = json_format.MessageToDict(config, preserving_proto_field_name=True)
+    # fields left at their default are missing from the JSON of the message
+    model_config.setdefault('max_batch_size', 0)
+    model_config.setdefault('parameters', {})
+    return model_config
+
+
+def load_model(model_dir, model_version='1', config_name=None, parameters=None):
+    """Import, initialize and return the `TritonPythonModel` of a staged model directory and its config.
+
+    `parameters` override the string parameters of the model config.
+    """
+    sys.modules.setdefault('triton_python_backend_utils', sys.modules[__name__])
+    model_config = read_model_config(model_dir, config_name)
+    for key, value in (parameters or {}).items():
+        model_config['parameters'][key] = {'string_value': value}
+
+    version_dir = os.path.abspath(os.path.join(model_dir, model_version))
+    if version_dir not in sys.path:
+        sys.path.insert(0, version_dir)
+    spec = importlib.util.spec_from_file_location('model', os.path.join(version_dir, 'model.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    model = module.TritonPythonModel()
+    model.initialize({
+        'model_config': json.dumps(model_config),
+        'model_instance_kind': 'CPU',
+        'model_instance_device_id': '0',
+        'model_repository': os.path.abspath(model_dir),
+        'model_version': model_version,
+        'model_name': model_config.get('name', os.path.basename(os.path.abspath(model_dir))),
+    })
+    return model, model_config
@@ -0,0 +1,143 @@
+import asyncio
+import itertools
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARRIVALS = ('poisson', 'fixed')
+
+
+def warn_response_cache(model_config):
+    """Warn when the response cache of the model is on, since repeated greedy requests are then served from it."""
+    parameters = model_config.get('parameters', {})
+    capacity_bytes = int(parameters.get('response_cache_bytes', {}).get('string_value', '0'))
+    if capacity_bytes > 0:
+        logger.warning(f"response cache of {capacity_bytes} bytes is on, repeated greedy requests measure cache hits, "
+                       f"set response_cache_bytes to \"0\" in config.pbtxt to measure generation")
+
+
+def arrival_schedule(examples, qps, arrivals, end_seconds, seed=None):
+    """(offset in seconds, example) pairs arriving at `qps` until `end_seconds`, cycling through the examples.
+
+    Gaps between `poisson` arrivals are exponential with a mean of 1 / `qps`,
+    `fixed` arrivals are evenly spaced.
+    """
+    if arrivals not in ARRIVALS:
+        raise ValueError(f"unsupported arrivals: {arrivals}")
+    rng = np.random.default_rng(seed)
+    schedule, offset = [], 0.0
+    while True:
+        offset += rng.exponential(1.0 / qps) if arrivals == 'poisson' else 1.0 / qps
+        if offset >= end_seconds:
+            return schedule
+        schedule.append((offset, examples[len(schedule) % len(examples)]))
+
+
+async def run_schedule(send, schedule, concurrency):
+    """Send every example of `schedule` at its offset, with at most `concurrency` requests in flight.
+
+    Latency is counted from the scheduled arrival, so the time a request
+    waits for a free slot is part of it, the way it is for a client whose
+    requests arrive on their own schedule.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    start_time = time.perf_counter()
+    records = []
+
+    async def issue(offset, example):
+        async with semaphore:
+            record = {"id": example["id"], "offset": offset, "start": time.perf_counter() - start_time}
+            try:
+                await send(example)
+                record["error"] = None
+            except Exception as e:
+                record["error"] = str(e)
+            record["end"] = time.perf_counter() - start_time
+            record["latency"] = record["end"] - offset
+            records.append(record)
+
+    tasks = []
+    for offset, example in schedule:
+        delay = start_time + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(issue(offset, example)))
+    await asyncio.gather(*tasks)
+    return sorted(records, key=lambda d: d["offset"])
+
+
+async def run_closed_loop(send, examples, concurrency, end_seconds):
+    """Keep `concurrency` requests in flight until `end_seconds`, cycling through the examples."""
+    start_time = time.perf_counter()
+    records = []
+    counter = itertools.count()
+
+    async def worker():
+        while time.perf_counter() - start_time < end_seconds:
+            example = examples[next(counter) % len(examples)]
+            record = {"id": example["id"], "offset": time.perf_counter() - start_time}
+            record["start"] = record["offset"]
+            try:
+                await send(example)
+                record["error"] = None
+            except Exception as e:
+                record["error"] = str(e)
+            record["end"] = time.perf_counter() - start_time
+            record["latency"] = record["end"] - record["offset"]
+            records.append(record)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return sorted(records, key=lambda d: d["offset"])
+
+
+def summarize(records, window_start, window_end):
+    """Throughput, error rate and latency percentiles of the requests arriving within the window."""
+    measured = [d for d in records if window_start <= d["offset"] < window_end]
+    latencies = [d["latency"] for d in measured if d["error"] is None]
+    window = window_end - window_start
+    num_errors = sum(d["error"] is not None for d in measured)
+    return {
+        "num_requests": len(measured),
+        "num_errors": num_errors,
+        "error_rate": num_errors / len(measured) if measured else None,
+        "offered_qps": len(measured) / window if window > 0 else None,
+        "throughput": len(latencies) / window if window > 0 else None,
+        "latency_mean": float(np.mean(latencies)) if latencies else None,
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p90": float(np.percentile(latencies, 90)) if latencies else None,
+        "latency_p99": float(np.percentile(latencies, 99)) if latencies else None,
+    }
+
+
+async def run_load(send, examples, concurrency, qps, arrivals, warmup_seconds, duration_seconds, seed=None):
+    """Load a model for `warmup_seconds` plus `duration_seconds` and summarize the measurement window.
+
+    Requests arrive at `qps`, or back to back from `concurrency` clients
+    when `qps` is 0. Requests arriving during the warmup are sent but not
+    measured.
+    """
+    end_seconds = warmup_seconds + duration_seconds
+    if qps > 0:
+        schedule = arrival_schedule(examples, qps, arrivals, end_seconds, seed)
+        logger.info(f"send {len(schedule)} requests at {qps} qps with {arrivals} arrivals, concurrency {concurrency}")
+        records = await run_schedule(send, schedule, concurrency)
+    else:
+        logger.info(f"send requests from {concurrency} concurrent clients for {end_seconds}s")
+        records = await run_closed_loop(send, examples, concurrency, end_seconds)
+    summary = summarize(records, warmup_seconds, end_seconds)
+    summary.update({"concurrency": concurrency, "qps": qps, "arrivals": arrivals if qps > 0 else None})
+    return summary, records
+
+
+def summarize_segments(records, segment_seconds, end_seconds, speed=1.0):
+    """Summaries of consecutive segments of `segment_seconds` of trace time, for records replayed at `speed`."""
+    segments, start = [], 0.0
+    while start < end_seconds:
+        end = min(start + segment_seconds, end_seconds)
+        summary = summarize(records, start / speed, end / speed)
+        segments.append({"segment": len(segments), "trace_start": start, "trace_end": end, **summary})
+        start = end
+    return segments
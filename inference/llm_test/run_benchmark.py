@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import logging
+import queue
+import resource
+import time
+
+import numpy as np
+
+from pathlib import Path
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    ('runtime', '{}'),
+    ('mode', '{}'),
+    ('num_requests', '{}'),
+    ('prefill_tokens_per_second', '{:.1f}'),
+    ('decode_tokens_per_second', '{:.1f}'),
+    ('ttft_p50', '{:.4f}'),
+    ('ttft_p95', '{:.4f}'),
+    ('latency_p50', '{:.4f}'),
+    ('latency_p95', '{:.4f}'),
+    ('latency_p99', '{:.4f}'),
+    ('peak_rss_mb', '{:.0f}'),
+]
+
+
+def merge_deltas(results, deltas, recv_time, token_times):
+    for delta in deltas:
+        result = results[delta["index"]]
+        result["content"] += delta["content"]
+        if delta["finish_reason"]:
+            result["finish_reason"] = delta["finish_reason"]
+        if "metrics" in delta:
+            result["metrics"] = delta["metrics"]
+        if delta["content"]:
+            token_times.append(recv_time)
+
+
+class InProcessClient:
+    """Drives a staged `generate` model in this process, decoupled or not as its config says."""
+
+    def __init__(self, model_dir, model_version, config_name, timeout):
+        import inprocess_backend
+
+        self.backend = inprocess_backend
+        self.timeout = timeout
+        start_time = time.perf_counter()
+        # every result carries the figures the model measured for it, and none
+        # is served from the response cache, whose results carry no figures
+        self.model, model_config = inprocess_backend.load_model(model_dir, model_version, config_name,
+                                                                parameters={'return_metrics': 'true',
+                                                                            'response_cache_bytes': '0'})
+        self.load_seconds = time.perf_counter() - start_time
+        self.batching = model_config['max_batch_size'] > 0
+        self.decoupled = inprocess_backend.using_decoupled_model_transaction_policy(model_config)
+
+    def generate(self, example):
+        """Results of an example and the times its non-empty deltas arrived, if streamed."""
+        inputs = []
+        for name in ("messages", "arguments"):
+            # Triton delivers BYTES inputs to the model as bytes
+            values = np.array([json.dumps(d).encode("utf-8") for d in example["input"][name]], dtype=object)
+            inputs.append(self.backend.Tensor(name, values.reshape(1, -1) if self.batching else values))
+        request = self.backend.InferenceRequest(inputs, ["results"])
+        responses = self.model.execute([request])
+        if not self.decoupled:
+            response = responses[0]
+            if response.has_error():
+                raise RuntimeError(response.error().message())
+            results = [t.as_numpy() for t in response.output_tensors() if t.name() == "results"][0]
+            return [json.loads(d.decode("utf-8")) for d in results.reshape(-1).tolist()], []
+
+        if not request.sender.done.wait(self.timeout):
+            request.sender.cancelled = True
+            raise TimeoutError(f"no final response for {example['id']} in {self.timeout}s")
+        results = [{"role": "assistant", "content": ""} for _ in example["input"]["arguments"]]
+        token_times = []
+        for recv_time, response in request.sender.responses:
+            if response is None:
+                continue
+            if response.has_error():
+                raise RuntimeError(response.error().message())
+            deltas = [t.as_numpy() for t in response.output_tensors() if t.name() == "results"][0]
+            deltas = [json.loads(d.decode("utf-8")) for d in deltas.reshape(-1).tolist()]
+            merge_deltas(results, deltas, recv_time, token_times)
+        return results, token_times
+
+    def peak_rss_bytes(self):
+        # runtimes may decode in worker processes, e.g. vLLM
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+
+    def close(self):
+        if hasattr(self.model, 'finalize'):
+            self.model.finalize()
+
+
+class GrpcClient:
+    """Drives the `generate` model of a Triton server, streaming from it with `stream`."""
+
+    def __init__(self, model_endpoint, model_name, model_version, stream, timeout, server_pid=None):
+        import tritonclient.grpc
+
+        self.grpc = tritonclient.grpc
+        self.model_name = model_name
+        self.model_version = model_version
+        self.decoupled = stream
+        self.timeout = timeout
+        self.server_pid = server_pid
+        self.load_seconds = None
+        self.triton_client = tritonclient.grpc.InferenceServerClient(url=model_endpoint,
+                                                                     network_timeout=timeout,
+                                                                     connection_timeout=timeout,
+                                                                     verbose=False)
+        model_config = self.triton_client.get_model_config(model_name=model_name, model_version=model_version,
+                                                           as_json=True)['config']
+        self.batching = int(model_config.get('max_batch_size', 0)) > 0
+        self.responses = queue.Queue()
+        if stream:
+            self.triton_client.start_stream(callback=lambda result, error: self.responses.put(
+                (time.perf_counter(), result, error)))
+
+    def generate(self, example):
+        from run_grpc import create_inputs
+
+        inputs = list(create_inputs(example, self.batching))
+        outputs = [self.grpc.InferRequestedOutput(name="results", binary_data=True)]
+        if not self.decoupled:
+            infer_results = self.triton_client.infer(model_name=self.model_name,
+                                                     model_version=self.model_version,
+                                                     inputs=inputs,
+                                                     outputs=outputs,
+                                                     timeout=self.timeout)
+            results = infer_results.as_numpy("results").reshape(-1).tolist()
+            return [json.loads(d.decode("utf-8")) for d in results], []
+
+        self.triton_client.async_stream_infer(model_name=self.model_name,
+                                              model_version=self.model_version,
+                                              inputs=inputs,
+                                              outputs=outputs,
+                                              request_id=example["id"],
+                                              enable_empty_final_response=True)
+        results = [{"role": "assistant", "content": ""} for _ in example["input"]["arguments"]]
+        token_times = []
+        while True:
+            recv_time, infer_result, error = self.responses.get(timeout=self.timeout)
+            if error:
+                raise error
+            deltas = infer_result.as_numpy("results")
+            deltas = deltas.reshape(-1).tolist() if deltas is not None else []
+            merge_deltas(results, [json.loads(d.decode("utf-8")) for d in deltas], recv_time, token_times)
+            if infer_result.get_response().parameters["triton_final_response"].bool_param:
+                break
+        return results, token_times
+
+    def peak_rss_bytes(self):
+        # the high water mark of the server process, when it is on this host
+        if self.server_pid is None:
+            return None
+        with open(f'/proc/{self.server_pid}/status', 'r', encoding='utf-8') as in_file:
+            for line in in_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+        return None
+
+    def close(self):
+        if self.decoupled:
+            self.triton_client.stop_stream()
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def bench_runtime(client, examples, num_runs, num_warmup):
+    # Requests are sent one at a time, so the figures are those of a single
+    # sequence stream and compare runtimes, not their batching.
+    for example in examples[:num_warmup]:
+        client.generate(example)
+
+    request_stats, sequence_metrics = [], []
+    start_time = time.perf_counter()
+    for _ in range(num_runs):
+        for example in examples:
+            request_start = time.perf_counter()
+            results, token_times = client.generate(example)
+            latency = time.perf_counter() - request_start
+            metrics = [d["metrics"] for d in results if "metrics" in d]
+            sequence_metrics.extend(metrics)
+            # streamed requests are timed by the client, others by the model
+            if token_times:
+                ttft = token_times[0] - request_start
+            elif metrics:
+                ttft = min(m["ttft"] for m in metrics)
+            else:
+                ttft = None
+            request_stats.append({
+                "id": example["id"],
+                "latency": latency,
+                "ttft": ttft,
+                "completion_tokens": sum(m["completion_tokens"] for m in metrics),
+            })
+    elapsed = time.perf_counter() - start_time
+
+    latencies = [d["latency"] for d in request_stats]
+    ttfts = [d["ttft"] for d in request_stats if d["ttft"] is not None]
+    prompt_tokens = sum(m["prompt_tokens"] for m in sequence_metrics)
+    prefill_time = sum(m["prefill_time"] for m in sequence_metrics)
+    decode_rates = [m["decode_tokens_per_second"] for m in sequence_metrics if m["decode_tokens_per_second"] > 0]
+    peak_rss_bytes = client.peak_rss_bytes()
+    summary = {
+        "num_requests": len(request_stats),
+        "num_sequences": len(sequence_metrics),
+        "load_seconds": client.load_seconds,
+        "prefill_tokens_per_second": prompt_tokens / prefill_time if prefill_time > 0 else None,
+        "decode_tokens_per_second": float(np.mean(decode_rates)) if decode_rates else None,
+        "completion_tokens_per_second": sum(d["completion_tokens"] for d in request_stats) / elapsed,
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "ttft_p99": percentile(ttfts, 99),
+        "latency_mean": float(np.mean(latencies)),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_bytes / 2 ** 20 if peak_rss_bytes is not None else None,
+    }
+    return summary, request_stats
+
+
+def format_table(summaries):
+    rows = [[name for name, _ in COLUMNS]]
+    for summary in summaries:
+        rows.append([fmt.format(summary[name]) if summary.get(name) is not None else '-' for name, fmt in COLUMNS])
+    widths = [max(len(row[k]) for row in rows) for k in range(len(COLUMNS))]
+    return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runtime', type=str, help='runtime name to report, e.g. vllm, gguf, onnx or pyt')
+    parser.add_argument('--mode', type=str, default='inprocess', choices=['inprocess', 'grpc'],
+                        help='load the model in this process or send requests to a triton server')
+    parser.add_argument('--test_file', type=str, help='workload file, in the format of test_generate.json')
+    parser.add_argument('--output_dir', type=str, help='output directory')
+    parser.add_argument('--model_dir', type=str, help='staged generate model directory, for inprocess mode')
+    parser.add_argument('--model_config_name', type=str, default=None,
+                        help='config under configs/ to load instead of config.pbtxt, e.g. stream')
+    parser.add_argument('--model_endpoint', type=str, help='model endpoint, for grpc mode')
+    parser.add_argument('--model_name', type=str, default='generate', help='model name')
+    parser.add_argument('--model_version', type=str, default='1', help='model version')
+    parser.add_argument('--stream', action='store_true', help='whether to stream results from a decoupled model')
+    parser.add_argument('--server_pid', type=int, default=None, help='pid of tritonserver, to report its peak rss')
+    parser.add_argument('--num_runs', type=int, default=3, help='number of passes over the workload')
+    parser.add_argument('--num_warmup', type=int, default=1, help='number of untimed requests')
+    parser.add_argument('--timeout', type=float, default=600.0, help='timeout')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    with open(args.test_file, "r", encoding="utf-8") as in_file:
+        examples = json.load(in_file)
+
+    if args.mode == 'inprocess':
+        client = InProcessClient(args.model_dir, args.model_version, args.model_config_name, args.timeout)
+    else:
+        client = GrpcClient(args.model_endpoint, args.model_name, args.model_version, args.stream, args.timeout,
+                            args.server_pid)
+    try:
+        summary, request_stats = bench_runtime(client, examples, args.num_runs, args.num_warmup)
+    finally:
+        client.close()
+    summary = {"runtime": args.runtime, "mode": args.mode, "stream": client.decoupled, **summary}
+    logger.info(summary)
+
+    # Every run appends its summary, so that runtimes benchmarked one after
+    # another, each in its own environment, end up in one table.
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    summary_file = os.path.join(args.output_dir, "benchmark_summary.json")
+    with open(summary_file, "a", encoding="utf-8") as out_file:
+        out_file.write(f"{json.dumps(summary)}\n")
+    stats_file = os.path.join(args.output_dir, f"benchmark_stats.{args.runtime}.{args.mode}.json")
+    with open(stats_file, "w", encoding="utf-8") as out_file:
+        for d in request_stats:
+            out_file.write(f"{json.dumps(d)}\n")
+
+    with open(summary_file, "r", encoding="utf-8") as in_file:
+        summaries = [json.loads(line) for line in in_file if line.strip()]
+    logger.info(f'benchmark summary of {summary_file}\n{format_table(summaries)}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../llm/gguf/model_repository/generate/1'))
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def bench_pool(model_path, pool_size, num_cores, n_ctx, prompt, max_tokens, num_requests, stats):
+    from context_pool import ContextPool
+
+    n_threads = max(num_cores // pool_size, 1)
+    start_time = time.perf_counter()
+    pool = ContextPool(model_path, pool_size, n_threads, n_ctx=n_ctx, n_gpu_layers=0, verbose=False)
+    load_time = time.perf_counter() - start_time
+
+    def complete(_):
+        with pool.acquire() as context:
+            start_time = time.perf_counter()
+            output = context(prompt, max_tokens=max_tokens, temperature=0.0)
+            return output['usage']['completion_tokens'], time.perf_counter() - start_time
+
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        # one untimed completion per context to warm up the kernels
+        list(executor.map(complete, range(pool_size)))
+        start_time = time.perf_counter()
+        results = list(executor.map(complete, range(num_requests)))
+        elapsed = time.perf_counter() - start_time
+
+    completion_tokens = sum(tokens for tokens, _ in results)
+    stats.update({
+        'pool_size': pool_size,
+        'n_threads': n_threads,
+        'load_time': load_time,
+        'startup': pool.timing,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'latency_mean': sum(latency for _, latency in results) / len(results),
+        'tokens_per_second': completion_tokens / elapsed,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_path', type=str, help='path of a gguf model file')
+    parser.add_argument('--output_dir', type=str, help='output directory')
+    parser.add_argument('--pool_sizes', type=str, default='1,2,4,8', help='comma separated pool sizes')
+    parser.add_argument('--num_cores', type=int, default=os.cpu_count(), help='cores split across the contexts')
+    parser.add_argument('--n_ctx', type=int, default=2048, help='context length of every context')
+    parser.add_argument('--prompt', type=str, default='The quick brown fox jumps over the lazy dog.', help='prompt')
+    parser.add_argument('--max_tokens', type=int, default=64, help='number of tokens to generate')
+    parser.add_argument('--num_requests', type=int, default=32, help='number of concurrent requests')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    # Every pool size runs in its own process so that peak memory is not
+    # shared between them.
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for pool_size in [int(n) for n in args.pool_sizes.split(',')]:
+        with context.Manager() as manager:
+            stats = manager.dict()
+            process = context.Process(target=bench_pool,
+                                      args=(args.model_path, pool_size, args.num_cores, args.n_ctx, args.prompt,
+                                            args.max_tokens, args.num_requests, stats))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"benchmark of pool size {pool_size} failed with exit code {process.exitcode}")
+            stat = dict(stats)
+        logger.info(stat)
+        results.append(stat)
+
+    logger.info(f'save stats to {args.output_dir}')
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(args.output_dir, "context_pool_stats.json")
+    with open(output_file, "w", encoding="utf-8") as out_file:
+        for d in results:
+            line = json.dumps(d)
+            out_file.write(f"{line}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import logging
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../llm/pyt/model_repository/generate/1'))
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROFILES = {
+    'fp32': {'device': 'cpu', 'dtype': 'fp32', 'quantization': 'none'},
+    'bf16': {'device': 'cpu', 'dtype': 'bf16', 'quantization': 'none'},
+    'int8': {'device': 'cpu', 'dtype': 'fp32', 'quantization': 'int8'},
+}
+
+
+def bench_profile(model_path, profile, prompt, max_new_tokens, num_runs, num_threads, cache_dir, stats):
+    import torch
+
+    from model_loader import load_model
+    from transformers import AutoTokenizer
+
+    config = dict(PROFILES[profile], num_threads=num_threads, quantization_cache_dir=cache_dir)
+    start_time = time.perf_counter()
+    model, cached = load_model(model_path, config)
+    load_time = time.perf_counter() - start_time
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    input_ids = tokenizer(prompt, return_tensors='pt').input_ids
+
+    # one untimed run to warm up the kernels
+    generation_args = {'max_new_tokens': max_new_tokens, 'min_new_tokens': max_new_tokens, 'do_sample': False}
+    with torch.no_grad():
+        model.generate(input_ids, **generation_args)
+        latencies = []
+        for _ in range(num_runs):
+            start_time = time.perf_counter()
+            model.generate(input_ids, **generation_args)
+            latencies.append(time.perf_counter() - start_time)
+
+    # packed weights of quantized Linear layers are stored as (weight, bias) tuples
+    model_bytes = 0
+    for value in model.state_dict().values():
+        for t in (value if isinstance(value, tuple) else (value,)):
+            if isinstance(t, torch.Tensor):
+                model_bytes += t.numel() * t.element_size()
+    stats.update({
+        'profile': profile,
+        'load_time': load_time,
+        'from_cache': cached,
+        'model_bytes': model_bytes,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'latency_mean': sum(latencies) / len(latencies),
+        'tokens_per_second': max_new_tokens * len(latencies) / sum(latencies),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_path', type=str, help='model name or directory of a small causal LM')
+    parser.add_argument('--output_dir', type=str, help='output directory')
+    parser.add_argument('--profiles', type=str, default='fp32,bf16,int8', help='comma separated cpu profiles')
+    parser.add_argument('--prompt', type=str, default='The quick brown fox jumps over the lazy dog.', help='prompt')
+    parser.add_argument('--max_new_tokens', type=int, default=64, help='number of tokens to generate')
+    parser.add_argument('--num_runs', type=int, default=5, help='number of runs per profile')
+    parser.add_argument('--num_threads', type=int, default=0, help='number of cpu threads, 0 keeps the default')
+    parser.add_argument('--cache_dir', type=str, default=None, help='quantization cache directory')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    cache_dir = args.cache_dir or tempfile.mkdtemp()
+    model_path = args.model_path
+    if not os.path.isdir(model_path):
+        from huggingface_hub import snapshot_download
+        model_path = snapshot_download(model_path)
+    # Every profile runs in its own process so that peak memory is not
+    # shared between them; int8 runs a second time to load from the cache.
+    profiles = args.profiles.split(',')
+    if 'int8' in profiles:
+        profiles.append('int8')
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for profile in profiles:
+        with context.Manager() as manager:
+            stats = manager.dict()
+            process = context.Process(target=bench_profile,
+                                      args=(model_path, profile, args.prompt, args.max_new_tokens,
+                                            args.num_runs, args.num_threads, cache_dir, stats))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"benchmark of profile {profile} failed with exit code {process.exitcode}")
+            stat = dict(stats)
+        logger.info(stat)
+        results.append(stat)
+
+    logger.info(f'save stats to {args.output_dir}')
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(args.output_dir, "cpu_profile_stats.json")
+    with open(output_file, "w", encoding="utf-8") as out_file:
+        for d in results:
+            line = json.dumps(d)
+            out_file.write(f"{line}\n")
+
+
+if __name__ == "__main__":
+    main()
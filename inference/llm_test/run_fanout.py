@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import logging
+import time
+
+import numpy as np
+import tritonclient.grpc
+
+from pathlib import Path
+from load_generator import warn_response_cache
+from run_grpc import create_inputs
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def fan_out_example(example, num_arguments, temperatures):
+    # Repeat the first argument set of the example, cycling through the given
+    # temperatures so that the request mixes identical and distinct sets.
+    argument = example["input"]["arguments"][0]
+    arguments = [
+        dict(argument, temperature=temperatures[k % len(temperatures)])
+        for k in range(num_arguments)
+    ]
+    return {
+        "id": f'{example["id"]}-{num_arguments}',
+        "input": {
+            "messages": example["input"]["messages"],
+            "arguments": arguments,
+        },
+    }
+
+
+def bench_fan_out(examples, num_arguments_list, temperatures, num_runs,
+                  model_endpoint, model_name, model_version, timeout):
+    triton_client = tritonclient.grpc.InferenceServerClient(url=model_endpoint,
+                                                            network_timeout=timeout,
+                                                            connection_timeout=timeout,
+                                                            verbose=False)
+    model_config = triton_client.get_model_config(model_name=model_name, model_version=model_version, as_json=True)['config']
+    batching = int(model_config.get('max_batch_size', 0)) > 0
+    fan_out = model_config.get('parameters', {}).get('fan_out', {}).get('string_value', 'true')
+    logger.info(f"benchmark model {model_name} with fan_out = {fan_out}")
+    warn_response_cache(model_config)
+
+    stats = []
+    for num_arguments in num_arguments_list:
+        latencies = []
+        for example in examples:
+            example = fan_out_example(example, num_arguments, temperatures)
+            input_messages, input_arguments = create_inputs(example, batching)
+            output_results = tritonclient.grpc.InferRequestedOutput(name="results", binary_data=True)
+            for _ in range(num_runs):
+                start_time = time.perf_counter()
+                infer_results = triton_client.infer(model_name=model_name,
+                                                    model_version=model_version,
+                                                    inputs=[input_messages, input_arguments],
+                                                    outputs=[output_results],
+                                                    timeout=timeout)
+                latencies.append(time.perf_counter() - start_time)
+                num_results = infer_results.as_numpy("results").size
+                if num_results != num_arguments:
+                    raise ValueError(f"expected {num_arguments} results, got {num_results}")
+
+        stat = {
+            "fan_out": fan_out,
+            "num_arguments": num_arguments,
+            "num_requests": len(latencies),
+            "latency_mean": float(np.mean(latencies)),
+            "latency_p50": float(np.percentile(latencies, 50)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+            "latency_per_argument": float(np.mean(latencies)) / num_arguments,
+        }
+        logger.info(stat)
+        stats.append(stat)
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--test_file', type=str, help='test file')
+    parser.add_argument('--output_dir', type=str, help='output directory')
+    parser.add_argument('--model_endpoint', type=str, help='model endpoint')
+    parser.add_argument('--model_name', type=str, help='modle name')
+    parser.add_argument('--model_version', type=str, help='model version')
+    parser.add_argument('--timeout', type=float, help='timeout')
+    parser.add_argument('--num_arguments', type=str, default='8,16', help='comma separated numbers of argument sets')
+    parser.add_argument('--temperatures', type=str, default='0.0,0.7', help='comma separated temperatures to cycle through')
+    parser.add_argument('--num_runs', type=int, default=5, help='number of runs per example')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    with open(args.test_file, "r", encoding="utf-8") as in_file:
+        test_examples = json.load(in_file)
+
+    stats = bench_fan_out(test_examples,
+                          [int(n) for n in args.num_arguments.split(',')],
+                          [float(t) for t in args.temperatures.split(',')],
+                          args.num_runs,
+                          args.model_endpoint,
+                          args.model_name,
+                          args.model_version,
+                          args.timeout)
+
+    logger.info(f'save stats to {args.output_dir}')
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(args.output_dir, "fanout_stats.json")
+    with open(output_file, "w", encoding="utf-8") as out_file:
+        for d in stats:
+            line = json.dumps(d)
+            out_file.write(f"{line}\n")
+
+
+if __name__ == "__main__":
+    main()
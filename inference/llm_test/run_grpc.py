@@ -1,12 +1,16 @@
 import argparse
+import asyncio
 import json
 import os
 import logging
+import queue
+import time
 
 import numpy as np
 import tritonclient.grpc
 
 from pathlib import Path
+from load_generator import ARRIVALS, run_load, warn_response_cache
 
 logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
                     datefmt='%m/%d/%Y %I:%M:%S %p',
@@ -14,35 +18,181 @@ logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
 logger = logging.getLogger(__name__)
 
 
-def test_generate(examples, model_endpoint, model_name, model_version, timeout):
+def test_generate(examples, model_endpoint, model_name, model_version, timeout, tokenizer=None):
     triton_client = tritonclient.grpc.InferenceServerClient(url=model_endpoint,
                                                             network_timeout=timeout,
                                                             connection_timeout=timeout,
                                                             verbose=False)
     model_metadata = triton_client.get_model_metadata(model_name=model_name, model_version=model_version, as_json=True)
     logger.info(model_metadata)
+    model_config = triton_client.get_model_config(model_name=model_name, model_version=model_version, as_json=True)['config']
+    # models with dynamic batching enabled expect a leading batch dimension
+    batching = int(model_config.get('max_batch_size', 0)) > 0
+    # runtimes that cannot tell the generated ids apart do not declare them
+    return_ids = tokenizer is not None and any(o['name'] == 'output_ids' for o in model_config.get('output', []))
 
     results = []
     for example in examples:
-        messages = [json.dumps(d) for d in example["input"]["messages"]]
-        input_messages = tritonclient.grpc.InferInput(name="messages", shape=(len(messages),), datatype="BYTES")
-        input_messages.set_data_from_numpy(np.array(messages, dtype=object))
-
-        arguments = [json.dumps(d) for d in example["input"]["arguments"]]
-        input_arguments = tritonclient.grpc.InferInput(name="arguments", shape=(len(arguments),), datatype="BYTES")
-        input_arguments.set_data_from_numpy(np.array(arguments, dtype=object))
-
-        output_results = tritonclient.grpc.InferRequestedOutput(name="results", binary_data=True)
+        input_messages, input_arguments = create_inputs(example, batching, tokenizer)
+        outputs = [tritonclient.grpc.InferRequestedOutput(name="results", binary_data=True)]
+        if return_ids:
+            outputs.append(tritonclient.grpc.InferRequestedOutput(name="output_ids", binary_data=True))
         infer_results = triton_client.infer(model_name=model_name,
                                             model_version=model_version,
                                             inputs=[input_messages, input_arguments],
-                                            outputs=[output_results])
-        result = [json.loads(d.decode("utf-8")) for d in infer_results.as_numpy("results").tolist()]
+                                            outputs=outputs)
+        result = [json.loads(d.decode("utf-8")) for d in infer_results.as_numpy("results").reshape(-1).tolist()]
+        if return_ids:
+            # generated token ids are right-padded with -1
+            output_ids = infer_results.as_numpy("output_ids").reshape(len(result), -1).tolist()
+            for d, ids in zip(result, output_ids):
+                d["output_ids"] = [i for i in ids if i >= 0]
         results.append(result)
 
     return results
 
 
+def test_generate_stream(examples, model_endpoint, model_name, model_version, timeout, tokenizer=None):
+    triton_client = tritonclient.grpc.InferenceServerClient(url=model_endpoint,
+                                                            network_timeout=timeout,
+                                                            connection_timeout=timeout,
+                                                            verbose=False)
+    model_metadata = triton_client.get_model_metadata(model_name=model_name, model_version=model_version, as_json=True)
+    logger.info(model_metadata)
+    model_config = triton_client.get_model_config(model_name=model_name, model_version=model_version, as_json=True)['config']
+    batching = int(model_config.get('max_batch_size', 0)) > 0
+    # only the decoupled vllm_async model returns the ids of every finished sequence
+    return_ids = tokenizer is not None and any(o['name'] == 'output_ids' for o in model_config.get('output', []))
+
+    responses = queue.Queue()
+
+    def callback(result, error):
+        responses.put((time.perf_counter(), result, error))
+
+    triton_client.start_stream(callback=callback)
+    results, stats = [], []
+    for example in examples:
+        input_messages, input_arguments = create_inputs(example, batching, tokenizer)
+        outputs = [tritonclient.grpc.InferRequestedOutput(name="results", binary_data=True)]
+        if return_ids:
+            outputs.append(tritonclient.grpc.InferRequestedOutput(name="output_ids", binary_data=True))
+        start_time = time.perf_counter()
+        triton_client.async_stream_infer(model_name=model_name,
+                                         model_version=model_version,
+                                         inputs=[input_messages, input_arguments],
+                                         outputs=outputs,
+                                         request_id=example["id"],
+                                         enable_empty_final_response=True)
+
+        result = [{"role": "assistant", "content": ""} for _ in example["input"]["arguments"]]
+        token_times = []
+        while True:
+            recv_time, infer_result, error = responses.get(timeout=timeout)
+            if error:
+                raise error
+            deltas = infer_result.as_numpy("results")
+            deltas = deltas.reshape(-1).tolist() if deltas is not None else []
+            output_ids = infer_result.as_numpy("output_ids") if return_ids else None
+            output_ids = output_ids.reshape(len(deltas), -1).tolist() if output_ids is not None else [None] * len(deltas)
+            for d, ids in zip(deltas, output_ids):
+                delta = json.loads(d.decode("utf-8"))
+                if ids is not None:
+                    result[delta["index"]]["output_ids"] = [i for i in ids if i >= 0]
+                result[delta["index"]]["content"] += delta["content"]
+                if delta["finish_reason"]:
+                    result[delta["index"]]["finish_reason"] = delta["finish_reason"]
+                if delta["content"]:
+                    token_times.append(recv_time)
+            response = infer_result.get_response()
+            if response.parameters["triton_final_response"].bool_param:
+                break
+        results.append(result)
+
+        end_time = time.perf_counter()
+        inter_token_latencies = np.diff(token_times).tolist()
+        stat = {
+            "id": example["id"],
+            "ttft": token_times[0] - start_time if token_times else None,
+            "inter_token_latency": np.mean(inter_token_latencies) if inter_token_latencies else None,
+            "latency": end_time - start_time,
+            "num_deltas": len(token_times),
+        }
+        logger.info(stat)
+        stats.append(stat)
+    triton_client.stop_stream()
+
+    ttfts = [d["ttft"] for d in stats if d["ttft"] is not None]
+    inter_token_latencies = [d["inter_token_latency"] for d in stats if d["inter_token_latency"] is not None]
+    if ttfts:
+        logger.info(f"ttft p50 = {np.percentile(ttfts, 50):.4f}s, p99 = {np.percentile(ttfts, 99):.4f}s")
+    if inter_token_latencies:
+        logger.info(f"inter-token latency mean = {np.mean(inter_token_latencies):.4f}s")
+
+    return results, stats
+
+
+async def load_generate(examples, model_endpoint, model_name, model_version, timeout, concurrency, qps, arrivals,
+                        warmup_seconds, duration_seconds, seed=None, tokenizer=None):
+    async def drive(send):
+        return await run_load(send, examples, concurrency, qps, arrivals, warmup_seconds, duration_seconds, seed)
+
+    return await drive_generate(model_endpoint, model_name, model_version, timeout, drive, tokenizer)
+
+
+async def drive_generate(model_endpoint, model_name, model_version, timeout, drive, tokenizer=None):
+    # `drive` gets a coroutine function that sends one example, and decides
+    # when to send which.
+    import tritonclient.grpc.aio
+
+    triton_client = tritonclient.grpc.aio.InferenceServerClient(url=model_endpoint, verbose=False)
+    model_config = await triton_client.get_model_config(model_name=model_name, model_version=model_version, as_json=True)
+    batching = int(model_config['config'].get('max_batch_size', 0)) > 0
+    warn_response_cache(model_config['config'])
+
+    async def send(example):
+        output_results = tritonclient.grpc.InferRequestedOutput(name="results", binary_data=True)
+        infer_results = await triton_client.infer(model_name=model_name,
+                                                  model_version=model_version,
+                                                  inputs=list(create_inputs(example, batching, tokenizer)),
+                                                  outputs=[output_results],
+                                                  client_timeout=timeout)
+        num_results = infer_results.as_numpy("results").size
+        if num_results != len(example["input"]["arguments"]):
+            raise ValueError(f"expected {len(example['input']['arguments'])} results, got {num_results}")
+
+    try:
+        return await drive(send)
+    finally:
+        await triton_client.close()
+
+
+def create_inputs(example, batching, tokenizer=None):
+    if tokenizer is not None:
+        # the prompt is tokenized here, so the server skips its chat template
+        input_ids = tokenizer.apply_chat_template(example["input"]["messages"], add_generation_prompt=True)
+        input_ids = np.array(input_ids, dtype=np.int32)
+        if batching:
+            input_ids = input_ids.reshape(1, -1)
+        input_messages = tritonclient.grpc.InferInput(name="input_ids", shape=input_ids.shape, datatype="INT32")
+        input_messages.set_data_from_numpy(input_ids)
+    else:
+        messages = [json.dumps(d) for d in example["input"]["messages"]]
+        messages = np.array(messages, dtype=object)
+        if batching:
+            messages = messages.reshape(1, -1)
+        input_messages = tritonclient.grpc.InferInput(name="messages", shape=messages.shape, datatype="BYTES")
+        input_messages.set_data_from_numpy(messages)
+
+    arguments = [json.dumps(d) for d in example["input"]["arguments"]]
+    arguments = np.array(arguments, dtype=object)
+    if batching:
+        arguments = arguments.reshape(1, -1)
+    input_arguments = tritonclient.grpc.InferInput(name="arguments", shape=arguments.shape, datatype="BYTES")
+    input_arguments.set_data_from_numpy(arguments)
+
+    return input_messages, input_arguments
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--task_name', type=str, help='task name')
@@ -52,18 +202,56 @@ def main():
     parser.add_argument('--model_name', type=str, help='modle name')
     parser.add_argument('--model_version', type=str, help='model version')
     parser.add_argument('--timeout', type=float, help='timeout')
+    parser.add_argument('--stream', action='store_true', help='whether to stream results from a decoupled model')
+    parser.add_argument('--tokenizer', type=str, default=None,
+                        help='tokenizer of the model, to send tokenized prompts as input_ids')
+    parser.add_argument('--load', action='store_true', help='whether to load the model with concurrent requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='maximum number of requests in flight')
+    parser.add_argument('--qps', type=float, default=0.0, help='target requests per second, 0 to send back to back')
+    parser.add_argument('--arrivals', type=str, default='poisson', choices=ARRIVALS, help='arrival process at --qps')
+    parser.add_argument('--warmup_seconds', type=float, default=10.0, help='seconds of load before measuring')
+    parser.add_argument('--duration_seconds', type=float, default=60.0, help='seconds of load measured')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the poisson arrivals')
     args = parser.parse_args()
 
     logger.setLevel(logging.INFO)
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
     with open(args.test_file, "r", encoding="utf-8") as in_file:
         test_examples = json.load(in_file)
 
-    if args.task_name == "generate":
+    stats = None
+    if args.task_name == "generate" and args.load:
+        summary, stats = asyncio.run(load_generate(test_examples,
+                                                   args.model_endpoint,
+                                                   args.model_name,
+                                                   args.model_version,
+                                                   args.timeout,
+                                                   args.concurrency,
+                                                   args.qps,
+                                                   args.arrivals,
+                                                   args.warmup_seconds,
+                                                   args.duration_seconds,
+                                                   args.seed,
+                                                   tokenizer))
+        logger.info(f"load summary: {json.dumps(summary)}")
+        results = [summary]
+    elif args.task_name == "generate" and args.stream:
+        results, stats = test_generate_stream(test_examples,
+                                              args.model_endpoint,
+                                              args.model_name,
+                                              args.model_version,
+                                              args.timeout,
+                                              tokenizer)
+    elif args.task_name == "generate":
         results = test_generate(test_examples,
                                 args.model_endpoint,
                                 args.model_name,
                                 args.model_version,
-                                args.timeout)
+                                args.timeout,
+                                tokenizer)
     else:
         raise ValueError(f"unsupported task: {args.task_name}")
 
@@ -75,6 +263,13 @@ def main():
             line = json.dumps(d)
             out_file.write(f"{line}\n")
 
+    if stats is not None:
+        stats_file = os.path.join(args.output_dir, "test_stats.json")
+        with open(stats_file, "w", encoding="utf-8") as out_file:
+            for d in stats:
+                line = json.dumps(d)
+                out_file.write(f"{line}\n")
+
 
 if __name__ == "__main__":
     main()
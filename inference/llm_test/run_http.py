@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import json
 import os
 import logging
@@ -7,6 +8,7 @@ import numpy as np
 import tritonclient.http
 
 from pathlib import Path
+from load_generator import ARRIVALS, run_load, warn_response_cache
 
 logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
                     datefmt='%m/%d/%Y %I:%M:%S %p',
@@ -21,28 +23,76 @@ def test_generate(examples, model_endpoint, model_name, model_version, timeout):
                                                             verbose=False)
     model_metadata = triton_client.get_model_metadata(model_name=model_name, model_version=model_version)
     logger.info(model_metadata)
+    model_config = triton_client.get_model_config(model_name=model_name, model_version=model_version)
+    # models with dynamic batching enabled expect a leading batch dimension
+    batching = int(model_config.get('max_batch_size', 0)) > 0
 
     results = []
     for example in examples:
-        messages = [json.dumps(d) for d in example["input"]["messages"]]
-        input_messages = tritonclient.http.InferInput(name="messages", shape=(len(messages),), datatype="BYTES")
-        input_messages.set_data_from_numpy(np.array(messages, dtype=object))
-
-        arguments = [json.dumps(d) for d in example["input"]["arguments"]]
-        input_arguments = tritonclient.http.InferInput(name="arguments", shape=(len(arguments),), datatype="BYTES")
-        input_arguments.set_data_from_numpy(np.array(arguments, dtype=object))
-
+        input_messages, input_arguments = create_inputs(example, batching)
         output_results = tritonclient.http.InferRequestedOutput(name="results", binary_data=True)
         infer_results = triton_client.infer(model_name=model_name,
                                             model_version=model_version,
                                             inputs=[input_messages, input_arguments],
                                             outputs=[output_results])
-        result = [json.loads(d.decode("utf-8")) for d in infer_results.as_numpy("results").tolist()]
+        result = [json.loads(d.decode("utf-8")) for d in infer_results.as_numpy("results").reshape(-1).tolist()]
         results.append(result)
 
     return results
 
 
+async def load_generate(examples, model_endpoint, model_name, model_version, timeout, concurrency, qps, arrivals,
+                        warmup_seconds, duration_seconds, seed=None):
+    async def drive(send):
+        return await run_load(send, examples, concurrency, qps, arrivals, warmup_seconds, duration_seconds, seed)
+
+    return await drive_generate(model_endpoint, model_name, model_version, timeout, drive)
+
+
+async def drive_generate(model_endpoint, model_name, model_version, timeout, drive):
+    # `drive` gets a coroutine function that sends one example, and decides
+    # when to send which.
+    import tritonclient.http.aio
+
+    triton_client = tritonclient.http.aio.InferenceServerClient(url=model_endpoint, conn_timeout=timeout, verbose=False)
+    model_config = await triton_client.get_model_config(model_name=model_name, model_version=model_version)
+    batching = int(model_config.get('max_batch_size', 0)) > 0
+    warn_response_cache(model_config)
+
+    async def send(example):
+        output_results = tritonclient.http.InferRequestedOutput(name="results", binary_data=True)
+        infer_results = await triton_client.infer(model_name=model_name,
+                                                  model_version=model_version,
+                                                  inputs=list(create_inputs(example, batching)),
+                                                  outputs=[output_results])
+        num_results = infer_results.as_numpy("results").size
+        if num_results != len(example["input"]["arguments"]):
+            raise ValueError(f"expected {len(example['input']['arguments'])} results, got {num_results}")
+
+    try:
+        return await drive(send)
+    finally:
+        await triton_client.close()
+
+
+def create_inputs(example, batching):
+    messages = [json.dumps(d) for d in example["input"]["messages"]]
+    messages = np.array(messages, dtype=object)
+    if batching:
+        messages = messages.reshape(1, -1)
+    input_messages = tritonclient.http.InferInput(name="messages", shape=messages.shape, datatype="BYTES")
+    input_messages.set_data_from_numpy(messages)
+
+    arguments = [json.dumps(d) for d in example["input"]["arguments"]]
+    arguments = np.array(arguments, dtype=object)
+    if batching:
+        arguments = arguments.reshape(1, -1)
+    input_arguments = tritonclient.http.InferInput(name="arguments", shape=arguments.shape, datatype="BYTES")
+    input_arguments.set_data_from_numpy(arguments)
+
+    return input_messages, input_arguments
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--task_name', type=str, help='task name')
@@ -52,13 +102,35 @@ def main():
     parser.add_argument('--model_name', type=str, help='modle name')
     parser.add_argument('--model_version', type=str, help='model version')
     parser.add_argument('--timeout', type=float, help='timeout')
+    parser.add_argument('--load', action='store_true', help='whether to load the model with concurrent requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='maximum number of requests in flight')
+    parser.add_argument('--qps', type=float, default=0.0, help='target requests per second, 0 to send back to back')
+    parser.add_argument('--arrivals', type=str, default='poisson', choices=ARRIVALS, help='arrival process at --qps')
+    parser.add_argument('--warmup_seconds', type=float, default=10.0, help='seconds of load before measuring')
+    parser.add_argument('--duration_seconds', type=float, default=60.0, help='seconds of load measured')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the poisson arrivals')
     args = parser.parse_args()
 
     logger.setLevel(logging.INFO)
     with open(args.test_file, "r", encoding="utf-8") as in_file:
         test_examples = json.load(in_file)
 
-    if args.task_name == "generate":
+    stats = None
+    if args.task_name == "generate" and args.load:
+        summary, stats = asyncio.run(load_generate(test_examples,
+                                                   args.model_endpoint,
+                                                   args.model_name,
+                                                   args.model_version,
+                                                   args.timeout,
+                                                   args.concurrency,
+                                                   args.qps,
+                                                   args.arrivals,
+                                                   args.warmup_seconds,
+                                                   args.duration_seconds,
+                                                   args.seed))
+        logger.info(f"load summary: {json.dumps(summary)}")
+        results = [summary]
+    elif args.task_name == "generate":
         results = test_generate(test_examples,
                                 args.model_endpoint,
                                 args.model_name,
@@ -75,6 +147,13 @@ def main():
             line = json.dumps(d)
             out_file.write(f"{line}\n")
 
+    if stats is not None:
+        stats_file = os.path.join(args.output_dir, "test_stats.json")
+        with open(stats_file, "w", encoding="utf-8") as out_file:
+            for d in stats:
+                line = json.dumps(d)
+                out_file.write(f"{line}\n")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import os
+import logging
+
+from datetime import datetime
+from pathlib import Path
+from load_generator import run_schedule, summarize, summarize_segments
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(timestamp):
+    # epoch seconds, or an ISO 8601 date and time
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+
+
+def read_trace(trace_file, start_seconds=0.0, end_seconds=None):
+    """(offset in seconds, example) pairs of a trace of JSON lines, ordered by arrival.
+
+    Every line has the arrival `timestamp` of a request and its `messages`
+    and `arguments`, at the top level or under `input` as in the test files.
+    Offsets are counted from the first arrival of the trace, and only the
+    arrivals from `start_seconds` until `end_seconds` are kept, offset from
+    `start_seconds`.
+    """
+    entries = []
+    with open(trace_file, 'r', encoding='utf-8') as in_file:
+        for k, line in enumerate(in_file):
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            inputs = d.get("input", d)
+            example = {
+                "id": d.get("id", f"trace-{k}"),
+                "input": {"messages": inputs["messages"], "arguments": inputs["arguments"]},
+            }
+            entries.append((parse_timestamp(d["timestamp"]), example))
+    if not entries:
+        return []
+
+    entries.sort(key=lambda entry: entry[0])
+    first_arrival = entries[0][0]
+    trace = []
+    for timestamp, example in entries:
+        offset = timestamp - first_arrival
+        if offset >= start_seconds and (end_seconds is None or offset < end_seconds):
+            trace.append((offset - start_seconds, example))
+    return trace
+
+
+async def replay_trace(drive_generate, trace, speed, concurrency, segment_seconds, model_endpoint, model_name,
+                       model_version, timeout):
+    # Arrivals keep the gaps of the trace, divided by `speed`, and every
+    # segment of the trace is summarized on its own, so a burst shows up in
+    # the segments it hit.
+    schedule = [(offset / speed, example) for offset, example in trace]
+
+    async def drive(send):
+        return await run_schedule(send, schedule, concurrency)
+
+    records = await drive_generate(model_endpoint, model_name, model_version, timeout, drive)
+    for record in records:
+        record["trace_offset"] = record["offset"] * speed
+    end_seconds = trace[-1][0] + 1e-6 if trace else 0.0
+    summary = summarize(records, 0.0, end_seconds / speed)
+    summary["speed"] = speed
+    summary["segments"] = summarize_segments(records, segment_seconds, end_seconds, speed)
+    return summary, records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trace_file', type=str, help='trace file of timestamped requests')
+    parser.add_argument('--output_dir', type=str, help='output directory')
+    parser.add_argument('--protocol', type=str, default='grpc', choices=['grpc', 'http'], help='protocol')
+    parser.add_argument('--model_endpoint', type=str, help='model endpoint')
+    parser.add_argument('--model_name', type=str, help='modle name')
+    parser.add_argument('--model_version', type=str, help='model version')
+    parser.add_argument('--timeout', type=float, help='timeout')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 2.0 halves every gap of the trace')
+    parser.add_argument('--start_seconds', type=float, default=0.0, help='trace time to start replaying from')
+    parser.add_argument('--end_seconds', type=float, default=None, help='trace time to stop replaying at')
+    parser.add_argument('--segment_seconds', type=float, default=60.0, help='trace seconds summarized together')
+    parser.add_argument('--concurrency', type=int, default=1024, help='maximum number of requests in flight')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    if args.protocol == 'grpc':
+        from run_grpc import drive_generate
+    else:
+        from run_http import drive_generate
+
+    trace = read_trace(args.trace_file, args.start_seconds, args.end_seconds)
+    if not trace:
+        raise ValueError(f"no requests to replay in {args.trace_file}")
+    logger.info(f'replay {len(trace)} requests over {trace[-1][0]:.1f}s of trace at {args.speed}x speed')
+    summary, records = asyncio.run(replay_trace(drive_generate,
+                                                trace,
+                                                args.speed,
+                                                args.concurrency,
+                                                args.segment_seconds,
+                                                args.model_endpoint,
+                                                args.model_name,
+                                                args.model_version,
+                                                args.timeout))
+    for segment in summary["segments"]:
+        logger.info(f"segment: {json.dumps(segment)}")
+    logger.info(f"replay summary: {json.dumps({k: v for k, v in summary.items() if k != 'segments'})}")
+
+    logger.info(f'save results to {args.output_dir}')
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(args.output_dir, "test_results.json")
+    with open(output_file, "w", encoding="utf-8") as out_file:
+        out_file.write(f"{json.dumps(summary)}\n")
+    stats_file = os.path.join(args.output_dir, "test_stats.json")
+    with open(stats_file, "w", encoding="utf-8") as out_file:
+        for d in records:
+            line = json.dumps(d)
+            out_file.write(f"{line}\n")
+
+
+if __name__ == "__main__":
+    main()
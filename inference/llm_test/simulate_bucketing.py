@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import logging
+import random
+import sys
+
+import numpy as np
+
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../llm/common'))
+
+from bucketing import LengthBucketScheduler  # noqa: E402
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def create_requests(num_requests, qps, prompt_mean, prompt_sigma, max_tokens_choices, lengths_file, seed):
+    rng = random.Random(seed)
+    lengths = None
+    if lengths_file:
+        with open(lengths_file, "r", encoding="utf-8") as in_file:
+            lengths = [json.loads(line) for line in in_file if line.strip()]
+
+    requests, arrival_time = [], 0.0
+    for k in range(num_requests):
+        arrival_time += rng.expovariate(qps)
+        if lengths:
+            d = lengths[k % len(lengths)]
+            prompt_length, max_tokens = d["prompt_length"], d["max_tokens"]
+        else:
+            prompt_length = max(1, int(rng.lognormvariate(prompt_mean, prompt_sigma)))
+            max_tokens = rng.choice(max_tokens_choices)
+        # sequences usually stop at EOS before reaching `max_tokens`
+        output_length = rng.randint(max(1, max_tokens // 4), max_tokens)
+        requests.append({
+            "arrival_time": arrival_time,
+            "prompt_length": prompt_length,
+            "max_tokens": max_tokens,
+            "output_length": output_length,
+        })
+    return requests
+
+
+def simulate(requests, scheduler, prefill_tokens_per_second, decode_step_seconds, decode_row_seconds):
+    # A single model instance decodes one padded batch at a time: the batch
+    # prefills its padded prompts, then steps until its longest sequence is done.
+    now, k = 0.0, 0
+    real_tokens, padded_tokens, generated_tokens = 0, 0, 0
+    latencies = []
+    while k < len(requests) or len(scheduler) > 0:
+        if len(scheduler) == 0 and requests[k]["arrival_time"] > now:
+            now = requests[k]["arrival_time"]
+        while k < len(requests) and requests[k]["arrival_time"] <= now:
+            r = requests[k]
+            scheduler.add(r, r["prompt_length"], r["max_tokens"], now=r["arrival_time"])
+            k += 1
+
+        batch = scheduler.next_batch(now=now)
+        prompt_length = max(r["prompt_length"] for r in batch)
+        steps = max(r["output_length"] for r in batch)
+        now += len(batch) * prompt_length / prefill_tokens_per_second
+        now += steps * (decode_step_seconds + len(batch) * decode_row_seconds)
+
+        padded_tokens += len(batch) * (prompt_length + steps)
+        real_tokens += sum(r["prompt_length"] + r["output_length"] for r in batch)
+        generated_tokens += sum(r["output_length"] for r in batch)
+        latencies.extend(now - r["arrival_time"] for r in batch)
+
+    return {
+        "padding_ratio": 1.0 - real_tokens / padded_tokens,
+        "tokens_per_second": generated_tokens / now,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p95": float(np.percentile(latencies, 95)),
+        "latency_p99": float(np.percentile(latencies, 99)),
+        "makespan": now,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_dir', type=str, help='output directory')
+    parser.add_argument('--num_requests', type=int, default=2000, help='number of requests')
+    parser.add_argument('--qps', type=float, default=0.5, help='mean arrival rate of requests')
+    parser.add_argument('--prompt_mean', type=float, default=5.0, help='mean of the log prompt length')
+    parser.add_argument('--prompt_sigma', type=float, default=1.2, help='sigma of the log prompt length')
+    parser.add_argument('--max_tokens', type=str, default='16,64,256', help='comma separated max_tokens choices')
+    parser.add_argument('--lengths_file', type=str, default=None, help='jsonl file of prompt_length and max_tokens')
+    parser.add_argument('--max_batch_size', type=int, default=8, help='maximum batch size')
+    parser.add_argument('--token_budget', type=int, default=16384, help='maximum padded tokens of a batch')
+    parser.add_argument('--max_wait_ms', type=int, default=1000, help='bounded wait of a request in milliseconds')
+    parser.add_argument('--prefill_tokens_per_second', type=float, default=2000.0, help='prefill throughput')
+    parser.add_argument('--decode_step_seconds', type=float, default=0.02, help='fixed cost of a decode step')
+    parser.add_argument('--decode_row_seconds', type=float, default=0.004, help='cost of a decode step per sequence')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    requests = create_requests(args.num_requests, args.qps, args.prompt_mean, args.prompt_sigma,
+                               [int(n) for n in args.max_tokens.split(',')], args.lengths_file, args.seed)
+
+    schedulers = {
+        # a single bucket batches requests in arrival order
+        "fifo": LengthBucketScheduler(args.max_batch_size, args.token_budget, args.max_wait_ms / 1000,
+                                      prompt_boundaries=(float('inf'),), max_tokens_boundaries=(float('inf'),)),
+        "bucketing": LengthBucketScheduler(args.max_batch_size, args.token_budget, args.max_wait_ms / 1000),
+    }
+    stats = []
+    for name, scheduler in schedulers.items():
+        stat = dict(policy=name, **simulate(requests, scheduler, args.prefill_tokens_per_second,
+                                            args.decode_step_seconds, args.decode_row_seconds))
+        logger.info(stat)
+        stats.append(stat)
+
+    logger.info(f'save stats to {args.output_dir}')
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(args.output_dir, "bucketing_stats.json")
+    with open(output_file, "w", encoding="utf-8") as out_file:
+        for d in stats:
+            line = json.dumps(d)
+            out_file.write(f"{line}\n")
+
+
+if __name__ == "__main__":
+    main()
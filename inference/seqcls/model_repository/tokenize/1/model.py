@@ -3,6 +3,7 @@ import json
 import numpy as np
 import triton_python_backend_utils as pd_utils
 from tokenizer import Tokenizer
+from warmup import read_warmup_texts, run_warmup_texts
 
 
 class TritonPythonModel:
@@ -27,6 +28,7 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
         config_file = os.path.join(args['model_repository'], args['model_version'], 'tokenizer_config.json')
         with open(config_file, 'r', encoding='utf-8') as in_file:
             self.tokenizer_config = json.load(in_file)
@@ -36,6 +38,8 @@ class TritonPythonModel:
             self.tokenizer.enable_truncation(self.tokenizer_config["max_length"])
         if self.tokenizer_config["enable_padding"]:
             self.tokenizer.enable_padding()
+        # the `warmup_texts` of config.pbtxt go through the tokenizer
+        run_warmup_texts(read_warmup_texts(self.model_config), self.tokenizer.encode_batch)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -70,7 +74,7 @@ class TritonPythonModel:
                 pd_utils.Tensor('input_ids', input_ids),
                 pd_utils.Tensor('attention_mask', attention_mask)
             ]
-            if self.tokenizer_config["output_type_id"]:
+            if self.tokenizer_config["output_type_ids"]:
                 token_type_ids = np.asarray([d.type_ids for d in outputs])
                 output_tensors.append(pd_utils.Tensor('token_type_ids', token_type_ids))
             response = pd_utils.InferenceResponse(output_tensors=output_tensors)
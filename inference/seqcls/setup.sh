@@ -69,26 +69,28 @@ cp -r ../model_repository ./build/model_repository
 cp -r ./model/$MODEL_ARTIFACT_PATH/model.onnx ./build/model_repository/predict-onnx/1/
 cp -r ./model/$MODEL_ARTIFACT_PATH/labels.txt ./build/model_repository/postproc/1/
 cp -r ./model/$MODEL_ARTIFACT_PATH/labels.txt ./build/model_repository/taxonomy/1/
+cp -r ../../llm/common/warmup.py ./build/model_repository/tokenize/1/
 
-python update_template.py \
+python ../update_template.py \
 --input_file ./build/model_repository/predict-onnx/config.pbtxt.tmpl \
---outputp_file ./build/model_repository/predict-onnx/config.pbtxt \
---num_labels $MODEL_NUM_LABELS
+--output_file ./build/model_repository/predict-onnx/config.pbtxt \
+--num_labels $MODEL_NUM_LABELS \
+--max_length $TOKENIZER_MAX_LENGTH
 rm ./build/model_repository/predict-onnx/config.pbtxt.tmpl
 
-python update_template.py \
+python ../update_template.py \
 --input_file ./build/model_repository/postproc/config.pbtxt.tmpl \
---outputp_file ./build/model_repository/postproc/config.pbtxt \
+--output_file ./build/model_repository/postproc/config.pbtxt \
 --num_labels $MODEL_NUM_LABELS
 rm ./build/model_repository/postproc/config.pbtxt.tmpl
 
-python update_template.py \
---input_file ./build/model_repository/tokenize/tokenizer_config.json.tmpl \
---outputp_file ./build/model_repository/tokenize/tokenizer_config.json \
+python ../update_template.py \
+--input_file ./build/model_repository/tokenize/1/tokenizer_config.json.tmpl \
+--output_file ./build/model_repository/tokenize/1/tokenizer_config.json \
 --model $TOKENIZER_NAME \
 --max_length $TOKENIZER_MAX_LENGTH \
 --output_type_ids $TOKENIZER_OUTPUT_TYPE_IDS
-rm ./build/model_repository/tokenize/tokenizer_config.json.tmpl
+rm ./build/model_repository/tokenize/1/tokenizer_config.json.tmpl
 
 cd ./build
 docker build -t custom_image:latest .
@@ -98,7 +100,16 @@ docker run --rm -d --shm-size 1g \
   -p8000:8000 -p8001:8001 -p8002:8002 \
   custom_image:latest \
   tritonserver --model-repository=/model_repository
-sleep 20
+# models run their warmup while loading, so the server is only ready after it
+SECONDS=0
+until curl -sf -o /dev/null localhost:8000/v2/health/ready; do
+  if [ $SECONDS -ge 900 ]; then
+    echo "server not ready after $SECONDS seconds"
+    exit 1
+  fi
+  sleep 5
+done
+echo "server ready after $SECONDS seconds"
 curl -v localhost:8000/v2/health/ready
 
 az account set --subscription $MODEL_SUBSCRIPTION_ID
@@ -3,7 +3,7 @@ import logging
 from string import Template
 
 logging.basicConfig(format="%(levelname)s: %(asctime)s %(message)s",
-                    datefmt="%m/%d/%Y %I:%M:$S %p",
+                    datefmt="%m/%d/%Y %I:%M:%S %p",
                     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -15,7 +15,7 @@ def main():
     parser.add_argument("--num_labels", type=int, help="number of labels", required=False)
     parser.add_argument("--model", type=str, help="model", required=False)
     parser.add_argument("--max_length", type=int, help="max length", required=False)
-    parser.add_argument("--output_type_ids", type=bool, help="whether to output type ids or not", required=False)
+    parser.add_argument("--output_type_ids", type=str, help="whether to output type ids, true or false", required=False)
     args = parser.parse_args()
 
     logger.setLevel(logging.INFO)
@@ -24,14 +24,14 @@ def main():
         tmpl = in_file.read()
 
     replaces = {}
-    if args.num_labes:
+    if args.num_labels:
         replaces["num_labels"] = args.num_labels
     if args.model:
         replaces["model"] = args.model
     if args.max_length:
         replaces["max_length"] = args.max_length
     if args.output_type_ids:
-        replaces["output_type_ids"] = str(args.output_type_ids).lower()
+        replaces["output_type_ids"] = "false" if args.output_type_ids == "false" else "true"
 
     t = Template(tmpl)
     res = t.substitute(replaces)
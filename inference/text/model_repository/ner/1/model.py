@@ -3,6 +3,7 @@ import numpy as np
 import triton_python_backend_utils as pd_utils
 
 import spacy
+from warmup import read_warmup_texts, run_warmup_texts
 
 
 class TritonPythonModel:
@@ -27,7 +28,10 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
         self.engine = spacy.load("en_core_web_lg")
+        # the `warmup_texts` of config.pbtxt go through the entity extraction
+        run_warmup_texts(read_warmup_texts(self.model_config), self._extract)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -54,16 +58,7 @@ class TritonPythonModel:
         # and create a pb_utils.InferenceResponse for each of them.
         for request in requests:
             texts = pd_utils.get_input_tensor_by_name(request, 'text').as_numpy().tolist()
-            output_results = []
-            for text in texts:
-                doc = self.engine(text.decode("utf-8"))
-                ents = [{
-                    "text": ent.text,
-                    "label": ent.label_,
-                    "start": ent.start_char,
-                    "end": ent.end_char
-                } for ent in doc.ents]
-                output_results.append(json.dumps(ents))
+            output_results = self._extract([text.decode("utf-8") for text in texts])
 
             output_tensors = [
                 pd_utils.Tensor('results', np.array(output_results, dtype=object))
@@ -72,3 +67,16 @@ class TritonPythonModel:
             responses.append(response)
 
         return responses
+
+    def _extract(self, texts):
+        output_results = []
+        for text in texts:
+            doc = self.engine(text)
+            ents = [{
+                "text": ent.text,
+                "label": ent.label_,
+                "start": ent.start_char,
+                "end": ent.end_char
+            } for ent in doc.ents]
+            output_results.append(json.dumps(ents))
+        return output_results
@@ -1,8 +1,10 @@
+import json
 import numpy as np
 import triton_python_backend_utils as pd_utils
 
 import nltk
 from nltk.tokenize.punkt import PunktSentenceTokenizer
+from warmup import read_warmup_texts, run_warmup_texts
 
 
 class TritonPythonModel:
@@ -27,8 +29,11 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
         nltk.download('punkt')
         self.sent_tokenizer = PunktSentenceTokenizer()
+        # the `warmup_texts` of config.pbtxt go through the sentence splitting
+        run_warmup_texts(read_warmup_texts(self.model_config), self._split)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -56,19 +61,7 @@ class TritonPythonModel:
         for request in requests:
             texts = pd_utils.get_input_tensor_by_name(request, 'text').as_numpy().tolist()
             texts = [t.decode('utf-8') for t in texts]
-            sent_texts, sent_offsets, sent_lengths = [], [], []
-            sent_indices, group_indices = [], []
-            for i, text in enumerate(texts):
-                sents = self.sent_tokenizer.span_tokenize(text)
-                for j, (s, e) in enumerate(sents):
-                    sent = text[s:e]
-                    offset = s
-                    length = len(sent)
-                    sent_texts.append(sent)
-                    sent_offsets.append(offset)
-                    sent_lengths.append(length)
-                    sent_indices.append(j)
-                    group_indices.append(i)
+            sent_texts, sent_offsets, sent_lengths, sent_indices, group_indices = self._split(texts)
 
             output_tensors = [
                 pd_utils.Tensor('text', np.array(sent_texts, dtype=object)),
@@ -81,3 +74,19 @@ class TritonPythonModel:
             responses.append(response)
 
         return responses
+
+    def _split(self, texts):
+        sent_texts, sent_offsets, sent_lengths = [], [], []
+        sent_indices, group_indices = [], []
+        for i, text in enumerate(texts):
+            sents = self.sent_tokenizer.span_tokenize(text)
+            for j, (s, e) in enumerate(sents):
+                sent = text[s:e]
+                offset = s
+                length = len(sent)
+                sent_texts.append(sent)
+                sent_offsets.append(offset)
+                sent_lengths.append(length)
+                sent_indices.append(j)
+                group_indices.append(i)
+        return sent_texts, sent_offsets, sent_lengths, sent_indices, group_indices
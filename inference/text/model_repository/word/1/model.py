@@ -1,7 +1,9 @@
+import json
 import numpy as np
 import triton_python_backend_utils as pd_utils
 
 from nltk.tokenize import TreebankWordTokenizer
+from warmup import read_warmup_texts, run_warmup_texts
 
 
 class TritonPythonModel:
@@ -26,7 +28,10 @@ class TritonPythonModel:
           * model_name: Model name
         """
 
+        self.model_config = json.loads(args['model_config'])
         self.word_tokenizer = TreebankWordTokenizer()
+        # the `warmup_texts` of config.pbtxt go through the word splitting
+        run_warmup_texts(read_warmup_texts(self.model_config), self._split)
 
     def execute(self, requests):
         """`execute` MUST be implemented in every Python model. `execute`
@@ -54,19 +59,7 @@ class TritonPythonModel:
         for request in requests:
             texts = pd_utils.get_input_tensor_by_name(request, 'text').as_numpy().tolist()
             texts = [t.decode('utf-8') for t in texts]
-            word_texts, word_offsets, word_lengths = [], [], []
-            word_indices, group_indices = [], []
-            for i, text in enumerate(texts):
-                words = self.word_tokenizer.span_tokenize(text)
-                for j, (s, e) in enumerate(words):
-                    word = text[s:e]
-                    offset = s
-                    length = len(word)
-                    word_texts.append(word)
-                    word_offsets.append(offset)
-                    word_lengths.append(length)
-                    word_indices.append(j)
-                    group_indices.append(i)
+            word_texts, word_offsets, word_lengths, word_indices, group_indices = self._split(texts)
 
             output_tensors = [
                 pd_utils.Tensor('text', np.array(word_texts, dtype=object)),
@@ -79,3 +72,19 @@ class TritonPythonModel:
             responses.append(response)
 
         return responses
+
+    def _split(self, texts):
+        word_texts, word_offsets, word_lengths = [], [], []
+        word_indices, group_indices = [], []
+        for i, text in enumerate(texts):
+            words = self.word_tokenizer.span_tokenize(text)
+            for j, (s, e) in enumerate(words):
+                word = text[s:e]
+                offset = s
+                length = len(word)
+                word_texts.append(word)
+                word_offsets.append(offset)
+                word_lengths.append(length)
+                word_indices.append(j)
+                group_indices.append(i)
+        return word_texts, word_offsets, word_lengths, word_indices, group_indices
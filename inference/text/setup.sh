@@ -24,6 +24,9 @@ az acr login --name $IMAGE_REGISTRY_NAME
 mkdir ./build
 cp -r ../model_repository ./build/model_repository
 cp -r ../Dockerfile ./build/Dockerfile
+for MODEL_NAME in ner sent word; do
+  cp -r ../../llm/common/warmup.py ./build/model_repository/$MODEL_NAME/1/
+done
 cd ./build
 docker build -t custom_image:latest .
 cd ..
@@ -32,7 +35,16 @@ docker run --rm -d --shm-size 1g \
   -p8000:8000 -p8001:8001 -p8002:8002 \
   custom_image:latest \
   tritonserver --model-repository=/model_repository
-sleep 20
+# models run their warmup while loading, so the server is only ready after it
+SECONDS=0
+until curl -sf -o /dev/null localhost:8000/v2/health/ready; do
+  if [ $SECONDS -ge 900 ]; then
+    echo "server not ready after $SECONDS seconds"
+    exit 1
+  fi
+  sleep 5
+done
+echo "server ready after $SECONDS seconds"
 curl -v localhost:8000/v2/health/ready
 
 export IMAGE_REPO=$IMAGE_REGISTRY_SERVER/$IMAGE_NAME
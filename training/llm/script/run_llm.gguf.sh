@@ -0,0 +1,87 @@
+#!/bin/sh
+for i in "$@"
+  do
+    case $i in
+      --runid=*)
+      RUNID="${i#*=}"
+      shift
+      ;;
+      --artifact=*)
+      ARTIFACT="${i#*=}"
+      shift
+      ;;
+      --dsname=*)
+      DSNAME="${i#*=}"
+      shift
+      ;;
+      --evalblob=*)
+      EVALBLOB="${i#*=}"
+      shift
+      ;;
+      --evalfile=*)
+      EVALFILE="${i#*=}"
+      shift
+      ;;
+      --quantizations=*)
+      QUANTIZATIONS="${i#*=}"
+      shift
+      ;;
+      --maxppldelta=*)
+      MAXPPLDELTA="${i#*=}"
+      shift
+      ;;
+      --registeredname=*)
+      REGISTEREDNAME="${i#*=}"
+      shift
+      ;;
+    esac
+  done
+
+echo "train run id          = ${RUNID}"
+echo "artifact path         = ${ARTIFACT}"
+echo "datastore name        = ${DSNAME}"
+echo "eval blob path        = ${EVALBLOB}"
+echo "eval file             = ${EVALFILE}"
+echo "quantizations         = ${QUANTIZATIONS}"
+echo "max ppl increase      = ${MAXPPLDELTA}"
+echo "registered name       = ${REGISTEREDNAME}"
+
+mkdir -p ./tmp/
+python ./src/download_model.py --run_id ${RUNID} --artifact_path ${ARTIFACT} --local_dir ./tmp/
+mkdir -p ./tmp/model/
+mv ./tmp/${ARTIFACT} ./tmp/model/pytorch/
+ls -l ./tmp/model/pytorch/
+
+python ./src/download_data.py --ds_name=${DSNAME} --blob_path=${EVALBLOB} --local_path ./
+
+mkdir -p ./tmp/data/
+cp ${EVALBLOB} ./tmp/data/${EVALFILE}
+rm ${EVALBLOB}
+ls -l ./tmp/data/
+
+git clone --depth 1 https://github.com/ggerganov/llama.cpp ./tmp/llama.cpp
+pip install -r ./tmp/llama.cpp/requirements/requirements-convert_hf_to_gguf.txt
+cmake -S ./tmp/llama.cpp -B ./tmp/llama.cpp/build
+cmake --build ./tmp/llama.cpp/build --config Release --target llama-quantize
+
+python ./src/convert_gguf.py \
+--model_dir=./tmp/model/pytorch/ \
+--gguf_dir=./tmp/model/gguf/ \
+--llama_cpp_dir=./tmp/llama.cpp \
+--quantizations=${QUANTIZATIONS}
+
+python ./src/eval_gguf.py \
+--gguf_dir=./tmp/model/gguf/ \
+--eval_file=./tmp/data/${EVALFILE} \
+--output_dir=./tmp/result/ \
+--quantizations=${QUANTIZATIONS} \
+--max_perplexity_increase=${MAXPPLDELTA}
+
+if [ -z ${REGISTEREDNAME} ]
+then
+  python ./src/register_model.py --gguf_dir=./tmp/model/gguf --gguf_metrics_file=./tmp/result/gguf_metrics.json
+else
+  python ./src/register_model.py --gguf_dir=./tmp/model/gguf --gguf_metrics_file=./tmp/result/gguf_metrics.json --registered_name=${REGISTEREDNAME}
+fi
+
+python ./src/upload_result.py --result_dir=./tmp/result
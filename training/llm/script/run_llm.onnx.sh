@@ -0,0 +1,88 @@
+#!/bin/sh
+for i in "$@"
+  do
+    case $i in
+      --runid=*)
+      RUNID="${i#*=}"
+      shift
+      ;;
+      --artifact=*)
+      ARTIFACT="${i#*=}"
+      shift
+      ;;
+      --dsname=*)
+      DSNAME="${i#*=}"
+      shift
+      ;;
+      --evalblob=*)
+      EVALBLOB="${i#*=}"
+      shift
+      ;;
+      --evalfile=*)
+      EVALFILE="${i#*=}"
+      shift
+      ;;
+      --precisions=*)
+      PRECISIONS="${i#*=}"
+      shift
+      ;;
+      --numprompts=*)
+      NUMPROMPTS="${i#*=}"
+      shift
+      ;;
+      --registeredname=*)
+      REGISTEREDNAME="${i#*=}"
+      shift
+      ;;
+    esac
+  done
+
+echo "train run id          = ${RUNID}"
+echo "artifact path         = ${ARTIFACT}"
+echo "datastore name        = ${DSNAME}"
+echo "eval blob path        = ${EVALBLOB}"
+echo "eval file             = ${EVALFILE}"
+echo "precisions            = ${PRECISIONS}"
+echo "num prompts           = ${NUMPROMPTS}"
+echo "registered name       = ${REGISTEREDNAME}"
+
+mkdir -p ./tmp/
+python ./src/download_model.py --run_id ${RUNID} --artifact_path ${ARTIFACT} --local_dir ./tmp/
+mkdir -p ./tmp/model/
+mv ./tmp/${ARTIFACT} ./tmp/model/pytorch/
+ls -l ./tmp/model/pytorch/
+
+python ./src/download_data.py --ds_name=${DSNAME} --blob_path=${EVALBLOB} --local_path ./
+
+mkdir -p ./tmp/data/
+cp ${EVALBLOB} ./tmp/data/${EVALFILE}
+rm ${EVALBLOB}
+ls -l ./tmp/data/
+
+# the same onnxruntime-genai as the onnx serving image, whose GeneratorParams.input_ids and
+# Generator.compute_logits the parity check uses, with the releases its model builder was tested on
+pip install onnxruntime-genai==0.4.0
+pip install onnx==1.16.2 onnxruntime==1.19.2 torch==2.4.1 transformers==4.44.2
+
+python ./src/convert_onnx.py \
+--model_dir=./tmp/model/pytorch/ \
+--onnx_dir=./tmp/model/onnx/ \
+--cache_dir=./tmp/cache/ \
+--precisions=${PRECISIONS}
+
+python ./src/eval_onnx.py \
+--model_dir=./tmp/model/pytorch/ \
+--onnx_dir=./tmp/model/onnx/ \
+--eval_file=./tmp/data/${EVALFILE} \
+--output_dir=./tmp/result/ \
+--precisions=${PRECISIONS} \
+--num_prompts=${NUMPROMPTS}
+
+if [ -z ${REGISTEREDNAME} ]
+then
+  python ./src/register_model.py --onnx_dir=./tmp/model/onnx --onnx_metrics_file=./tmp/result/onnx_metrics.json
+else
+  python ./src/register_model.py --onnx_dir=./tmp/model/onnx --onnx_metrics_file=./tmp/result/onnx_metrics.json --registered_name=${REGISTEREDNAME}
+fi
+
+python ./src/upload_result.py --result_dir=./tmp/result
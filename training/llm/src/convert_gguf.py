@@ -0,0 +1,65 @@
+import argparse
+import os
+import logging
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BASELINE = 'f16'
+QUANTIZATIONS = {
+    'q4_k_m': 'Q4_K_M',
+    'q5_k_m': 'Q5_K_M',
+    'q8_0': 'Q8_0',
+}
+
+
+def gguf_file(gguf_dir, quantization):
+    """Path of the GGUF file of a variant, laid out as the gguf runtime expects it under its artifact path."""
+    return os.path.join(gguf_dir, quantization, 'model.gguf')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_dir', type=str, help='PyTorch model dir')
+    parser.add_argument('--gguf_dir', type=str, help='GGUF model dir')
+    parser.add_argument('--llama_cpp_dir', type=str, help='llama.cpp source dir with a build of llama-quantize')
+    parser.add_argument('--quantizations', type=str, default='q4_k_m,q5_k_m,q8_0', help='Comma separated quantizations')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    quantizations = [q for q in args.quantizations.split(',') if q]
+    for quantization in quantizations:
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"unsupported quantization: {quantization}")
+
+    # Every quantization starts from the same f16 export, which is also the
+    # baseline of the perplexity check.
+    baseline_file = gguf_file(args.gguf_dir, BASELINE)
+    Path(baseline_file).parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f'convert model from {args.model_dir} into GGUF format')
+    start_time = time.perf_counter()
+    subprocess.run([
+        sys.executable, os.path.join(args.llama_cpp_dir, 'convert_hf_to_gguf.py'), args.model_dir,
+        '--outfile', baseline_file,
+        '--outtype', BASELINE,
+    ], check=True)
+    logger.info(f'save GGUF model as {baseline_file} in {time.perf_counter() - start_time:.2f}s')
+
+    quantize = os.path.join(args.llama_cpp_dir, 'build', 'bin', 'llama-quantize')
+    for quantization in quantizations:
+        output_file = gguf_file(args.gguf_dir, quantization)
+        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+        start_time = time.perf_counter()
+        subprocess.run([quantize, baseline_file, output_file, QUANTIZATIONS[quantization]], check=True)
+        logger.info(f'save {quantization} GGUF model as {output_file} in {time.perf_counter() - start_time:.2f}s')
+
+
+if __name__ == "__main__":
+    main()
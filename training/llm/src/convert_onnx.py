@@ -0,0 +1,67 @@
+import argparse
+import os
+import logging
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PRECISIONS = {'int4', 'fp32'}
+
+
+def onnx_model_dir(onnx_dir, precision):
+    """Directory of a variant, laid out as the onnx runtime expects it under its artifact path."""
+    return os.path.join(onnx_dir, precision)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_dir', type=str, help='PyTorch model dir')
+    parser.add_argument('--onnx_dir', type=str, help='ONNX model dir')
+    parser.add_argument('--cache_dir', type=str, default='./tmp/cache', help='Cache dir of the model builder')
+    parser.add_argument('--precisions', type=str, default='int4,fp32', help='Comma separated precisions')
+    parser.add_argument('--int4_block_size', type=int, default=32, help='Block size of int4 weight quantization')
+    parser.add_argument('--int4_accuracy_level', type=int, default=4,
+                        help='Compute type of int4 MatMul on cpu, 4 for int8 activations')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    precisions = [p for p in args.precisions.split(',') if p]
+    for precision in precisions:
+        if precision not in PRECISIONS:
+            raise ValueError(f"unsupported precision: {precision}")
+
+    # The model builder of onnxruntime-genai writes the ONNX graph with its
+    # external weights, `genai_config.json` and the tokenizer files the
+    # onnx runtime loads.
+    for precision in precisions:
+        output_dir = onnx_model_dir(args.onnx_dir, precision)
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        command = [
+            sys.executable, '-m', 'onnxruntime_genai.models.builder',
+            '-i', args.model_dir,
+            '-o', output_dir,
+            '-p', precision,
+            '-e', 'cpu',
+            '-c', args.cache_dir,
+        ]
+        if precision == 'int4':
+            command += [
+                '--extra_options',
+                f'int4_block_size={args.int4_block_size}',
+                f'int4_accuracy_level={args.int4_accuracy_level}',
+            ]
+        logger.info(f'convert model from {args.model_dir} into {precision} ONNX format')
+        start_time = time.perf_counter()
+        subprocess.run(command, check=True)
+        logger.info(f'save {precision} ONNX model as {output_dir} in {time.perf_counter() - start_time:.2f}s')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import os
+import json
+import logging
+import math
+import time
+import numpy as np
+
+from pathlib import Path
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def read_texts(eval_file):
+    """Texts of an eval file of JSON lines, each with a `text` or a list of chat `messages`."""
+    texts = []
+    with open(eval_file, 'r', encoding='utf-8') as in_file:
+        for line in in_file.readlines():
+            if not line.strip():
+                continue
+            d = json.loads(line.strip())
+            if 'messages' in d:
+                texts.append('\n'.join(f"{msg['role']}: {msg['content']}" for msg in d['messages']))
+            else:
+                texts.append(d['text'])
+    return texts
+
+
+def split_chunks(tokens, n_ctx, max_chunks=None):
+    """Split a token stream into full chunks of `n_ctx` tokens, as llama.cpp's perplexity tool does."""
+    num_chunks = len(tokens) // n_ctx
+    if max_chunks:
+        num_chunks = min(num_chunks, max_chunks)
+    return [tokens[i * n_ctx:(i + 1) * n_ctx] for i in range(num_chunks)]
+
+
+def token_nll(logits, targets):
+    """Negative log-likelihood of every target token under the logits of the position before it."""
+    logits = np.asarray(logits, dtype=np.float64)
+    max_logits = logits.max(axis=-1, keepdims=True)
+    log_z = np.log(np.exp(logits - max_logits).sum(axis=-1)) + max_logits[:, 0]
+    return log_z - logits[np.arange(len(targets)), targets]
+
+
+def check_perplexity(perplexity, baseline, max_increase):
+    """Whether a quantized variant is within `max_increase` of the relative perplexity of the baseline."""
+    if not math.isfinite(perplexity):
+        return False
+    return perplexity <= baseline * (1.0 + max_increase)
+
+
+def evaluate(model_file, tokens, args):
+    from llama_cpp import Llama
+
+    stats = {'file_size_bytes': os.path.getsize(model_file)}
+
+    # Load time and throughput are measured as the gguf runtime loads and
+    # runs the model, without the logits of every position.
+    start_time = time.perf_counter()
+    model = Llama(model_path=model_file, n_ctx=args.n_ctx, n_threads=args.n_threads or None,
+                  n_gpu_layers=args.n_gpu_layers, verbose=False)
+    stats['load_seconds'] = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    output = model.create_completion(args.prompt, max_tokens=args.max_tokens, temperature=0.0)
+    stats['tokens_per_second'] = output['usage']['completion_tokens'] / (time.perf_counter() - start_time)
+    del model
+
+    # The first half of every chunk is only context, so every scored token
+    # sees at least half a window before it.
+    model = Llama(model_path=model_file, n_ctx=args.n_ctx, n_threads=args.n_threads or None,
+                  n_gpu_layers=args.n_gpu_layers, logits_all=True, verbose=False)
+    nll, count = 0.0, 0
+    first = args.n_ctx // 2
+    for chunk in split_chunks(tokens, args.n_ctx, args.max_chunks):
+        model.reset()
+        model.eval(chunk)
+        logits = model.scores[first - 1:len(chunk) - 1]
+        losses = token_nll(logits, chunk[first:])
+        nll += float(losses.sum())
+        count += len(losses)
+    if count == 0:
+        raise ValueError(f"eval file has fewer than {args.n_ctx} tokens")
+    stats['perplexity'] = math.exp(nll / count)
+    del model
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gguf_dir', type=str, help='GGUF model dir')
+    parser.add_argument('--eval_file', type=str, help='Evaluation file')
+    parser.add_argument('--output_dir', type=str, help='Output dir')
+    parser.add_argument('--quantizations', type=str, default='q4_k_m,q5_k_m,q8_0', help='Comma separated quantizations')
+    parser.add_argument('--n_ctx', type=int, default=512, help='Context length of every perplexity chunk')
+    parser.add_argument('--max_chunks', type=int, default=64, help='Maximum number of perplexity chunks')
+    parser.add_argument('--max_perplexity_increase', type=float, default=0.2,
+                        help='Maximum relative perplexity increase over the f16 baseline')
+    parser.add_argument('--n_threads', type=int, default=0, help='Number of cpu threads, 0 for the default')
+    parser.add_argument('--n_gpu_layers', type=int, default=0, help='Number of layers offloaded to the gpu')
+    parser.add_argument('--prompt', type=str, default='Summarize the benefits of regular exercise.', help='Prompt')
+    parser.add_argument('--max_tokens', type=int, default=128, help='Number of tokens to generate')
+    args = parser.parse_args()
+
+    from azureml.core import Run
+    from llama_cpp import Llama
+    from convert_gguf import BASELINE, gguf_file
+
+    logger.setLevel(logging.INFO)
+    baseline_file = gguf_file(args.gguf_dir, BASELINE)
+    tokenizer = Llama(model_path=baseline_file, vocab_only=True, verbose=False)
+    tokens = []
+    for text in read_texts(args.eval_file):
+        tokens.extend(tokenizer.tokenize(text.encode('utf-8')))
+    logger.info(f'evaluate GGUF models on {len(tokens)} tokens of {args.eval_file}')
+
+    run = Run.get_context()
+    results = {}
+    for quantization in [BASELINE] + [q for q in args.quantizations.split(',') if q]:
+        stats = evaluate(gguf_file(args.gguf_dir, quantization), tokens, args)
+        if quantization != BASELINE:
+            stats['passed'] = check_perplexity(stats['perplexity'], results[BASELINE]['perplexity'],
+                                               args.max_perplexity_increase)
+            if not stats['passed']:
+                logger.warning(f'{quantization} GGUF model fails the perplexity check: {stats["perplexity"]:.4f}')
+        logger.info(f'{quantization} GGUF model stats: {json.dumps(stats)}')
+        for k, v in stats.items():
+            if k != 'passed':
+                run.log(f'gguf_{quantization}_{k}', v)
+        results[quantization] = stats
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(args.output_dir, 'gguf_metrics.json')
+    logger.info(f'save GGUF metrics to {output_file}')
+    with open(output_file, 'w', encoding='utf-8') as out_file:
+        json.dump(results, out_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import os
+import json
+import logging
+import time
+import numpy as np
+
+from pathlib import Path
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def read_prompts(eval_file, num_prompts):
+    """Chat prompts of an eval file of JSON lines, without the assistant turn they end with."""
+    prompts = []
+    with open(eval_file, 'r', encoding='utf-8') as in_file:
+        for line in in_file.readlines():
+            if len(prompts) >= num_prompts:
+                break
+            if not line.strip():
+                continue
+            d = json.loads(line.strip())
+            if 'messages' in d:
+                messages = d['messages']
+                if messages and messages[-1]['role'] == 'assistant':
+                    messages = messages[:-1]
+            else:
+                messages = [{'role': 'user', 'content': d['text']}]
+            if messages:
+                prompts.append(messages)
+    return prompts
+
+
+def token_match(reference_ids, output_ids):
+    """Fraction of the reference tokens reproduced before the first divergence."""
+    if not reference_ids:
+        return 1.0 if not output_ids else 0.0
+    matched = 0
+    for reference_id, output_id in zip(reference_ids, output_ids):
+        if reference_id != output_id:
+            break
+        matched += 1
+    return matched / len(reference_ids)
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def generate_reference(model_dir, prompt_ids, max_tokens):
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(model_dir, torch_dtype=torch.float32, trust_remote_code=True)
+    model.eval()
+    outputs, elapsed, num_tokens = [], 0.0, 0
+    with torch.no_grad():
+        for ids in prompt_ids:
+            start_time = time.perf_counter()
+            output_ids = model.generate(torch.tensor([ids]), max_new_tokens=max_tokens, do_sample=False)
+            elapsed += time.perf_counter() - start_time
+            output_ids = output_ids[0][len(ids):].tolist()
+            if model.generation_config.eos_token_id is not None:
+                eos_token_ids = model.generation_config.eos_token_id
+                eos_token_ids = eos_token_ids if isinstance(eos_token_ids, list) else [eos_token_ids]
+                for i, token in enumerate(output_ids):
+                    if token in eos_token_ids:
+                        output_ids = output_ids[:i]
+                        break
+            outputs.append(output_ids)
+            num_tokens += len(output_ids)
+    return outputs, {'tokens_per_second': num_tokens / elapsed if elapsed > 0 else None}
+
+
+def generate_onnx(model_dir, prompt_ids, max_tokens):
+    import onnxruntime_genai as og
+
+    start_time = time.perf_counter()
+    model = og.Model(model_dir)
+    stats = {'load_seconds': time.perf_counter() - start_time, 'file_size_bytes': directory_bytes(model_dir)}
+    with open(os.path.join(model_dir, 'genai_config.json'), 'r', encoding='utf-8') as in_file:
+        eos_token_ids = json.load(in_file)['model']['eos_token_id']
+    eos_token_ids = eos_token_ids if isinstance(eos_token_ids, list) else [eos_token_ids]
+
+    # Greedy decoding one token per step, the way the onnx runtime decodes
+    # a batch of one.
+    outputs, ttfts, elapsed, num_tokens = [], [], 0.0, 0
+    for ids in prompt_ids:
+        params = og.GeneratorParams(model)
+        params.set_search_options(do_sample=False, max_length=len(ids) + max_tokens)
+        params.input_ids = np.array([ids], dtype=np.int32)
+        start_time = time.perf_counter()
+        generator = og.Generator(model, params)
+        output_ids, first_token_time = [], None
+        while not generator.is_done():
+            generator.compute_logits()
+            generator.generate_next_token()
+            first_token_time = first_token_time or time.perf_counter()
+            token = int(generator.get_next_tokens()[0])
+            if token in eos_token_ids:
+                break
+            output_ids.append(token)
+        elapsed += time.perf_counter() - start_time
+        if first_token_time is not None:
+            ttfts.append(first_token_time - start_time)
+        outputs.append(output_ids)
+        num_tokens += len(output_ids)
+    stats['ttft_seconds'] = sum(ttfts) / len(ttfts) if ttfts else None
+    stats['tokens_per_second'] = num_tokens / elapsed if elapsed > 0 else None
+    del model
+    return outputs, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_dir', type=str, help='PyTorch model dir')
+    parser.add_argument('--onnx_dir', type=str, help='ONNX model dir')
+    parser.add_argument('--eval_file', type=str, help='Evaluation file')
+    parser.add_argument('--output_dir', type=str, help='Output dir')
+    parser.add_argument('--precisions', type=str, default='int4,fp32', help='Comma separated precisions')
+    parser.add_argument('--num_prompts', type=int, default=16, help='Number of sample prompts')
+    parser.add_argument('--max_tokens', type=int, default=64, help='Number of tokens to generate')
+    parser.add_argument('--min_token_match_fp32', type=float, default=0.9,
+                        help='Minimum mean token match of the fp32 model against pytorch')
+    parser.add_argument('--min_token_match_int4', type=float, default=0.3,
+                        help='Minimum mean token match of the int4 model against pytorch')
+    args = parser.parse_args()
+
+    from azureml.core import Run
+    from transformers import AutoTokenizer
+    from convert_onnx import onnx_model_dir
+
+    logger.setLevel(logging.INFO)
+    # Every model gets the same prompt ids, so the parity check compares
+    # the models and not their tokenizers.
+    tokenizer = AutoTokenizer.from_pretrained(args.model_dir)
+    prompt_ids = [
+        tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+        for messages in read_prompts(args.eval_file, args.num_prompts)
+    ]
+    logger.info(f'check parity of ONNX models on {len(prompt_ids)} prompts of {args.eval_file}')
+    reference_ids, reference_stats = generate_reference(args.model_dir, prompt_ids, args.max_tokens)
+    logger.info(f'pytorch model stats: {json.dumps(reference_stats)}')
+
+    run = Run.get_context()
+    results = {'pytorch': reference_stats}
+    thresholds = {'fp32': args.min_token_match_fp32, 'int4': args.min_token_match_int4}
+    for precision in [p for p in args.precisions.split(',') if p]:
+        output_ids, stats = generate_onnx(onnx_model_dir(args.onnx_dir, precision), prompt_ids, args.max_tokens)
+        matches = [token_match(r, o) for r, o in zip(reference_ids, output_ids)]
+        stats['token_match'] = sum(matches) / len(matches)
+        stats['exact_match'] = sum(r == o for r, o in zip(reference_ids, output_ids)) / len(matches)
+        stats['passed'] = stats['token_match'] >= thresholds[precision]
+        if not stats['passed']:
+            logger.warning(f'{precision} ONNX model fails the parity check: {stats["token_match"]:.4f}')
+        logger.info(f'{precision} ONNX model stats: {json.dumps(stats)}')
+        for k, v in stats.items():
+            if k != 'passed' and v is not None:
+                run.log(f'onnx_{precision}_{k}', v)
+        results[precision] = stats
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    output_file = os.path.join(args.output_dir, 'onnx_metrics.json')
+    logger.info(f'save ONNX metrics to {output_file}')
+    with open(output_file, 'w', encoding='utf-8') as out_file:
+        json.dump(results, out_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import json
+import logging
+
+from azureml.core import Run
+
+logging.basicConfig(format='%(levelname)s: %(asctime)s %(message)s',
+                    datefmt='%m/%d/%Y %I:%M:%S %p',
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def register_variants(run, model_format, model_dir, metrics_file, registered_name=None):
+    # Every variant that passed its check is registered on its own, with
+    # the files of its directory at the root of its artifact path, the
+    # layout the runtime of the format downloads.
+    with open(metrics_file, 'r', encoding='utf-8') as in_file:
+        metrics = json.load(in_file)
+
+    variants = {}
+    for variant, stats in metrics.items():
+        if not stats.get('passed', False):
+            continue
+        variant_dir = os.path.join(model_dir, variant)
+        logger.info(f'register {variant} {model_format} model {variant_dir}')
+        model_name = f"{registered_name or 'model'}.{model_format}.{variant}"
+        run.upload_folder(model_name, variant_dir)
+        properties = {
+            "metrics": json.dumps(stats),
+            "hparams": json.dumps({"variant": variant}),
+        }
+        variant_properties = {"artifact_path": model_name}
+        if registered_name:
+            model = run.register_model(model_name, model_path=model_name, properties=properties)
+            variant_properties["model_id"] = model.id
+            variant_properties["model_name"] = model.name
+            variant_properties["model_version"] = model.version
+            variant_properties["model_path"] = model_name
+        variants[variant] = variant_properties
+    return variants
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gguf_dir', type=str, help='GGUF model dir', required=False)
+    parser.add_argument('--gguf_metrics_file', type=str, help='GGUF metrics file', required=False)
+    parser.add_argument('--onnx_dir', type=str, help='ONNX model dir', required=False)
+    parser.add_argument('--onnx_metrics_file', type=str, help='ONNX metrics file', required=False)
+    parser.add_argument('--registered_name', type=str, help='Registered model name', required=False)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    run = Run.get_context()
+    properties = {}
+    if args.gguf_dir and os.path.exists(args.gguf_dir):
+        variants = register_variants(run, "gguf", args.gguf_dir, args.gguf_metrics_file, args.registered_name)
+        properties["gguf"] = json.dumps(variants)
+    if args.onnx_dir and os.path.exists(args.onnx_dir):
+        variants = register_variants(run, "onnx", args.onnx_dir, args.onnx_metrics_file, args.registered_name)
+        properties["onnx"] = json.dumps(variants)
+
+    run.add_properties(properties)
+
+
+if __name__ == "__main__":
+    main()
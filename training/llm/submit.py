@@ -21,6 +21,8 @@ supported_entry_point = {
     "main",
     "llm_train",
     "llm_infer",
+    "llm_gguf",
+    "llm_onnx",
 }
 
 
@@ -104,6 +106,8 @@ def main():
         experiment_output["pytorch"] = json.loads(aml_run_properties["pytorch"])
     if "onnx" in aml_run_properties:
         experiment_output["onnx"] = json.loads(aml_run_properties["onnx"])
+    if "gguf" in aml_run_properties:
+        experiment_output["gguf"] = json.loads(aml_run_properties["gguf"])
 
     logger.info(f"Write output experiment config to: {args.output_file}")
     with open(args.output_file, "w", encoding="utf-8") as out_file:
@@ -0,0 +1,29 @@
+import math
+import pytest
+from training.src.eval_gguf import check_perplexity, split_chunks, token_nll
+
+
+@pytest.mark.parametrize("input, expected", [
+    (([0, 1, 2, 3, 4, 5, 6], 3, None), [[0, 1, 2], [3, 4, 5]]),
+    (([0, 1, 2, 3, 4, 5, 6], 3, 1), [[0, 1, 2]]),
+    (([0, 1], 3, None), []),
+])
+def test_split_chunks(input, expected):
+    assert split_chunks(*input) == expected
+
+
+@pytest.mark.parametrize("input, expected", [
+    (([[0.0, 0.0], [0.0, 0.0]], [0, 1]), [math.log(2), math.log(2)]),
+    (([[1000.0, 0.0]], [0]), [0.0]),
+])
+def test_token_nll(input, expected):
+    assert token_nll(*input).tolist() == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("input, expected", [
+    ((10.5, 10.0, 0.1), True),
+    ((11.5, 10.0, 0.1), False),
+    ((float("nan"), 10.0, 0.1), False),
+])
+def test_check_perplexity(input, expected):
+    assert check_perplexity(*input) == expected
@@ -0,0 +1,14 @@
+import pytest
+from training.src.eval_onnx import token_match
+
+
+@pytest.mark.parametrize("input, expected", [
+    (([1, 2, 3, 4], [1, 2, 3, 4]), 1.0),
+    (([1, 2, 3, 4], [1, 2, 5, 4]), 0.5),
+    (([1, 2, 3, 4], [1, 2]), 0.5),
+    (([1, 2, 3, 4], [5, 2, 3, 4]), 0.0),
+    (([], []), 1.0),
+    (([], [1]), 0.0),
+])
+def test_token_match(input, expected):
+    assert token_match(*input) == expected